@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 
     'captcha', # django-simple-captcha (example)
     'widget_tweaks',
+    'psqlextra', # pgpartition & pgmakemigrations commands
 
     'main',
 ]
@@ -65,7 +66,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'config.urls'
+ROOT_URLCONF = config('ROOT_URLCONF', 'config.urls') # config/asgi.py uses config.urls_asgi
 
 TEMPLATES = [
     {
@@ -103,6 +104,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # shared between the gunicorn workers of the same host
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('SHARED_CACHE_LOCATION', '/tmp/bitcoincash-faucet-cache'),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -194,6 +210,92 @@ WATCHTOWER_BASE_URLS = {
     "mainnet": "https://watchtower.cash/api/",
     "chipnet": "https://chipnet.watchtower.cash/api/"
 }
+# Shared clients, see main/utils/watchtower_api.py:get_watchtower
+WATCHTOWER_POOL_SIZE = config("WATCHTOWER_POOL_SIZE", 20, cast=int) # connections per network in a process
+WATCHTOWER_TIMEOUTS = { # (connect, read) seconds by the first segment of the api path
+    "default": (3.05, 10),
+    "utxo": (3.05, 20),
+    "broadcast": (3.05, 30),
+}
+WATCHTOWER_MAX_RETRIES = config("WATCHTOWER_MAX_RETRIES", 2, cast=int) # only for GET requests
+WATCHTOWER_RETRY_BACKOFF = 0.2 # seconds, doubled on each retry with full jitter
+WATCHTOWER_CIRCUIT_BREAKER_THRESHOLD = 5 # consecutive failures before failing fast
+WATCHTOWER_CIRCUIT_BREAKER_RESET_TIMEOUT = 30 # seconds before trying watchtower again
+WATCHTOWER_STREAM_CHUNK_SIZE = 8192 # bytes read at a time when streaming utxos
+WATCHTOWER_ASYNC_POOL_TIMEOUT = config("WATCHTOWER_ASYNC_POOL_TIMEOUT", 30, cast=float) # seconds an async request waits for a free connection
+
+
+# Node workers running main/js/src/worker.js, see main/js/runner.py
+NODE_WORKER_POOL_SIZE = config("NODE_WORKER_POOL_SIZE", 2, cast=int)
+NODE_WORKER_TIMEOUT = config("NODE_WORKER_TIMEOUT", 30, cast=float)
+NODE_WORKER_HEALTH_CHECK_INTERVAL = config("NODE_WORKER_HEALTH_CHECK_INTERVAL", 60, cast=int)
+
+# Memoized results of pure script functions, set the shared cache to empty to only cache in memory
+SCRIPT_FUNCTIONS_CACHE_SIZE = config("SCRIPT_FUNCTIONS_CACHE_SIZE", 1024, cast=int)
+SCRIPT_FUNCTIONS_SHARED_CACHE = config("SCRIPT_FUNCTIONS_SHARED_CACHE", "shared")
+SCRIPT_FUNCTIONS_SHARED_CACHE_TIMEOUT = None
+
+# Build claim transactions in python, falls back to node for unsupported utxos
+FAUCET_NATIVE_CLAIM_BUILDER = config("FAUCET_NATIVE_CLAIM_BUILDER", True, cast=bool)
+
+# Local utxo set, see main/utils/faucet_utxos.py
+FAUCET_UTXO_RESERVATION_TIMEOUT = 60 # seconds before a reserved utxo can be used by another claim
+FAUCET_UTXO_SYNC_GRACE_PERIOD = 600 # seconds to keep utxos watchtower may not have indexed yet
+FAUCET_CLAIM_CHAIN_TIMEOUT = config("FAUCET_CLAIM_CHAIN_TIMEOUT", 10, cast=float) # max seconds to wait for an in-flight claim's change
+
+# Claim jobs, see main/utils/claim_jobs.py
+CLAIM_JOB_STALE_TIMEOUT = 300 # seconds before a job left processing is failed
+
+# Claimable faucets by passcode for FaucetForm, see main/utils/faucet_index.py
+FAUCET_INDEX_CACHE = config("FAUCET_INDEX_CACHE", "shared") # holds the version stamp, must be shared by the web processes
+
+# Recent claims shown in the claim page, see main/utils/recent_claims.py
+RECENT_CLAIMS_COUNT = 10
+RECENT_CLAIMS_CACHE = config("RECENT_CLAIMS_CACHE", "shared") # must be shared by the web & claim worker processes
+RECENT_CLAIMS_CACHE_TIMEOUT = 60 * 60
+RECENT_CLAIMS_LOCK_TIMEOUT = 5 # seconds, a claim waits this long for concurrent feed updates
+
+# Hourly & daily claim stats, see main/utils/claim_stats.py
+CLAIM_STATS_CACHE_TIMEOUT = config("CLAIM_STATS_CACHE_TIMEOUT", 30, cast=int) # seconds api/stats/claims/ responses are cached
+
+# Balance refreshes from watchtower are coalesced per faucet, see main/utils/faucet_balance.py
+FAUCET_BALANCE_REFRESH_DELAY = config("FAUCET_BALANCE_REFRESH_DELAY", 10, cast=int) # seconds
+
+# Admin actions & faucet_bulk_action command, see main/utils/bulk_actions.py
+BULK_ACTION_MAX_WORKERS = config("BULK_ACTION_MAX_WORKERS", 16, cast=int) # concurrent watchtower calls
+BULK_ACTION_BATCH_SIZE = 500
+
+# Faucet subscriptions outbox, see main/utils/subscriptions.py
+WATCHTOWER_SUBSCRIPTION_BATCH_SIZE = 100
+WATCHTOWER_SUBSCRIPTION_BACKOFF = 10 # seconds before the first retry, doubled on each attempt
+WATCHTOWER_SUBSCRIPTION_MAX_BACKOFF = 60 * 60
+WATCHTOWER_SUBSCRIPTION_LEASE = 5 * 60 # seconds before a batch taken by a dispatcher that died is retried
+
+# Watchtower webhook inbox, see main/utils/webhook_events.py
+WEBHOOK_EVENTS_BATCH_SIZE = 200
+WEBHOOK_EVENTS_RETENTION = 7 * 24 * 60 * 60 # seconds to keep processed events to dedupe replays
+
+# Monthly FaucetClaim partitions, see main/utils/claim_partitions.py
+PSQLEXTRA_PARTITIONING_MANAGER = "main.utils.claim_partitions.manager"
+CLAIM_PARTITIONS_AHEAD = 3 # months of partitions created ahead of the current one
+CLAIM_PARTITIONS_RETENTION = config("CLAIM_PARTITIONS_RETENTION", 12, cast=int) # months of claims kept in the database
+CLAIM_ARCHIVE_DIR = config("CLAIM_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive", "claims"))
+
+# Claims admin, see main/admin.py:FaucetClaimAdmin
+CLAIM_ADMIN_MAX_COUNT = 10000 # filtered lists are counted up to this, the unfiltered list is estimated above it
+CLAIM_EXPORT_CHUNK_SIZE = 2000 # rows fetched at a time by exports, see main/utils/claim_export.py
+
+# Claim rate limits, see main/utils/rate_limit.py
+# "database" works everywhere, "cache" needs a cache shared by every web process, e.g. redis
+CLAIM_RATE_LIMIT_BACKEND = config("CLAIM_RATE_LIMIT_BACKEND", "database")
+CLAIM_RATE_LIMIT_CACHE = config("CLAIM_RATE_LIMIT_CACHE", "default")
+CLAIM_RATE_LIMIT_PER_RECIPIENT = None # (max claims, window seconds), per faucet and recipient address
+CLAIM_RATE_LIMIT_PER_FAUCET = None # (max claims, window seconds), the per ip limit is set in each faucet
+
+# Splitting & consolidating faucet utxos, see main/utils/faucet_utxos.py:plan_faucet_utxos
+FAUCET_FANOUT_UTXO_BUSY_SECONDS = 5 # roughly how long a claim holds a utxo, build + broadcast
+FAUCET_FANOUT_MAX_OUTPUTS = 500
+FAUCET_REDISTRIBUTE_MAX_INPUTS = 300
 
 
 # Cashaddress hack
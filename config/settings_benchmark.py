@@ -0,0 +1,8 @@
+"""
+Settings of the test deployments benchmark_claim_endpoint submits claims to,
+never use these in production
+"""
+from config.settings import *
+
+# accepts "PASSED" as the captcha answer
+CAPTCHA_TEST_MODE = True
@@ -22,7 +22,10 @@ from main import views as main_views
 urlpatterns = [
     path("", main_views.FaucetClaimView.as_view()),
     path("claim/", main_views.FaucetClaimView.as_view()),
+    path("claim/status/<uuid:job_id>/", main_views.ClaimJobStatusView.as_view()),
     path('admin/', admin.site.urls),
     path('captcha/', include('captcha.urls')),
     path('api/watchtower/webhook/', csrf_exempt(main_views.WatchtowerWebhookView.as_view())),
+    path('api/watchtower/stats/', main_views.WatchtowerStatsView.as_view()),
+    path('api/stats/claims/', main_views.ClaimStatsView.as_view()),
 ]
@@ -0,0 +1,21 @@
+"""config URL Configuration for ASGI deployments
+
+Same as config.urls but with the async versions of the claim and webhook views,
+selected with ROOT_URLCONF=config.urls_asgi, see config/asgi.py
+"""
+from django.urls import path
+
+from config.urls import urlpatterns as wsgi_urlpatterns
+from main import views as main_views
+
+async_views = {
+    "": main_views.async_faucet_claim_view,
+    "claim/": main_views.async_faucet_claim_view,
+    "api/watchtower/webhook/": main_views.async_watchtower_webhook_view,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), async_views[str(pattern.pattern)])
+    if str(pattern.pattern) in async_views else pattern
+    for pattern in wsgi_urlpatterns
+]
@@ -1,13 +1,40 @@
+import re
+import ipaddress
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib import messages
+from django.core.paginator import Paginator
+from django.db.models import Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 from django.urls import path
 from django.shortcuts import render, get_object_or_404
 
-from main.models import FaucetContract, FaucetClaim
-from main.forms import FaucetContractForm, SweepFaucetContractForm
+from main.models import (
+    ClaimJob,
+    ClaimStats,
+    FaucetContract,
+    FaucetClaim,
+    FaucetUtxo,
+    WatchtowerSubscription,
+    WebhookEvent,
+)
+from main.forms import FaucetContractForm, SweepFaucetContractForm, RedistributeFaucetContractForm
+
+from main.utils.bulk_actions import subscribe_faucets, update_faucet_balances
+from main.utils.faucet_contract import (
+    compile_objs,
+    redistribute_faucet,
+    sweep_faucet,
+)
+from main.utils.claim_export import EXPORT_FORMATS, get_export_claims
+from main.utils.claim_partitions import estimate_claim_count
+from main.utils.faucet_utxos import sync_faucet_utxos
 
-from main.utils.faucet_contract import sweep_faucet, update_faucet_balance, subscribe_faucet_contract
+TXID_RE = re.compile(r"^[0-9a-fA-F]{64}$")
 
 # Register your models here.
 @admin.register(FaucetContract)
@@ -27,6 +54,16 @@ class FaucetContractAdmin(admin.ModelAdmin):
         "claim_count",
         "max_claim_count",
         "balance_satoshis",
+        "balance_updated_at",
+    ]
+
+    # updated by claims, balance updates & subscriptions, a stale form must never write them back
+    readonly_fields = [
+        "claim_count",
+        "subscribed",
+        "balance_satoshis",
+        "balance_updated_at",
+        "balance_refresh_requested_at",
     ]
 
     list_filter = [
@@ -37,6 +74,8 @@ class FaucetContractAdmin(admin.ModelAdmin):
     actions = [
         "subscribe_to_watchtower",
         "update_balance",
+        "verify_address",
+        "sync_utxos",
     ]
     change_form_template = "admin/faucet_contract/change_form.html"
 
@@ -48,6 +87,11 @@ class FaucetContractAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.sweep_faucet_view),
                 name="faucet_contract_sweep",
             ),
+            path(
+                "<int:contract_id>/redistribute/",
+                self.admin_site.admin_view(self.redistribute_faucet_view),
+                name="faucet_contract_redistribute",
+            ),
         ]
         return custom_urls + urls
 
@@ -74,34 +118,119 @@ class FaucetContractAdmin(admin.ModelAdmin):
             dict(form=form, obj=obj, opts=self.model._meta),
         )
 
-    def subscribe_to_watchtower(self, request, queryset):
-        for obj in queryset:
-            try:
-                success, error = subscribe_faucet_contract(obj)
+    def redistribute_faucet_view(self, request, contract_id, *args, **kwargs):
+        obj = get_object_or_404(FaucetContract, pk=contract_id)
+
+        if request.method == "POST":
+            form = RedistributeFaucetContractForm(request.POST)
+            if form.is_valid():
+                wif = form.cleaned_data["wif"]
+                target_count = form.cleaned_data.get("target_count")
+                success, error_or_txid = redistribute_faucet(obj, wif, target_count=target_count)
                 if success:
-                    obj.subscribed = True
-                    obj.save()
-                    messages.success(request, f"Subscribe {obj} success -> {success}")
+                    messages.success(request, f"Redistributed utxos success: {error_or_txid}")
+                    form = RedistributeFaucetContractForm()
                 else:
-                    raise Exception(error)
-            except Exception as exception:
-                messages.error(request, f"Subscribe {obj} error -> {exception}")
+                    messages.error(request, f"Redistributed utxos error: {error_or_txid}")
+        else:
+            form = RedistributeFaucetContractForm()
+
+        return render(
+            request,
+            "admin/faucet_contract/redistribute.html",
+            dict(form=form, obj=obj, opts=self.model._meta),
+        )
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+
+        # only write the edited fields, other fields may have been updated while the change page was open
+        field_names = {field.name for field in obj._meta.concrete_fields}
+        update_fields = [name for name in form.changed_data if name in field_names]
+        if update_fields:
+            obj.save(update_fields=update_fields)
+
+    def report_bulk_action(self, request, result):
+        level = messages.SUCCESS if not result.failed else messages.WARNING
+        messages.add_message(request, level, result.summary)
+        for obj, error in result.failed:
+            messages.error(request, f"{obj} => {error}")
+
+    def subscribe_to_watchtower(self, request, queryset):
+        self.report_bulk_action(request, subscribe_faucets(list(queryset)))
 
     def update_balance(self, request, queryset):
+        self.report_bulk_action(request, update_faucet_balances(list(queryset)))
+
+    def verify_address(self, request, queryset):
+        objs = list(queryset)
+        results = compile_objs(objs)
+        for obj, (success, compile_data_or_error) in zip(objs, results):
+            if not success:
+                messages.error(request, f"{obj} => {compile_data_or_error}")
+            elif compile_data_or_error["address"] != obj.address:
+                messages.error(request, f"{obj} => Compiled address mismatch: {compile_data_or_error['address']}")
+            else:
+                messages.success(request, f"{obj} => Address verified")
+
+    def sync_utxos(self, request, queryset):
         for obj in queryset:
             try:
-                update_faucet_balance(obj)
+                utxo_count = sync_faucet_utxos(obj)
+                messages.success(request, f"{obj} => {utxo_count} utxo/s")
             except Exception as exception:
                 messages.error(request, f"{obj} => {exception}")
 
 
+@admin.register(FaucetUtxo)
+class FaucetUtxoAdmin(admin.ModelAdmin):
+    search_fields = [
+        "txid",
+        "faucet__address",
+    ]
+
+    list_display = [
+        "__str__",
+        "faucet",
+        "satoshis",
+        "reserved_at",
+        "spent_txid",
+        "created_at",
+    ]
+
+    list_filter = [
+        "faucet__network",
+    ]
+
+    list_select_related = [
+        "faucet",
+    ]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+        Counting millions of claims takes seconds, the unfiltered list uses the planner's estimate
+        and filtered lists stop counting at CLAIM_ADMIN_MAX_COUNT
+    """
+    @cached_property
+    def count(self):
+        max_count = settings.CLAIM_ADMIN_MAX_COUNT
+        if not self.object_list.query.where:
+            estimate = estimate_claim_count(using=self.object_list.db)
+            if estimate > max_count: return estimate
+
+        return self.object_list.values("pk")[:max_count].count()
+
+
 @admin.register(FaucetClaim)
 class FaucetClaimAdmin(admin.ModelAdmin):
+    # see get_search_results, each term is looked up in a single indexed column
     search_fields = [
-        "faucet__address",
         "txid",
         "recipient",
         "ip",
+        "faucet__address",
     ]
 
     list_display = [
@@ -117,3 +246,168 @@ class FaucetClaimAdmin(admin.ModelAdmin):
         "network",
         "created_at",
     ]
+
+    list_select_related = [
+        "faucet",
+    ]
+
+    # same order as the (created_at, id) index
+    ordering = ["-created_at", "-id"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    actions = [
+        "export_csv",
+        "export_jsonl",
+    ]
+
+    def export_claims(self, queryset, export_format:str):
+        """
+            Streams the claims as they are read, select all to export every claim matching the filters
+        """
+        iter_lines, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(iter_lines(get_export_claims(queryset=queryset)), content_type=content_type)
+        filename = f"claims-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def export_csv(self, request, queryset):
+        return self.export_claims(queryset, "csv")
+
+    def export_jsonl(self, request, queryset):
+        return self.export_claims(queryset, "jsonl")
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+            icontains on every search field can't use an index, the term's format picks the column instead
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        if TXID_RE.match(term):
+            return queryset.filter(txid=term.lower()), False
+
+        try:
+            return queryset.filter(ip=str(ipaddress.ip_address(term))), False
+        except ValueError:
+            pass
+
+        if len(term) < 3:
+            messages.warning(request, "Search for at least 3 characters of an address")
+            return queryset.none(), False
+
+        # substrings of addresses use the recipient's trigram index, faucets are few so they're looked up first
+        term = term.lower()
+        faucet_ids = list(FaucetContract.objects.filter(address__contains=term).values_list("id", flat=True)[:100])
+        return queryset.filter(Q(recipient__contains=term) | Q(faucet_id__in=faucet_ids)), False
+
+
+@admin.register(ClaimStats)
+class ClaimStatsAdmin(admin.ModelAdmin):
+    """
+        Claims dashboard, only reads the rollups, see main/utils/claim_stats.py
+    """
+    change_list_template = "admin/claim_stats/change_list.html"
+
+    list_display = [
+        "bucket",
+        "period",
+        "faucet",
+        "claim_count",
+        "satoshis",
+        "unique_ips",
+        "unique_recipients",
+    ]
+
+    list_filter = [
+        "period",
+        "network",
+    ]
+
+    date_hierarchy = "bucket"
+    ordering = ["-bucket"]
+
+    list_select_related = [
+        "faucet",
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context=extra_context)
+        changelist = getattr(response, "context_data", {}).get("cl")
+        if changelist:
+            # each claim is in an hour and a day bucket, totals are per period
+            response.context_data["totals"] = changelist.queryset.order_by("period") \
+                .values("period") \
+                .annotate(claim_count=Sum("claim_count"), satoshis=Sum("satoshis"))
+        return response
+
+
+@admin.register(ClaimJob)
+class ClaimJobAdmin(admin.ModelAdmin):
+    search_fields = [
+        "uuid",
+        "txid",
+        "recipient",
+    ]
+
+    list_display = [
+        "__str__",
+        "recipient",
+        "faucet",
+        "status",
+        "txid",
+        "created_at",
+        "finished_at",
+    ]
+
+    list_filter = [
+        "status",
+        "network",
+    ]
+
+    list_select_related = [
+        "faucet",
+    ]
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    search_fields = [
+        "dedupe_key",
+        "address",
+    ]
+
+    list_display = [
+        "__str__",
+        "address",
+        "created_at",
+        "processed_at",
+        "error",
+    ]
+
+
+@admin.register(WatchtowerSubscription)
+class WatchtowerSubscriptionAdmin(admin.ModelAdmin):
+    search_fields = [
+        "faucet__address",
+    ]
+
+    list_display = [
+        "__str__",
+        "faucet",
+        "attempts",
+        "next_attempt_at",
+        "delivered_at",
+        "last_error",
+    ]
+
+    list_select_related = [
+        "faucet",
+    ]
@@ -8,6 +8,7 @@ from cashaddress import convert
 
 from main.models import FaucetContract, Network
 from main.utils.faucet_contract import compile_contract
+from main.utils.faucet_index import get_faucet_index
 
 class FaucetContractForm(forms.ModelForm):
     address = forms.CharField(
@@ -63,13 +64,16 @@ class FaucetForm(forms.Form):
             self.add_error("address", "Must provide mainnet address")
             return cleaned_data
 
-        faucet_qs = FaucetContract.objects.filter(
-            network=network,
-            claim_count__lt=F("max_claim_count"),
-        )
-        if not faucet_qs:
+        faucet_index = get_faucet_index()
+        if not faucet_index.has_claimable(network):
             raise ValidationError("No claimable faucet")
-        faucet = faucet_qs.filter(passcode=passcode).first()
+
+        faucet_ids = faucet_index.lookup(network, passcode)
+        # the index may be behind by a claim, only the database has the latest claim count
+        faucet = faucet_ids and FaucetContract.objects.filter(
+            pk__in=faucet_ids,
+            claim_count__lt=F("max_claim_count"),
+        ).order_by("pk").first()
         if not faucet:
             raise ValidationError("Invalid passcode for available faucets")
 
@@ -80,3 +84,11 @@ class FaucetForm(forms.Form):
 class SweepFaucetContractForm(forms.Form):
     recipient = forms.CharField(required=False)
     wif = forms.CharField(required=True)
+
+
+class RedistributeFaucetContractForm(forms.Form):
+    wif = forms.CharField(required=True)
+    target_count = forms.IntegerField(
+        required=False, min_value=1,
+        help_text="Number of claimable utxos to split into, leave blank to derive from the claim rate",
+    )
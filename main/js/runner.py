@@ -1,14 +1,363 @@
 import os
+import copy
 import json
+import time
+import queue
+import hashlib
+import atexit
 import logging
-import requests
-from subprocess import run, PIPE
+import itertools
+import threading
+from collections import OrderedDict
+from subprocess import Popen, PIPE
+
+from django.conf import settings
+from django.core.cache import caches
 
 # This class gets populated with functions in the javascript after loading this file
 # Refer to code below
 
 LOGGER = logging.getLogger(__name__)
 
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "worker.js")
+PING_FUNCTION = "__ping__"
+
+# Functions whose result depend only on their params, these are memoized by ResultCache
+# functions that build transactions or depend on network state must NOT be added here
+PURE_FUNCTIONS = {
+    "compileFaucetContract",
+    "faucetContractBytecode",
+}
+
+
+class NodeWorkerException(Exception):
+    pass
+
+
+class NodeWorker:
+    """
+        A long-lived node process running `src/worker.js`,
+        requests & responses are exchanged as JSON lines over stdin/stdout
+    """
+    def __init__(self, script=WORKER_SCRIPT):
+        self.script = script
+        self.process = None
+        self._responses = None
+        self._request_ids = itertools.count(1)
+        self.spawn()
+
+    def __str__(self):
+        pid = self.process.pid if self.process else None
+        return f"NodeWorker<{pid}>"
+
+    @property
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def spawn(self):
+        try:
+            self.process = Popen(
+                ["node", self.script],
+                stdin=PIPE, stdout=PIPE,
+                cwd=os.path.dirname(self.script),
+            )
+        except OSError as exception:
+            raise NodeWorkerException(f"Unable to start node worker: {exception}")
+
+        # a new queue per process so a reader thread of a dead process can't feed the new one
+        self._responses = queue.Queue()
+        reader = threading.Thread(
+            target=self._read_stdout, args=(self.process, self._responses), daemon=True,
+        )
+        reader.start()
+        LOGGER.info(f"Spawned {self}")
+
+    def kill(self):
+        if not self.process: return
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception as exception:
+            LOGGER.warning(f"Failed to kill {self} | {exception}")
+
+    def respawn(self):
+        LOGGER.warning(f"Respawning {self}")
+        self.kill()
+        self.spawn()
+
+    @staticmethod
+    def _read_stdout(process, responses):
+        for line in process.stdout:
+            responses.put(line)
+        responses.put(None)
+
+    def call(self, function, params, batch=None, timeout=None):
+        if not self.is_alive:
+            self.respawn()
+
+        request_id = next(self._request_ids)
+        data = dict(id=request_id, function=function, params=params)
+        if batch is not None:
+            data["batch"] = batch
+            function = f"batch of {len(batch)}"
+        try:
+            self.process.stdin.write(json.dumps(data).encode() + b"\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as exception:
+            self.respawn()
+            raise NodeWorkerException(f"Failed to send request to {self}: {exception}")
+
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                remaining = 0
+            try:
+                line = self._responses.get(timeout=remaining)
+            except queue.Empty:
+                # the response may still arrive later and get mixed with the next request
+                self.respawn()
+                raise NodeWorkerException(f"'{function}' timed out after {timeout}s")
+
+            if line is None:
+                self.respawn()
+                raise NodeWorkerException(f"Node worker exited while running '{function}'")
+
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                LOGGER.debug(f"{self} | Unexpected output: {line}")
+                continue
+
+            # stale response from an earlier request that timed out
+            if response.get("id") != request_id:
+                continue
+
+            return response
+
+    def ping(self, timeout=5):
+        try:
+            response = self.call(PING_FUNCTION, [], timeout=timeout)
+            return bool(response.get("success"))
+        except NodeWorkerException as exception:
+            LOGGER.warning(f"Ping failed | {self} | {exception}")
+            return False
+
+
+class NodeWorkerPool:
+    """
+        Keeps `size` node workers alive for the lifetime of the python process,
+        so calls never pay for node startup and the cashscript imports
+    """
+    def __init__(self, size=2, timeout=30, health_check_interval=60):
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self.pid = os.getpid()
+        self._workers = []
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def warm_up(self):
+        with self._lock:
+            while len(self._workers) < self.size:
+                worker = NodeWorker()
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+        if self.health_check_interval:
+            thread = threading.Thread(target=self._health_check_loop, daemon=True)
+            thread.start()
+
+    def _acquire(self, timeout=None):
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise NodeWorkerException(f"No node worker available after {timeout}s")
+
+    def _release(self, worker):
+        self._idle.put(worker)
+
+    def call(self, function, params, batch=None, timeout=None):
+        if self._closed:
+            raise NodeWorkerException("Node worker pool is closed")
+
+        timeout = timeout or self.timeout
+        worker = self._acquire(timeout=timeout)
+        try:
+            return worker.call(function, params, batch=batch, timeout=timeout)
+        finally:
+            self._release(worker)
+
+    def health_check(self):
+        """
+            Pings the currently idle workers, unresponsive ones are respawned on failed ping
+            Returns the number of healthy workers checked
+        """
+        healthy = 0
+        for _ in range(self._idle.qsize()):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                if worker.ping(): healthy += 1
+            except NodeWorkerException as exception:
+                LOGGER.exception(exception)
+            finally:
+                self._release(worker)
+
+        return healthy
+
+    def _health_check_loop(self):
+        while not self._closed:
+            time.sleep(self.health_check_interval)
+            if self._closed or os.getpid() != self.pid: return
+            self.health_check()
+
+    def close(self):
+        self._closed = True
+        for worker in self._workers:
+            worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    global _pool
+
+    # the pool must not be shared with forked processes, e.g. gunicorn workers
+    if _pool is not None and _pool.pid == os.getpid():
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            pool = NodeWorkerPool(
+                size=getattr(settings, "NODE_WORKER_POOL_SIZE", 2),
+                timeout=getattr(settings, "NODE_WORKER_TIMEOUT", 30),
+                health_check_interval=getattr(settings, "NODE_WORKER_HEALTH_CHECK_INTERVAL", 60),
+            )
+            pool.warm_up()
+            _pool = pool
+
+    return _pool
+
+@atexit.register
+def _close_worker_pool():
+    if _pool is not None and _pool.pid == os.getpid():
+        _pool.close()
+
+
+class ResultCache:
+    """
+        Memoizes results of PURE_FUNCTIONS
+        First tier is a bounded LRU in the process' memory,
+        second tier is an optional django cache shared between processes, see settings.CACHES
+    """
+    KEY_PREFIX = "scriptfunctions"
+
+    def __init__(self, max_size=1024, shared_cache_alias=None, shared_cache_timeout=None):
+        self.max_size = max_size
+        self.shared_cache_alias = shared_cache_alias
+        self.shared_cache_timeout = shared_cache_timeout
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = dict(memory_hits=0, shared_hits=0, misses=0)
+
+    @property
+    def shared_cache(self):
+        if not self.shared_cache_alias: return
+        return caches[self.shared_cache_alias]
+
+    @classmethod
+    def is_cacheable(cls, function):
+        return function in PURE_FUNCTIONS
+
+    @classmethod
+    def make_key(cls, function, params):
+        params_hash = hashlib.sha256(
+            json.dumps(params, sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+        return f"{cls.KEY_PREFIX}:{function}:{params_hash}"
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _set_memory(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get(self, function, params):
+        """
+            Returns (found, result)
+        """
+        key = self.make_key(function, params)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return True, copy.deepcopy(self._data[key])
+
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            try:
+                found, result = shared_cache.get(key, (False, None))
+            except Exception as exception:
+                LOGGER.warning(f"Failed to get shared cache | {key} | {exception}")
+                found, result = False, None
+
+            if found:
+                self._count("shared_hits")
+                self._set_memory(key, result)
+                return True, copy.deepcopy(result)
+
+        self._count("misses")
+        return False, None
+
+    def set(self, function, params, result):
+        key = self.make_key(function, params)
+        self._set_memory(key, copy.deepcopy(result))
+
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            try:
+                shared_cache.set(key, (True, result), timeout=self.shared_cache_timeout)
+            except Exception as exception:
+                LOGGER.warning(f"Failed to set shared cache | {key} | {exception}")
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            for stat in self.stats:
+                self.stats[stat] = 0
+
+    def get_stats(self):
+        with self._lock:
+            return dict(**self.stats, size=len(self._data), max_size=self.max_size)
+
+
+_result_cache = None
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            max_size=getattr(settings, "SCRIPT_FUNCTIONS_CACHE_SIZE", 1024),
+            shared_cache_alias=getattr(settings, "SCRIPT_FUNCTIONS_SHARED_CACHE", None),
+            shared_cache_timeout=getattr(settings, "SCRIPT_FUNCTIONS_SHARED_CACHE_TIMEOUT", None),
+        )
+    return _result_cache
+
+
 class ScriptFunctionsMeta(type):
     functions_loaded = False
     functions = {}
@@ -20,40 +369,81 @@ class ScriptFunctionsMeta(type):
 
         return cls.functions[key]
 
+    def batch(cls, calls, timeout=None):
+        """
+            Runs multiple functions in a single round trip to node
+            `calls` is a list of dicts with `function` & `params` keys, or (function, params) tuples
+            Returns a list of (success, result_or_error) in the same order as `calls`
+        """
+        result_cache = get_result_cache()
+        results = [None] * len(calls)
+        batch = []
+        batch_indices = []
+        for index, call in enumerate(calls):
+            if isinstance(call, dict):
+                function, params = call["function"], call.get("params") or []
+            else:
+                function, params = call
+            params = list(params)
+
+            if result_cache.is_cacheable(function):
+                found, result = result_cache.get(function, params)
+                if found:
+                    results[index] = (True, result)
+                    continue
+
+            batch.append(dict(function=function, params=params))
+            batch_indices.append(index)
+
+        if not batch: return results
+
+        response = get_worker_pool().call(None, None, batch=batch, timeout=timeout)
+        for index, call, item in zip(batch_indices, batch, parse_response(response)):
+            if not item.get("success"):
+                results[index] = (False, item.get("error"))
+                continue
+
+            result = parse_result(item.get("result"))
+            if result_cache.is_cacheable(call["function"]):
+                result_cache.set(call["function"], call["params"], result)
+            results[index] = (True, result)
+
+        return results
+
+    def cache_stats(cls):
+        return get_result_cache().get_stats()
+
 
 class ScriptFunctions(metaclass=ScriptFunctionsMeta):
     pass
 
-def generate_func(func_name):
-    def func(*args):
-        _input = {
-            "function": func_name,
-            "params": args,
-        }
+def parse_result(result):
+    if result is None: return
 
-        try:
-            response = requests.post('http://localhost:3000/', data=json.dumps(_input))
-            if response.ok:
-                try:
-                    return response.json()
-                except json.JSONDecodeError:
-                    return response.content
-            else:
-               raise Exception(response.content.decode())
-        except requests.exceptions.ConnectionError:
-            pass
+    try:
+        return json.loads(result)
+    except json.JSONDecodeError:
+        return result
 
-        process = run(['node', './main/js/src/main.js'], input=json.dumps(_input).encode(), stdout=PIPE, stderr=PIPE)
-        result = None
+def parse_response(response):
+    if not response.get("success"):
+        raise Exception(response.get("error"))
 
-        LOGGER.info(f"{process}")
-        if process.stdout:
-            try:
-                result = json.loads(process.stdout)
-            except json.JSONDecodeError:
-                result = process.stdout
-        elif process.stderr:
-            raise Exception(process.stderr.decode())
+    return parse_result(response.get("result"))
+
+def generate_func(func_name):
+    def func(*args, timeout=None):
+        result_cache = get_result_cache()
+        cacheable = result_cache.is_cacheable(func_name)
+        if cacheable:
+            found, result = result_cache.get(func_name, list(args))
+            if found: return result
+
+        response = get_worker_pool().call(func_name, args, timeout=timeout)
+        result = parse_response(response)
+
+        if cacheable:
+            result_cache.set(func_name, list(args), result)
         return result
 
     return func
@@ -39,14 +39,18 @@ export class Faucet {
     return 300n;
   }
 
+  static getArtifact() {
+    const cashscriptFilename = 'faucet.cash'
+    return compileFile(new URL(cashscriptFilename, import.meta.url));
+  }
+
   getContract() {
     // const provider = new ElectrumNetworkProvider('testnet4');
     const provider = new ElectrumNetworkProvider(this.options.network);
     const addressType = 'p2sh32';
     const opts = { provider, addressType, }
 
-    const cashscriptFilename = 'faucet.cash'
-    const artifact = compileFile(new URL(cashscriptFilename, import.meta.url));
+    const artifact = Faucet.getArtifact();
     const contract = new Contract(artifact, this.contractParams, opts);
 
     return contract
@@ -137,4 +141,58 @@ export class Faucet {
     }
     return { success: true, transaction }
   }
+
+  /**
+   * Spends the contract's utxos with the owner's key and sends them back to the contract
+   * as one output per amount in `outputSats`, plus an output for the remaining balance
+   * Used for splitting a large utxo for parallel claims, or consolidating small utxos
+   * @param {Object} opts
+   * @param {String} opts.wif
+   * @param {import("cashscript").Utxo[]} opts.utxos
+   * @param {BigInt[]} opts.outputSats
+   * @param {Number} [opts.locktime]
+   */
+  redistribute(opts) {
+    const signatureTemplate = new SignatureTemplate(opts?.wif);
+    const contract = this.getContract();
+
+    if (opts?.utxos?.some(utxo => utxo.token)) {
+      return { success: false, error: 'Token utxos are not supported' }
+    }
+
+    const transaction = contract.functions.ownerUnlock(signatureTemplate, signatureTemplate.getPublicKey()).from(opts?.utxos)
+    if (Number.isSafeInteger(opts?.locktime)) {
+      transaction.withTime(opts?.locktime);
+    }
+
+    const totalSats = opts.utxos.reduce((subtotal, utxo) => subtotal + utxo.satoshis, 0n)
+    const allocatedSats = opts.outputSats.reduce((subtotal, sats) => subtotal + sats, 0n)
+    opts.outputSats.forEach(sats => transaction.to(contract.address, sats))
+
+    // remaining balance output, the fee is deducted from it
+    transaction.to(contract.address, totalSats - allocatedSats)
+    const remainderOutput = transaction.outputs[transaction.outputs.length - 1]
+
+    let fee = BigInt(
+      (calculateInputSize(transaction) * transaction.inputs.length) +
+      getTxSizeWithoutInputs(transaction.outputs)
+    )
+    remainderOutput.amount -= fee
+
+    if (remainderOutput.amount < 546n) {
+      // not worth keeping, let it go to the fee instead
+      transaction.outputs.pop()
+      fee = totalSats - allocatedSats
+      const minFee = BigInt(
+        (calculateInputSize(transaction) * transaction.inputs.length) +
+        getTxSizeWithoutInputs(transaction.outputs)
+      )
+      if (fee < minFee || !transaction.outputs.length) {
+        return { success: false, error: 'Not enough balance to cover fee' }
+      }
+    }
+
+    transaction.withHardcodedFee(fee)
+    return { success: true, transaction }
+  }
 }
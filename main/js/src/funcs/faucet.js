@@ -1,3 +1,5 @@
+import { binToHex } from "@bitauth/libauth";
+import { asmToScript, scriptToBytecode } from "@cashscript/utils";
 import { Faucet } from "../contracts/faucet/index.js";
 import { parseUtxo } from "../utils/transaction.js";
 
@@ -10,6 +12,19 @@ export function compileFaucetContract(contractOpts) {
   return { address: contract.address, tokenAddress: contract.tokenAddress }
 }
 
+/**
+ * Compiled bytecode of the contract without the constructor parameters,
+ * used as the template for deriving contract addresses in python
+ */
+export function faucetContractBytecode() {
+  const artifact = Faucet.getArtifact();
+  return {
+    bytecode: binToHex(scriptToBytecode(asmToScript(artifact.bytecode))),
+    constructorInputs: artifact.constructorInputs,
+    compiler: artifact.compiler,
+  }
+}
+
 /**
  * @param {Object} opts
  * @param {Object} opts.contractOpts
@@ -53,3 +68,29 @@ export async function faucetSweep(opts) {
   if (error) return { success: false, error }
   return { success: true, transaction: await transaction.build() }
 }
+
+
+/**
+ * @param {Object} opts
+ * @param {Object} opts.contractOpts
+ * @param {String} opts.wif
+ * @param {import("cashscript").Utxo[]} opts.utxos
+ * @param {(Number | String)[]} opts.outputSats
+ * @param {Number} [opts.locktime]
+ */
+export async function faucetRedistribute(opts) {
+  const faucet = new Faucet(opts?.contractOpts);
+  const { error, transaction } = faucet.redistribute({
+    wif: opts?.wif,
+    utxos: opts.utxos.map(parseUtxo),
+    outputSats: (opts?.outputSats || []).map(BigInt),
+    locktime: opts?.locktime,
+  });
+
+  if (error) return { success: false, error }
+  return {
+    success: true,
+    transaction: await transaction.build(),
+    outputs: transaction.outputs.map(output => Number(output.amount)),
+  }
+}
@@ -1,7 +1,15 @@
-import { compileFaucetContract, faucetClaim, faucetSweep } from "./faucet.js"
+import {
+  compileFaucetContract,
+  faucetContractBytecode,
+  faucetClaim,
+  faucetSweep,
+  faucetRedistribute,
+} from "./faucet.js"
 
 export default {
   compileFaucetContract,
+  faucetContractBytecode,
   faucetClaim,
   faucetSweep,
+  faucetRedistribute,
 }
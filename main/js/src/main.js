@@ -17,8 +17,11 @@ if (import.meta.url.startsWith('file:')) {
  * @param {Object} data 
  * @param {String} data.function
  * @param {any[]} [data.params]
+ * @param {{ function: String, params: any[] }[]} [data.batch]
  */
 export async function runScript(data) {
+    if (Array.isArray(data?.batch)) return runBatch(data.batch)
+
     const func = funcs[data?.function]
     if (!func) return {
         success: false,
@@ -38,3 +41,13 @@ export async function runScript(data) {
         return { success: false, result: undefined, error: errorResponse }
     }
 }
+
+/**
+ * Runs multiple functions in a single call, results are returned in the same order
+ * and a failing item does not fail the whole batch
+ * @param {{ function: String, params: any[] }[]} batch
+ */
+export async function runBatch(batch) {
+    const responses = await Promise.all(batch.map(item => runScript(item)))
+    return { success: true, result: JSON.stringify(responses), error: undefined }
+}
@@ -0,0 +1,39 @@
+import readline from 'readline'
+import { runScript } from './main.js'
+
+// stdout is reserved for responses, one JSON object per line,
+// so anything logged by the functions is routed to stderr instead
+console.log = console.error
+console.info = console.error
+console.debug = console.error
+
+const PING_FUNCTION = '__ping__'
+
+/**
+ * Long-lived worker owned by main/js/runner.py
+ * Reads one JSON request per line from stdin and writes one JSON response per line to stdout
+ * Request: { id: Number, function: String, params: any[] }
+ * Response: { id: Number, success: Boolean, result: String, error: any }
+ */
+const rl = readline.createInterface({ input: process.stdin, terminal: false })
+
+rl.on('line', async (line) => {
+  let request
+  try {
+    request = JSON.parse(line)
+  } catch {
+    console.error(`Invalid request line: ${line}`)
+    return
+  }
+
+  let response
+  if (request?.function === PING_FUNCTION) {
+    response = { success: true, result: JSON.stringify(process.pid), error: undefined }
+  } else {
+    response = await runScript(request)
+  }
+
+  process.stdout.write(JSON.stringify({ id: request?.id, ...response }) + '\n')
+})
+
+rl.on('close', () => process.exit(0))
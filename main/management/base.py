@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main.apps import LOGGER
+
+
+class LoopCommand(BaseCommand):
+    """
+        Base for background workers run under supervisord, calls `run_once` in a loop
+        and sleeps for `--interval` seconds whenever there was nothing to do
+    """
+    default_interval = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run a single pass and exit")
+        parser.add_argument("--interval", type=float, default=self.default_interval)
+
+    def run_once(self, **options):
+        """
+            Returns the amount of work done, the loop sleeps when it is falsy
+        """
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            self.run_once(**options)
+            return
+
+        while True:
+            close_old_connections()
+            try:
+                work_done = self.run_once(**options)
+            except Exception as exception:
+                LOGGER.exception(exception)
+                work_done = None
+
+            if not work_done:
+                time.sleep(options["interval"])
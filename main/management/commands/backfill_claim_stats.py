@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.models import ClaimStats
+from main.utils.claim_stats import backfill_claim_stats
+from main.utils.commands import parse_datetime
+
+
+class Command(BaseCommand):
+    help = "Recount the hourly & daily claim stats from the claims in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("faucet_ids", nargs="*", type=int, help="All faucets if not set")
+        parser.add_argument("--period", choices=ClaimStats.Period.values, default=None, help="Both if not set")
+        parser.add_argument("--since", type=parse_datetime, default=None, help="Start of the first bucket to recount")
+        parser.add_argument("--until", type=parse_datetime, default=None)
+
+    def handle(self, *args, **options):
+        periods = [options["period"]] if options["period"] else ClaimStats.Period.values
+        for period in periods:
+            start = time.perf_counter()
+            created, updated = backfill_claim_stats(
+                period,
+                since=options["since"],
+                until=options["until"],
+                faucet_ids=options["faucet_ids"],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{period} | {created} created, {updated} updated in {time.perf_counter() - start:.1f}s"
+            ))
@@ -0,0 +1,126 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from main.models import FaucetClaim, FaucetContract
+from main.utils.claim_partitions import add_claim_partitions
+from main.utils.commands import percentile
+
+BENCHMARK_FAUCET_ADDRESS = "bchtest:benchmark-claim-admin"
+BENCHMARK_USERNAME = "claim-admin-benchmark"
+
+# claims spread over the last `days`, ips & recipients are derived from the row number
+SEED_CLAIMS_SQL = """
+    INSERT INTO main_faucetclaim (network, txid, recipient, satoshis, ip, created_at, faucet_id)
+    SELECT
+        'chipnet',
+        md5(i::text) || md5((-i)::text),
+        'bchtest:q' || md5('recipient' || (i %% %(recipients)s)::text),
+        1000,
+        ('10.' || (i / 65536) %% 256 || '.' || (i / 256) %% 256 || '.' || i %% 256)::inet,
+        %(now)s - make_interval(secs => i * %(interval)s),
+        %(faucet_id)s
+    FROM generate_series(%(first)s, %(last)s) AS i
+"""
+
+
+class Command(BaseCommand):
+    help = "Seed claims and measure the latency of the claims admin list, run against a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Claims to add before measuring, e.g. 10000000")
+        parser.add_argument("--days", type=int, default=365, help="Seeded claims are spread over the last days")
+        parser.add_argument("--batch-size", type=int, default=1000000)
+        parser.add_argument("--requests", type=int, default=5, help="Requests per page")
+        parser.add_argument("--budget-ms", type=float, default=1000, help="Max p95 latency of every page")
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            self.seed(options["seed"], options["days"], options["batch_size"])
+
+        claim = FaucetClaim.objects.order_by("-created_at", "-id").first()
+        if not claim:
+            raise CommandError("No claims, use --seed")
+
+        pages = {
+            "list": {},
+            "page 50": {"p": 49},
+            "network filter": {"network__exact": "chipnet"},
+            "date filter": {"created_at__gte": (timezone.now() - timezone.timedelta(days=7)).date().isoformat()},
+            "txid search": {"q": claim.txid},
+            "ip search": {"q": claim.ip or "10.0.0.1"},
+            "address search": {"q": claim.recipient[10:20]},
+        }
+
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults=dict(is_staff=True, is_superuser=True),
+        )
+        try:
+            over_budget = self.benchmark(user, pages, options["requests"], options["budget_ms"])
+        finally:
+            user.delete()
+
+        if over_budget:
+            raise CommandError(f"Over the {options['budget_ms']:.0f}ms budget: {', '.join(over_budget)}")
+        self.stdout.write(self.style.SUCCESS(f"Every page is within the {options['budget_ms']:.0f}ms budget"))
+
+    def benchmark(self, user, pages, requests, budget_ms):
+        client = Client()
+        client.force_login(user)
+        url = "/admin/main/faucetclaim/"
+
+        over_budget = []
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            for name, params in pages.items():
+                latencies = []
+                for _ in range(requests):
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        response = client.get(url, params)
+                        latencies.append(time.perf_counter() - start)
+
+                    if response.status_code != 200:
+                        raise CommandError(f"{name} | status {response.status_code}")
+
+                p95_ms = percentile(latencies, 95) * 1000
+                if p95_ms > budget_ms: over_budget.append(name)
+                style = self.style.SUCCESS if p95_ms <= budget_ms else self.style.ERROR
+                self.stdout.write(style(
+                    f"{name}: p50 {percentile(latencies, 50) * 1000:.0f}ms | p95 {p95_ms:.0f}ms "
+                    f"| {len(context.captured_queries)} queries"
+                ))
+        return over_budget
+
+    def seed(self, count, days, batch_size):
+        now = timezone.now()
+        add_claim_partitions(now - timezone.timedelta(days=days), now)
+
+        # bulk_create skips the signals, the fake address must not be subscribed to watchtower
+        FaucetContract.objects.bulk_create([
+            FaucetContract(
+                address=BENCHMARK_FAUCET_ADDRESS, network="chipnet", passcode="benchmark",
+                payout_satoshis=1000, owner_address=BENCHMARK_FAUCET_ADDRESS,
+            ),
+        ], ignore_conflicts=True)
+        faucet = FaucetContract.objects.get(address=BENCHMARK_FAUCET_ADDRESS)
+
+        params = dict(
+            now=now,
+            interval=days * 24 * 60 * 60 / count,
+            recipients=max(count // 5, 1),
+            faucet_id=faucet.id,
+        )
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            for first in range(1, count + 1, batch_size):
+                last = min(first + batch_size - 1, count)
+                cursor.execute(SEED_CLAIMS_SQL, dict(params, first=first, last=last))
+                self.stdout.write(f"Seeded {last}/{count} claims | {time.perf_counter() - start:.0f}s")
+
+            # the admin's estimated count and the query plans need fresh statistics
+            cursor.execute("ANALYZE main_faucetclaim")
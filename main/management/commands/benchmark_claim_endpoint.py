@@ -0,0 +1,65 @@
+import time
+import asyncio
+import httpx
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.utils.commands import percentile
+
+
+class Command(BaseCommand):
+    help = "Measure claim endpoint throughput, run against the WSGI and ASGI deployments to compare them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="Claim page urls, e.g. http://localhost:8000/claim/")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--timeout", type=float, default=60)
+        parser.add_argument(
+            "--post", nargs=3, metavar=("NETWORK", "ADDRESS", "PASSCODE"), default=None,
+            help="Submit claims instead of loading the page, the server must run with config.settings_benchmark",
+        )
+
+    def handle(self, *args, **options):
+        for url in options["urls"]:
+            try:
+                results = asyncio.run(self.benchmark(url, **options))
+            except httpx.HTTPError as exception:
+                raise CommandError(f"{url} | {exception}")
+            self.report(url, *results)
+
+    async def benchmark(self, url, **options):
+        data = None
+        if options["post"]:
+            network, address, passcode = options["post"]
+            data = dict(network=network, address=address, passcode=passcode, captcha_0="x", captcha_1="PASSED")
+
+        latencies = []
+        status_codes = {}
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        limits = httpx.Limits(max_connections=options["concurrency"])
+
+        async with httpx.AsyncClient(timeout=options["timeout"], limits=limits) as client:
+            async def send():
+                async with semaphore:
+                    start = time.perf_counter()
+                    if data: response = await client.post(url, data=data)
+                    else: response = await client.get(url)
+                    latencies.append(time.perf_counter() - start)
+                    status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*[send() for _ in range(options["requests"])])
+            duration = time.perf_counter() - start
+
+        return duration, latencies, status_codes
+
+    def report(self, url, duration, latencies, status_codes):
+        self.stdout.write(
+            f"{url}\n"
+            f"  requests: {len(latencies)} in {duration:.2f}s | {len(latencies) / duration:.1f} req/s\n"
+            f"  latency p50: {percentile(latencies, 50) * 1000:.0f}ms"
+            f" | p95: {percentile(latencies, 95) * 1000:.0f}ms"
+            f" | p99: {percentile(latencies, 99) * 1000:.0f}ms\n"
+            f"  status codes: {status_codes}"
+        )
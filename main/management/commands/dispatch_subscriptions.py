@@ -0,0 +1,15 @@
+from main.management.base import LoopCommand
+from main.utils.subscriptions import dispatch_subscriptions
+
+
+class Command(LoopCommand):
+    help = "Deliver queued faucet subscriptions to watchtower"
+    default_interval = 2
+
+    def run_once(self, **options):
+        result = dispatch_subscriptions()
+        if not result: return 0
+
+        for faucet, error in result.failed:
+            self.stdout.write(self.style.ERROR(f"{faucet} | {error}"))
+        return len(result.results)
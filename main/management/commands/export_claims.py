@@ -0,0 +1,51 @@
+import gzip
+
+from django.core.management.base import BaseCommand
+
+from main.models import Network
+from main.utils.claim_export import EXPORT_FORMATS, get_export_claims
+from main.utils.commands import parse_datetime
+
+
+class Command(BaseCommand):
+    help = "Stream claims to a csv or jsonl file, gzipped if the path ends with .gz"
+
+    def add_arguments(self, parser):
+        parser.add_argument("faucet_ids", nargs="*", type=int, help="All faucets if not set")
+        parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--network", choices=Network.values, default=None)
+        parser.add_argument("--since", type=parse_datetime, default=None)
+        parser.add_argument("--until", type=parse_datetime, default=None)
+        parser.add_argument("--output", default=None, help="File path, stdout if not set")
+
+    def handle(self, *args, **options):
+        claims = get_export_claims(
+            faucet_ids=options["faucet_ids"],
+            network=options["network"],
+            since=options["since"],
+            until=options["until"],
+        )
+        iter_lines, _ = EXPORT_FORMATS[options["format"]]
+
+        path = options["output"]
+        if not path:
+            # lines already end with a newline, OutputWrapper only adds one if missing
+            output = self.stdout
+        elif path.endswith(".gz"):
+            output = gzip.open(path, "wt", encoding="utf-8", newline="")
+        else:
+            output = open(path, "w", encoding="utf-8", newline="")
+
+        count = 0
+        try:
+            for line in iter_lines(claims):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+        if path:
+            # the csv header is a line as well
+            if options["format"] == "csv": count -= 1
+            self.stdout.write(self.style.SUCCESS(f"Exported {max(count, 0)} claims to {path}"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import FaucetContract, Network
+from main.utils.bulk_actions import BULK_ACTIONS
+
+
+class Command(BaseCommand):
+    help = "Subscribe faucets to watchtower or update their balances concurrently, e.g. from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=list(BULK_ACTIONS))
+        parser.add_argument("faucet_ids", nargs="*", type=int, help="All faucets if not set")
+        parser.add_argument("--network", choices=Network.values, default=None)
+        parser.add_argument("--unsubscribed", action="store_true", help="Only faucets not subscribed to watchtower")
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        queryset = FaucetContract.objects.order_by("id")
+        if options["faucet_ids"]:
+            queryset = queryset.filter(pk__in=options["faucet_ids"])
+        if options["network"]:
+            queryset = queryset.filter(network=options["network"])
+        if options["unsubscribed"]:
+            queryset = queryset.filter(subscribed=False)
+
+        faucets = list(queryset)
+        if not faucets:
+            raise CommandError("No faucet found")
+
+        result = BULK_ACTIONS[options["action"]](faucets, max_workers=options["workers"])
+        for obj, success, message in result.results:
+            if success:
+                self.stdout.write(f"{obj} | {message}")
+            else:
+                self.stdout.write(self.style.ERROR(f"{obj} | {message}"))
+
+        style = self.style.SUCCESS if not result.failed else self.style.WARNING
+        self.stdout.write(style(result.summary))
@@ -0,0 +1,48 @@
+from django.conf import settings
+
+from main.management.base import LoopCommand
+from main.utils.claim_partitions import (
+    archive_claim_partitions,
+    create_claim_partitions,
+    get_expired_claim_partitions,
+)
+
+
+class Command(LoopCommand):
+    help = "Create the upcoming monthly claim partitions and archive the expired ones to gzipped JSONL"
+    default_interval = 6 * 60 * 60
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--dry", action="store_true", help="Only show what would be created & archived")
+        parser.add_argument("--skip-create", action="store_true")
+        parser.add_argument("--skip-archive", action="store_true")
+        parser.add_argument(
+            "--retention", type=int, default=settings.CLAIM_PARTITIONS_RETENTION,
+            help="Months of claims to keep before the current month",
+        )
+        parser.add_argument("--archive-dir", default=settings.CLAIM_ARCHIVE_DIR)
+
+    def run_once(self, **options):
+        work_done = 0
+        if not options["skip_create"]:
+            results = create_claim_partitions(dry=options["dry"])
+            for name, moved in results:
+                message = f"{'Would create' if options['dry'] else 'Created'} partition {name}"
+                if moved:
+                    message += f", {'moving' if options['dry'] else 'moved'} {moved} claims from the default partition"
+                self.stdout.write(message)
+            work_done += len(results)
+
+        if options["skip_archive"]:
+            return work_done
+
+        if options["dry"]:
+            for partition in get_expired_claim_partitions(retention=options["retention"]):
+                self.stdout.write(f"Would archive {partition.table}")
+            return work_done
+
+        results = archive_claim_partitions(retention=options["retention"], archive_dir=options["archive_dir"])
+        for partition, path, count in results:
+            self.stdout.write(f"Archived {count} claims of {partition.table} to {path}")
+        return work_done + len(results)
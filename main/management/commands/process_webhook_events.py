@@ -0,0 +1,13 @@
+from main.management.base import LoopCommand
+from main.utils.webhook_events import delete_processed_webhook_events, process_webhook_events
+
+
+class Command(LoopCommand):
+    help = "Apply the watchtower webhook events saved by the webhook view"
+    default_interval = 0.5
+
+    def run_once(self, **options):
+        count = process_webhook_events()
+        if not count:
+            delete_processed_webhook_events()
+        return count
@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.utils.faucet_provisioning import (
+    FaucetRowError,
+    create_faucets,
+    parse_faucet_row,
+    read_faucet_rows,
+)
+from main.utils.subscriptions import dispatch_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Create and subscribe faucets from a csv or jsonl file with columns: " \
+        "network, passcode, payout_satoshis, owner_address, max_claim_count, max_claim_per_ip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File path, jsonl if it ends with .jsonl otherwise csv")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=None, help="Concurrent watchtower subscriptions")
+        parser.add_argument(
+            "--no-subscribe", action="store_true",
+            help="Leave the subscriptions to the dispatch_subscriptions worker",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the rows")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        objs = []
+        invalid_count = 0
+        try:
+            for line_number, row in enumerate(read_faucet_rows(options["path"]), start=1):
+                try:
+                    objs.append(parse_faucet_row(row))
+                except FaucetRowError as exception:
+                    invalid_count += 1
+                    self.stdout.write(self.style.ERROR(f"Row {line_number} | {exception}"))
+        except (OSError, ValueError) as exception:
+            raise CommandError(f"Unable to read {options['path']}: {exception}")
+
+        self.stdout.write(f"{len(objs)} valid row/s, {invalid_count} invalid")
+        if options["dry_run"] or not objs: return
+
+        batch_size = options["batch_size"]
+        created_count = 0
+        failed_count = 0
+        unsubscribed_count = 0
+        for batch_start in range(0, len(objs), batch_size):
+            batch = objs[batch_start:batch_start + batch_size]
+            created, errors = create_faucets(batch)
+            created_count += len(created)
+            failed_count += len(errors)
+            for obj, error in errors:
+                self.stdout.write(self.style.ERROR(f"{obj.network} {obj.passcode} {obj.payout_satoshis} | {error}"))
+
+            if created and not options["no_subscribe"]:
+                result = dispatch_subscriptions(
+                    limit=len(created), faucet_ids=[obj.pk for obj in created], max_workers=options["workers"],
+                )
+                failed_subscriptions = result.failed if result else []
+                unsubscribed_count += len(failed_subscriptions)
+                for obj, error in failed_subscriptions:
+                    self.stdout.write(self.style.ERROR(f"{obj} | Subscribe failed, queued for retry: {error}"))
+
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{batch_start + len(batch)}/{len(objs)} rows | {created_count} created "
+                f"| {created_count / elapsed:.1f} faucets/s"
+            )
+
+        elapsed = time.perf_counter() - start
+        style = self.style.SUCCESS if not (failed_count or unsubscribed_count) else self.style.WARNING
+        self.stdout.write(style(
+            f"Created {created_count} faucet/s in {elapsed:.1f}s, {len(objs) - created_count - failed_count} existing, "
+            f"{failed_count} failed, {unsubscribed_count} subscriptions queued for retry"
+        ))
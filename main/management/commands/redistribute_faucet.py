@@ -0,0 +1,42 @@
+from getpass import getpass
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import FaucetContract
+from main.utils.faucet_contract import redistribute_faucet
+from main.utils.faucet_utxos import get_target_utxo_count
+
+
+class Command(BaseCommand):
+    help = "Split a faucet's balance into utxos for parallel claims, or consolidate its dust utxos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("faucet_ids", nargs="+", type=int)
+        parser.add_argument(
+            "--count", type=int, default=None,
+            help="Number of claimable utxos to split into, derived from the claim rate if not set",
+        )
+        parser.add_argument(
+            "--wif", default=None,
+            help="Owner's private key, prompted if not set",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only show the target utxo count")
+
+    def handle(self, *args, **options):
+        faucets = FaucetContract.objects.filter(pk__in=options["faucet_ids"])
+        if not faucets:
+            raise CommandError("No faucet found")
+
+        if options["dry_run"]:
+            for faucet in faucets:
+                target_count = options["count"] or get_target_utxo_count(faucet)
+                self.stdout.write(f"{faucet} | target utxo count: {target_count}")
+            return
+
+        wif = options["wif"] or getpass("Owner WIF: ")
+        for faucet in faucets:
+            success, error_or_txid = redistribute_faucet(faucet, wif, target_count=options["count"])
+            if success:
+                self.stdout.write(self.style.SUCCESS(f"{faucet} | {error_or_txid}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{faucet} | {error_or_txid}"))
@@ -0,0 +1,10 @@
+from main.management.base import LoopCommand
+from main.utils.faucet_balance import refresh_faucet_balances
+
+
+class Command(LoopCommand):
+    help = "Refresh the balances of faucets with pending refresh requests from watchtower"
+    default_interval = 1
+
+    def run_once(self, **options):
+        return refresh_faucet_balances(limit=50)
@@ -0,0 +1,11 @@
+from main.management.base import LoopCommand
+from main.utils.claim_jobs import fail_stale_claim_jobs, run_claim_jobs
+
+
+class Command(LoopCommand):
+    help = "Process queued claim jobs"
+    default_interval = 0.5
+
+    def run_once(self, **options):
+        fail_stale_claim_jobs()
+        return run_claim_jobs(limit=100)
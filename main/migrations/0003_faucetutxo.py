@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_faucetcontract_max_claim_per_ip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaucetUtxo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txid', models.CharField(max_length=64)),
+                ('vout', models.PositiveIntegerField()),
+                ('satoshis', models.PositiveBigIntegerField()),
+                ('token', models.JSONField(blank=True, help_text='Token data in cashscript format', null=True)),
+                ('reserved_at', models.DateTimeField(blank=True, null=True)),
+                ('spent_txid', models.CharField(blank=True, max_length=64, null=True)),
+                ('spent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('faucet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utxos', to='main.faucetcontract')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='faucetutxo',
+            index=models.Index(fields=['faucet', 'spent_txid', 'satoshis'], name='main_faucet_faucet__fbe25e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='faucetutxo',
+            unique_together={('txid', 'vout')},
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_faucetutxo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('network', models.CharField(choices=[('mainnet', 'Mainnet'), ('chipnet', 'Chipnet')], max_length=15)),
+                ('recipient', models.CharField(max_length=75)),
+                ('passcode', models.CharField(max_length=10)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('success', 'Success'), ('failed', 'Failed')], default='pending', max_length=15)),
+                ('txid', models.CharField(blank=True, max_length=64, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('faucet', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='claim_jobs', to='main.faucetcontract')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='claimjob',
+            index=models.Index(fields=['status', 'created_at'], name='main_claimj_status_b91ae2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='claimjob',
+            index=models.Index(fields=['faucet', 'ip', 'status'], name='main_claimj_faucet__fa7819_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_claimjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='faucetclaim',
+            index=models.Index(fields=['faucet', 'ip', 'created_at'], name='main_faucet_faucet__c5afa9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faucetclaim',
+            index=models.Index(fields=['faucet', 'recipient', 'created_at'], name='main_faucet_faucet__11e2b5_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_faucetclaim_rate_limit_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faucetcontract',
+            name='balance_refresh_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='faucetcontract',
+            name='balance_updated_at',
+            field=models.DateTimeField(blank=True, help_text='Last balance from watchtower, claims & deposits in between are applied locally', null=True),
+        ),
+    ]
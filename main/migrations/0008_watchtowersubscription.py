@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def queue_unsubscribed_faucets(apps, schema_editor):
+    FaucetContract = apps.get_model("main", "FaucetContract")
+    WatchtowerSubscription = apps.get_model("main", "WatchtowerSubscription")
+    WatchtowerSubscription.objects.bulk_create([
+        WatchtowerSubscription(faucet_id=faucet_id)
+        for faucet_id in FaucetContract.objects.filter(subscribed=False).values_list("id", flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchtowerSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('faucet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watchtower_subscriptions', to='main.faucetcontract')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='watchtowersubscription',
+            index=models.Index(fields=['delivered_at', 'next_attempt_at'], name='main_watcht_deliver_5c2780_idx'),
+        ),
+        migrations.RunPython(queue_unsubscribed_faucets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,110 @@
+# Moves FaucetClaim to a table partitioned by month of created_at, see main/utils/claim_partitions.py
+# Postgres can't partition an existing table, the claims are copied to the new table
+# Irreversible, the old table is dropped once its claims are copied
+
+from datetime import datetime, timezone
+
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+import django.db.models.deletion
+from psqlextra.backend.migrations.operations import PostgresAddDefaultPartition, PostgresCreatePartitionedModel
+import psqlextra.manager.manager
+import psqlextra.models.partitioned
+from psqlextra.partitioning import PostgresTimePartition, PostgresTimePartitionSize
+from psqlextra.partitioning.constants import AUTO_PARTITIONED_COMMENT
+from psqlextra.types import PostgresPartitioningMethod
+
+
+OLD_TABLE = "main_faucetclaim_old"
+
+# index names must be unique in the schema, the old ones are renamed to create the new table's
+RENAME_OLD_TABLE_SQL = f"""
+ALTER TABLE main_faucetclaim RENAME TO {OLD_TABLE};
+ALTER SEQUENCE main_faucetclaim_id_seq RENAME TO {OLD_TABLE}_id_seq;
+DO $$
+DECLARE index_name text;
+BEGIN
+    FOR index_name IN SELECT indexname FROM pg_indexes WHERE tablename = '{OLD_TABLE}' LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name, left(index_name, 55) || '_old');
+    END LOOP;
+END $$;
+"""
+
+COLUMNS = "id, network, txid, recipient, satoshis, ip, created_at, faucet_id"
+
+# fixed instead of settings.CLAIM_PARTITIONS_AHEAD so the migration doesn't depend on the runtime settings,
+# later months are created by manage_claim_partitions
+PARTITIONS_AHEAD = 3
+
+
+def copy_claims(apps, schema_editor):
+    FaucetClaim = apps.get_model("main", "FaucetClaim")
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(created_at) FROM {OLD_TABLE}")
+        oldest = cursor.fetchone()[0]
+
+    # monthly partitions from the oldest claim up to PARTITIONS_AHEAD months ahead,
+    # so claims don't land in the default partition before manage_claim_partitions first runs
+    size = PostgresTimePartitionSize(months=1)
+    start = size.start(oldest or datetime.now(timezone.utc))
+    end = size.start(datetime.now(timezone.utc)) + relativedelta(months=PARTITIONS_AHEAD)
+    while start <= end:
+        partition = PostgresTimePartition(size=size, start_datetime=start)
+        partition.create(FaucetClaim, schema_editor, comment=AUTO_PARTITIONED_COMMENT)
+        start += relativedelta(months=1)
+
+    schema_editor.execute(f"INSERT INTO main_faucetclaim ({COLUMNS}) SELECT {COLUMNS} FROM {OLD_TABLE}")
+    schema_editor.execute(
+        "SELECT setval(pg_get_serial_sequence('main_faucetclaim', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+        "FROM main_faucetclaim"
+    )
+    schema_editor.execute(f"DROP TABLE {OLD_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_watchtowersubscription'),
+    ]
+
+    operations = [
+        migrations.RunSQL(RENAME_OLD_TABLE_SQL),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[migrations.DeleteModel(name='FaucetClaim')],
+        ),
+        PostgresCreatePartitionedModel(
+            name='FaucetClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('network', models.CharField(choices=[('mainnet', 'Mainnet'), ('chipnet', 'Chipnet')], max_length=15)),
+                ('txid', models.CharField(max_length=64)),
+                ('recipient', models.CharField(max_length=75)),
+                ('satoshis', models.PositiveIntegerField()),
+                ('ip', models.GenericIPAddressField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('faucet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='claims', to='main.faucetcontract')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['faucet', 'ip', 'created_at'], name='main_faucet_faucet__c5afa9_idx'),
+                    models.Index(fields=['faucet', 'recipient', 'created_at'], name='main_faucet_faucet__11e2b5_idx'),
+                    models.Index(fields=['created_at', 'id'], name='main_faucet_created_295b17_idx'),
+                ],
+            },
+            partitioning_options={
+                'method': PostgresPartitioningMethod.RANGE,
+                'key': ['created_at'],
+            },
+            bases=(psqlextra.models.partitioned.PostgresPartitionedModel,),
+            managers=[
+                ('objects', psqlextra.manager.manager.PostgresManager()),
+            ],
+        ),
+        # claims outside of every monthly partition, e.g. if manage_claim_partitions wasn't running
+        PostgresAddDefaultPartition(
+            model_name='FaucetClaim',
+            name='default',
+        ),
+        # no reverse_code, see the note at the top
+        migrations.RunPython(copy_claims),
+    ]
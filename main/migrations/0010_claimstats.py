@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_faucetclaim_partitioned'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('network', models.CharField(choices=[('mainnet', 'Mainnet'), ('chipnet', 'Chipnet')], max_length=15)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=5)),
+                ('bucket', models.DateTimeField()),
+                ('claim_count', models.PositiveIntegerField(default=0)),
+                ('satoshis', models.BigIntegerField(default=0)),
+                ('unique_ips', models.PositiveIntegerField(default=0)),
+                ('unique_recipients', models.PositiveIntegerField(default=0)),
+                ('faucet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claim_stats', to='main.faucetcontract')),
+            ],
+            options={
+                'verbose_name_plural': 'Claim stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='claimstats',
+            index=models.Index(fields=['period', 'bucket'], name='main_claims_period_a4e629_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='claimstats',
+            constraint=models.UniqueConstraint(fields=('faucet', 'period', 'bucket'), name='unique_claim_stats_bucket'),
+        ),
+    ]
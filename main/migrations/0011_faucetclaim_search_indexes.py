@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:54
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_claimstats'),
+    ]
+
+    operations = [
+        # needs a superuser, or the extension created beforehand by one
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='faucetclaim',
+            index=models.Index(fields=['txid'], name='main_faucet_txid_4d2efe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faucetclaim',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['recipient'], name='main_faucet_recipient_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -1,4 +1,10 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.utils import timezone
+from psqlextra.models import PostgresPartitionedModel
+from psqlextra.types import PostgresPartitioningMethod
 
 # Create your models here.
 class Network(models.TextChoices):
@@ -23,6 +29,11 @@ class FaucetContract(models.Model):
 
     subscribed = models.BooleanField(default=False, help_text="If subscribed to watchtower")
     balance_satoshis = models.PositiveIntegerField(null=True, blank=True)
+    balance_updated_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Last balance from watchtower, claims & deposits in between are applied locally",
+    )
+    balance_refresh_requested_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Faucet#{self.id} <{self.address}>"
@@ -43,7 +54,50 @@ class FaucetContract(models.Model):
         )
 
 
-class FaucetClaim(models.Model):
+class FaucetUtxo(models.Model):
+    """
+        Local copy of a faucet contract's utxo set, see main/utils/faucet_utxos.py
+    """
+    faucet = models.ForeignKey(
+        FaucetContract, on_delete=models.CASCADE,
+        related_name="utxos",
+    )
+
+    txid = models.CharField(max_length=64)
+    vout = models.PositiveIntegerField()
+    satoshis = models.PositiveBigIntegerField()
+    token = models.JSONField(null=True, blank=True, help_text="Token data in cashscript format")
+
+    reserved_at = models.DateTimeField(null=True, blank=True)
+    spent_txid = models.CharField(max_length=64, null=True, blank=True)
+    spent_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [
+            ("txid", "vout"),
+        ]
+        indexes = [
+            models.Index(fields=["faucet", "spent_txid", "satoshis"]),
+        ]
+
+    def __str__(self):
+        return f"{self.txid}:{self.vout}"
+
+    @property
+    def cashscript_utxo(self):
+        data = dict(txid=self.txid, vout=self.vout, satoshis=self.satoshis)
+        if self.token:
+            data["token"] = self.token
+        return data
+
+
+class FaucetClaim(PostgresPartitionedModel):
+    """
+        Partitioned by month of created_at, see main/utils/claim_partitions.py
+        The primary key of the table is (id, created_at)
+    """
     faucet = models.ForeignKey(
         FaucetContract, on_delete=models.PROTECT,
         null=True, blank=True,
@@ -58,6 +112,22 @@ class FaucetClaim(models.Model):
     ip = models.GenericIPAddressField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # for main/utils/rate_limit.py:DatabaseRateLimitBackend
+            models.Index(fields=["faucet", "ip", "created_at"]),
+            models.Index(fields=["faucet", "recipient", "created_at"]),
+            # for main/utils/recent_claims.py, each partition is read from its newest claims
+            models.Index(fields=["created_at", "id"]),
+            # for the admin search, see main/admin.py:FaucetClaimAdmin.get_search_results
+            models.Index(fields=["txid"]),
+            GinIndex(fields=["recipient"], opclasses=["gin_trgm_ops"], name="main_faucet_recipient_trgm"),
+        ]
+
+    class PartitioningMeta:
+        method = PostgresPartitioningMethod.RANGE
+        key = ["created_at"]
+
     @property
     def amount_bch(self):
         return self.satoshis / 10e8
@@ -67,3 +137,134 @@ class FaucetClaim(models.Model):
         if self.network == "chipnet":
             return f"https://chipnet.bch.ninja/tx/{self.txid}"
         return f"https://explorer.bch.ninja/tx/{self.txid}"
+
+
+class ClaimStats(models.Model):
+    """
+        Claims of a faucet per hour or day, kept up to date as claims are recorded
+        so stats don't scan FaucetClaim, see main/utils/claim_stats.py
+    """
+    class Period(models.TextChoices):
+        hour = "hour"
+        day = "day"
+
+    faucet = models.ForeignKey(
+        FaucetContract, on_delete=models.CASCADE,
+        related_name="claim_stats",
+    )
+    network = models.CharField(max_length=15, choices=Network.choices)
+    period = models.CharField(max_length=5, choices=Period.choices)
+    bucket = models.DateTimeField()
+
+    claim_count = models.PositiveIntegerField(default=0)
+    satoshis = models.BigIntegerField(default=0)
+    unique_ips = models.PositiveIntegerField(default=0)
+    unique_recipients = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Claim stats"
+        constraints = [
+            models.UniqueConstraint(fields=["faucet", "period", "bucket"], name="unique_claim_stats_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["period", "bucket"]),
+        ]
+
+    def __str__(self):
+        return f"ClaimStats#{self.id} <{self.faucet_id} | {self.period} | {self.bucket}>"
+
+
+class ClaimJob(models.Model):
+    """
+        A claim request waiting to be processed by the claim worker, see main/utils/claim_jobs.py
+    """
+    class Status(models.TextChoices):
+        pending = "pending"
+        processing = "processing"
+        success = "success"
+        failed = "failed"
+
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    faucet = models.ForeignKey(
+        FaucetContract, on_delete=models.PROTECT,
+        related_name="claim_jobs",
+    )
+
+    network = models.CharField(max_length=15, choices=Network.choices)
+    recipient = models.CharField(max_length=75)
+    passcode = models.CharField(max_length=10)
+    ip = models.GenericIPAddressField(null=True, blank=True)
+
+    status = models.CharField(max_length=15, choices=Status.choices, default=Status.pending)
+    txid = models.CharField(max_length=64, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["faucet", "ip", "status"]),
+        ]
+
+    def __str__(self):
+        return f"ClaimJob#{self.id} <{self.status}>"
+
+    @property
+    def is_done(self):
+        return self.status in (self.Status.success, self.Status.failed)
+
+    @property
+    def tx_link(self):
+        if not self.txid: return
+        return FaucetClaim(network=self.network, txid=self.txid).tx_link
+
+
+class WebhookEvent(models.Model):
+    """
+        Watchtower webhook payloads waiting to be applied, see main/utils/webhook_events.py
+        Retries and replays of the same output share the dedupe key so they are stored once
+    """
+    dedupe_key = models.CharField(max_length=200, unique=True)
+    address = models.CharField(max_length=75, null=True, blank=True)
+    data = models.JSONField()
+
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["processed_at", "id"]),
+        ]
+
+    def __str__(self):
+        return f"WebhookEvent#{self.id} <{self.dedupe_key}>"
+
+
+class WatchtowerSubscription(models.Model):
+    """
+        Outbox of faucet subscriptions to watchtower, written with the faucet
+        and delivered by main/utils/subscriptions.py:dispatch_subscriptions
+    """
+    faucet = models.ForeignKey(
+        FaucetContract, on_delete=models.CASCADE,
+        related_name="watchtower_subscriptions",
+    )
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["delivered_at", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"WatchtowerSubscription#{self.id} <{self.faucet_id}>"
@@ -1,19 +1,30 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from main.apps import LOGGER
-from main.models import FaucetContract
-from main.utils.faucet_contract import subscribe_faucet_contract
+from main.models import FaucetClaim, FaucetContract
+from main.utils.claim_stats import record_claim_stats
+from main.utils.faucet_index import bump_faucet_index_version
+from main.utils.recent_claims import add_recent_claim_to_feeds
+from main.utils.subscriptions import queue_subscriptions
+
+@receiver(post_save, sender=FaucetContract)
+@receiver(post_delete, sender=FaucetContract)
+def update_faucet_index(sender, instance=None, **kwargs):
+    transaction.on_commit(bump_faucet_index_version)
+
 
 @receiver(post_save, sender=FaucetContract)
 def post_save_faucet_contract(sender, instance=None, created=False, **kwargs):
     if not created: return
 
-    success, error = subscribe_faucet_contract(instance)
+    # part of the transaction saving the faucet, e.g. the admin's, delivered by the dispatch_subscriptions worker
+    queue_subscriptions([instance])
+
+
+@receiver(post_save, sender=FaucetClaim)
+def post_save_faucet_claim(sender, instance=None, created=False, **kwargs):
+    if not created: return
 
-    if success:
-        LOGGER.info(f"Subscribed new faucet {instance} | Success => {success}")
-        # to not re-trigger the signals
-        FaucetContract.objects.filter(pk=instance.pk).update(subscribed=True)
-    else:
-        LOGGER.warn(f"Failed to subcribe new faucet {instance} | Error => {error}")
+    transaction.on_commit(lambda: add_recent_claim_to_feeds(instance))
+    transaction.on_commit(lambda: record_claim_stats(instance))
@@ -1,3 +1,1012 @@
-from django.test import TestCase
+import io
+import time
+import uuid
+import os
+import csv
+import json
+import asyncio
+import unittest
+import threading
+import httpx
+from unittest import mock
+from dateutil.relativedelta import relativedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from main.js.runner import ScriptFunctions
+from main.models import (
+    ClaimJob,
+    ClaimStats,
+    FaucetClaim,
+    FaucetContract,
+    FaucetUtxo,
+    WatchtowerSubscription,
+    WebhookEvent,
+)
+from main.utils.bulk_actions import run_concurrently, subscribe_faucets, update_faucet_balances
+from main.utils.claim_jobs import (
+    enqueue_claim_job,
+    fail_stale_claim_jobs,
+    get_next_claim_job,
+    process_claim_job,
+    reserve_claim_slot,
+)
+from main.utils.claim_export import EXPORT_FIELDS, get_export_claims, iter_claims_csv, iter_claims_jsonl
+from main.utils.claim_partitions import DEFAULT_PARTITION_TABLE, add_claim_partitions
+from main.utils.claim_stats import backfill_claim_stats
+from main.utils.async_claims import async_faucet_claim
+from main.utils.faucet_contract import faucet_claim
+from main.forms import FaucetForm
+from main.utils.faucet_balance import adjust_faucet_balance, refresh_faucet_balances, request_balance_refresh
+from main.utils.faucet_index import bump_faucet_index_version, get_faucet_index
+from main.utils.faucet_provisioning import FaucetRowError, parse_faucet_row
+from main.utils.faucet_script import build_claim_transaction, derive_contract_addresses
+from main.utils.faucet_utxos import (
+    get_claim_chain,
+    get_target_utxo_count,
+    plan_faucet_utxos,
+    release_faucet_utxo,
+    reserve_faucet_utxo,
+    sync_faucet_utxos,
+)
+from main.utils.rate_limit import ClaimRateLimit, MemoryRateLimitBackend, check_claim_rate_limits
+from main.utils.recent_claims import add_recent_claim, get_recent_claims, query_recent_claims
+from main.utils.subscriptions import dispatch_subscriptions, get_retry_delay, take_due_subscriptions
+from main.utils.utxo_stream import Utxo, UtxoStreamError, first_matching, iter_json_array_items
+from main.utils.webhook_events import process_webhook_events
+from main.utils.watchtower_api import WatchtowerException, WatchtowerUnavailable, get_watchtower
+from main.utils.watchtower_api_async import AsyncWatchtower, get_async_watchtower
+
+NODE_MODULES_DIR = os.path.join(os.path.dirname(__file__), "js", "node_modules")
+requires_node_modules = unittest.skipUnless(os.path.isdir(NODE_MODULES_DIR), "node modules not installed")
+# row locks of concurrent transactions, e.g. skip_locked, are only tested against postgres
+requires_postgres = unittest.skipUnless(connection.vendor == "postgresql", "needs postgres")
+
+# faucet saves & claims bump the faucet index and refresh the recent claims in the shared cache
+shared_cache_settings = override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+        "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+    FAUCET_INDEX_CACHE="shared",
+    RECENT_CLAIMS_CACHE="shared",
+)
+
+OWNER_ADDRESSES = {
+    "mainnet": "bitcoincash:qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6a",
+    "chipnet": "bchtest:qpm2qsznhks23z7629mms6s4cwef74vcwvqcw003ap",
+}
+
+
+@requires_node_modules
+class FaucetScriptTestCase(SimpleTestCase):
+    def test_derived_addresses_match_node(self):
+        for network, owner_address in OWNER_ADDRESSES.items():
+            for passcode in ["a", "passcode", "1234567890"]:
+                for payout_satoshis in [1, 16, 127, 128, 1000, 100000, 2 ** 31 - 1]:
+                    contract_opts = dict(
+                        params=dict(passcode=passcode, payoutSats=payout_satoshis, ownerAddress=owner_address),
+                        options=dict(network=network),
+                    )
+                    with self.subTest(network=network, passcode=passcode, payout_satoshis=payout_satoshis):
+                        self.assertEqual(
+                            derive_contract_addresses(passcode, payout_satoshis, owner_address, network),
+                            ScriptFunctions.compileFaucetContract(contract_opts),
+                        )
+
+
+@requires_node_modules
+class ClaimTransactionTestCase(SimpleTestCase):
+    RECIPIENTS = [
+        "bitcoincash:qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6a",
+        "bitcoincash:ppm2qsznhks23z7629mms6s4cwef74vcwvn0h829pq",
+    ]
+
+    def test_claim_transaction_matches_node(self):
+        faucet = FaucetContract(
+            network="mainnet",
+            passcode="passcode",
+            payout_satoshis=1000,
+            owner_address=OWNER_ADDRESSES["mainnet"],
+        )
+        txid = "11" * 32
+        locktime = 900000
+
+        # with change, change at the dust limit, and no change output
+        for satoshis in [100000, 1000 + 300 + 546, 1000 + 300 + 545, 1000 + 300]:
+            for recipient in self.RECIPIENTS:
+                utxo = dict(txid=txid, vout=1, satoshis=satoshis)
+                result = ScriptFunctions.faucetClaim(dict(
+                    contractOpts=faucet.contract_opts,
+                    utxo=utxo,
+                    recipient=recipient,
+                    passcode=faucet.passcode,
+                    locktime=locktime,
+                ))
+                with self.subTest(satoshis=satoshis, recipient=recipient):
+                    self.assertTrue(result["success"])
+                    self.assertEqual(
+                        build_claim_transaction(faucet, utxo, recipient, faucet.passcode, locktime=locktime),
+                        result["transaction"],
+                    )
+
+
+@override_settings(CLAIM_RATE_LIMIT_PER_RECIPIENT=None, CLAIM_RATE_LIMIT_PER_FAUCET=None)
+class RateLimitTestCase(SimpleTestCase):
+    def setUp(self):
+        self.backend = MemoryRateLimitBackend()
+        self.faucet = FaucetContract(pk=1, max_claim_per_ip=3)
+
+    def test_limit_per_ip(self):
+        for _ in range(3):
+            self.assertIsNone(check_claim_rate_limits(self.faucet, "1.1.1.1", "recipient", backend=self.backend))
+        self.assertIsNotNone(check_claim_rate_limits(self.faucet, "1.1.1.1", "recipient", backend=self.backend))
+        self.assertIsNone(check_claim_rate_limits(self.faucet, "2.2.2.2", "recipient", backend=self.backend))
+
+    def test_rejected_claims_are_not_counted(self):
+        for _ in range(5):
+            check_claim_rate_limits(self.faucet, "1.1.1.1", "recipient", backend=self.backend)
+
+        rate_limit = ClaimRateLimit("ip", self.faucet, "1.1.1.1", 3, 24 * 60 * 60)
+        self.assertEqual(self.backend.hit(rate_limit), 4)
+
+    @override_settings(CLAIM_RATE_LIMIT_PER_RECIPIENT=(1, 60))
+    def test_limit_per_recipient(self):
+        self.assertIsNone(check_claim_rate_limits(self.faucet, "1.1.1.1", "recipient", backend=self.backend))
+        self.assertIsNotNone(check_claim_rate_limits(self.faucet, "2.2.2.2", "recipient", backend=self.backend))
+        # the ip hit is undone when the recipient limit is exceeded
+        self.assertIsNone(check_claim_rate_limits(self.faucet, "2.2.2.2", "other", backend=self.backend))
+
+    def test_sliding_window(self):
+        rate_limit = ClaimRateLimit("faucet", self.faucet, "", 10, 60)
+        for _ in range(10):
+            self.backend.hit(rate_limit, now=600)
+
+        # the previous window's hits are weighted by how much of it is in the last 60 seconds
+        self.assertEqual(self.backend.hit(rate_limit, now=660), 11)
+        self.assertEqual(self.backend.hit(rate_limit, now=690), 2 + 5)
+        self.assertEqual(self.backend.hit(rate_limit, now=720), 3)
+
+
+@override_settings(
+    CACHES={"recent-claims": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    RECENT_CLAIMS_CACHE="recent-claims",
+)
+class RecentClaimsTestCase(TransactionTestCase):
+    def setUp(self):
+        caches["recent-claims"].clear()
+
+    def create_claims(self, network, count):
+        try:
+            for index in range(count):
+                FaucetClaim.objects.create(
+                    network=network, txid=f"{index:064x}", recipient=f"{network}-{index}", satoshis=1000,
+                )
+        finally:
+            connection.close()
+
+    def test_cache_is_consistent_after_concurrent_claims(self):
+        # fill the cache before the claims so a stale feed would be served
+        self.assertEqual(get_recent_claims(), [])
+
+        threads = [
+            threading.Thread(target=self.create_claims, args=(network, 20))
+            for network in ["mainnet", "chipnet"] for _ in range(3)
+        ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        for network in [None, "mainnet", "chipnet"]:
+            with self.subTest(network=network):
+                with self.assertNumQueries(0):
+                    recent_claims = get_recent_claims(network)
+                self.assertEqual(recent_claims, query_recent_claims(network))
+
+    def test_new_claims_are_written_through_without_queries(self):
+        self.create_claims("chipnet", 3)
+        self.assertEqual(len(get_recent_claims()), 3)
+
+        claim = FaucetClaim.objects.create(network="chipnet", txid="ff" * 32, recipient="chipnet-new", satoshis=1000)
+        with self.assertNumQueries(0):
+            add_recent_claim(claim)
+            recent_claims = get_recent_claims()
+        self.assertEqual(recent_claims, query_recent_claims())
+        self.assertEqual(recent_claims[0]["recipient"], "chipnet-new")
+
+
+@override_settings(
+    CACHES={"shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    FAUCET_INDEX_CACHE="shared",
+    RECENT_CLAIMS_CACHE="shared",
+)
+class ClaimAccountingTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucet = FaucetContract.objects.create(
+            address="bchtest:faucet", network="chipnet", passcode="1234",
+            payout_satoshis=1000, owner_address="bchtest:owner",
+            max_claim_count=10,
+        )
+
+    def process_claim_jobs(self, jobs):
+        try:
+            for job in jobs:
+                process_claim_job(job)
+        finally:
+            connection.close()
+
+    def fake_claim(self, faucet, recipient, passcode, broadcast=True):
+        # every third claim fails to be sent and gives its slot back
+        if recipient.endswith("0"):
+            return False, "Broadcast failed"
+        return True, recipient.rjust(64, "0")
+
+    def test_concurrent_claims_do_not_go_over_max_claim_count(self):
+        jobs = [
+            enqueue_claim_job(self.faucet, f"bchtest:{index:03d}{index % 3}", "1234", processing=True)
+            for index in range(40)
+        ]
+        threads = [threading.Thread(target=self.process_claim_jobs, args=(jobs[index::8],)) for index in range(8)]
+        with mock.patch("main.utils.claim_jobs.faucet_claim", side_effect=self.fake_claim):
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+
+        self.faucet.refresh_from_db()
+        self.assertEqual(self.faucet.claim_count, 10)
+        self.assertEqual(FaucetClaim.objects.filter(faucet=self.faucet).count(), 10)
+        self.assertEqual(ClaimJob.objects.filter(status=ClaimJob.Status.success).count(), 10)
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+        "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+    FAUCET_INDEX_CACHE="shared",
+    RECENT_CLAIMS_CACHE="shared",
+)
+class ClaimStatsTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucet = FaucetContract.objects.create(
+            address="bchtest:faucet", network="chipnet", passcode="1234",
+            payout_satoshis=1000, owner_address="bchtest:owner",
+        )
+        for index in range(12):
+            FaucetClaim.objects.create(
+                faucet=self.faucet, network="chipnet", txid=f"{index:064x}", satoshis=1000,
+                recipient=f"bchtest:{index % 4}", ip=f"10.0.0.{index % 3}",
+            )
+
+    def get_stats(self):
+        return list(ClaimStats.objects.order_by("period", "bucket").values(
+            "period", "bucket", "claim_count", "satoshis", "unique_ips", "unique_recipients",
+        ))
+
+    def test_incremental_stats_match_backfill(self):
+        stats = self.get_stats()
+        self.assertEqual(stats[0]["claim_count"], 12)
+        self.assertEqual(stats[0]["unique_ips"], 3)
+        self.assertEqual(stats[0]["unique_recipients"], 4)
+
+        for period in ClaimStats.Period.values:
+            self.assertEqual(backfill_claim_stats(period), (0, 1))
+        self.assertEqual(self.get_stats(), stats)
+
+    def test_stats_endpoint_only_reads_rollups(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/stats/claims/", dict(period="day"))
+
+        self.assertEqual(response.json()["claim_count"], 12)
+        self.assertFalse([query for query in context.captured_queries if "main_faucetclaim" in query["sql"]])
+
+
+@override_settings(
+    CACHES={"shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    FAUCET_INDEX_CACHE="shared",
+    RECENT_CLAIMS_CACHE="shared",
+    CLAIM_EXPORT_CHUNK_SIZE=2,
+)
+class ClaimExportTestCase(TransactionTestCase):
+    def setUp(self):
+        for network in ["mainnet", "chipnet"]:
+            for index in range(3):
+                FaucetClaim.objects.create(
+                    network=network, txid=f"{index:064x}", recipient=f"{network}-{index}", satoshis=1000,
+                )
+
+    def test_csv_export(self):
+        claims = get_export_claims(network="chipnet")
+        rows = list(csv.DictReader(io.StringIO("".join(iter_claims_csv(claims)))))
+        self.assertEqual(list(rows[0]), EXPORT_FIELDS)
+        self.assertEqual([row["recipient"] for row in rows], ["chipnet-0", "chipnet-1", "chipnet-2"])
+
+    def test_jsonl_export(self):
+        lines = list(iter_claims_jsonl(get_export_claims()))
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(json.loads(lines[-1])["recipient"], "chipnet-2")
+
+    def test_export_command_writes_to_stdout(self):
+        stdout = io.StringIO()
+        call_command("export_claims", format="jsonl", network="mainnet", stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual([json.loads(line)["recipient"] for line in lines], ["mainnet-0", "mainnet-1", "mainnet-2"])
+
+
+@requires_postgres
+@shared_cache_settings
+class ClaimPartitionTestCase(TransactionTestCase):
+    def test_claims_in_the_default_partition_are_moved(self):
+        # a month past the partitions created ahead, its claims land in the default partition
+        created_at = timezone.now().replace(day=15) + relativedelta(years=2)
+        claim = FaucetClaim.objects.create(network="chipnet", txid="0" * 64, recipient="bchtest:recipient", satoshis=1000)
+        FaucetClaim.objects.filter(pk=claim.pk).update(created_at=created_at)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION_TABLE}")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+        names = add_claim_partitions(created_at, created_at)
+
+        self.assertEqual(len(names), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION_TABLE}")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute(f"SELECT COUNT(*) FROM {FaucetClaim._meta.db_table}_{names[0]}")
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(FaucetClaim.objects.get(pk=claim.pk).created_at, created_at)
+
+
+def create_faucet(**kwargs):
+    return FaucetContract.objects.create(**{
+        "address": "bchtest:faucet", "network": "chipnet", "passcode": "1234",
+        "payout_satoshis": 1000, "owner_address": "bchtest:owner",
+        **kwargs,
+    })
+
+
+@shared_cache_settings
+class FaucetUtxoTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucet = create_faucet()
+        self.utxos = [
+            FaucetUtxo.objects.create(faucet=self.faucet, txid=f"{index:064x}", vout=0, satoshis=satoshis)
+            for index, satoshis in enumerate([5000, 20000, 500])
+        ]
+
+    def test_reservations_are_exclusive(self):
+        first = reserve_faucet_utxo(self.faucet, 1300)
+        second = reserve_faucet_utxo(self.faucet, 1300)
+        self.assertEqual([first, second], self.utxos[:2])
+        self.assertIsNone(reserve_faucet_utxo(self.faucet, 1300))
+
+        release_faucet_utxo(first)
+        self.assertEqual(reserve_faucet_utxo(self.faucet, 1300), first)
+
+    @requires_postgres
+    def test_reservation_skips_locked_utxos(self):
+        locked = threading.Event()
+        done = threading.Event()
+
+        def lock_utxo():
+            try:
+                with transaction.atomic():
+                    FaucetUtxo.objects.select_for_update().get(pk=self.utxos[0].pk)
+                    locked.set()
+                    done.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=lock_utxo)
+        thread.start()
+        try:
+            locked.wait(10)
+            self.assertEqual(reserve_faucet_utxo(self.faucet, 1300), self.utxos[1])
+        finally:
+            done.set()
+            thread.join()
+
+    def test_expired_reservation_is_reused(self):
+        utxo = reserve_faucet_utxo(self.faucet, 1300)
+        self.assertNotEqual(reserve_faucet_utxo(self.faucet, 1300), utxo)
+
+        expired_at = timezone.now() - timezone.timedelta(seconds=settings.FAUCET_UTXO_RESERVATION_TIMEOUT + 1)
+        FaucetUtxo.objects.filter(pk=utxo.pk).update(reserved_at=expired_at)
+        self.assertEqual(reserve_faucet_utxo(self.faucet, 1300), utxo)
+
+    def test_sync_keeps_utxos_within_grace_period(self):
+        old = self.utxos[0]
+        FaucetUtxo.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timezone.timedelta(seconds=settings.FAUCET_UTXO_SYNC_GRACE_PERIOD + 1),
+        )
+        spent = self.utxos[1]
+        FaucetUtxo.objects.filter(pk=spent.pk).update(spent_txid="ff" * 32, spent_at=timezone.now())
+
+        # watchtower has not indexed the recent utxos yet, and still lists the one just spent
+        wt_api = mock.Mock()
+        wt_api.get_bch_utxos.return_value = [
+            dict(txid=spent.txid, vout=spent.vout, satoshis=spent.satoshis),
+            dict(txid="ee" * 32, vout=1, satoshis=7000),
+        ]
+        with mock.patch("main.utils.faucet_utxos.get_watchtower", return_value=wt_api):
+            self.assertEqual(sync_faucet_utxos(self.faucet), 2)
+
+        utxos = FaucetUtxo.objects.filter(faucet=self.faucet)
+        self.assertFalse(utxos.filter(pk=old.pk).exists())
+        self.assertTrue(utxos.filter(pk=spent.pk, spent_txid="ff" * 32).exists())
+        self.assertEqual(
+            set(utxos.filter(spent_txid__isnull=True).values_list("txid", flat=True)),
+            {self.utxos[2].txid, "ee" * 32},
+        )
+
+
+def fake_build_claim(obj, utxo, recipient, passcode):
+    # a unique "transaction" per spent utxo, only its hash is used
+    return True, f"{utxo['txid']}{utxo['vout']:08x}"
+
+
+@shared_cache_settings
+class ClaimChainTestCase(TransactionTestCase):
+    """
+        A faucet with a single utxo, each claim spends the change of the previous one
+    """
+    def setUp(self):
+        self.faucet = create_faucet()
+        FaucetUtxo.objects.create(faucet=self.faucet, txid="aa" * 32, vout=0, satoshis=100000)
+
+        self.wt_api = mock.Mock()
+        self.wt_api.broadcast.side_effect = lambda tx_hex: time.sleep(0.2)
+        patches = [
+            mock.patch("main.utils.faucet_contract.build_claim", side_effect=fake_build_claim),
+            mock.patch("main.utils.async_claims.build_claim", side_effect=fake_build_claim),
+            mock.patch("main.utils.faucet_contract.get_watchtower", return_value=self.wt_api),
+            mock.patch("main.utils.faucet_utxos.get_watchtower", return_value=self.wt_api),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def assertClaimsChained(self, results):
+        self.assertTrue(all(success for success, _ in results), results)
+        self.wt_api.find_bch_utxo.assert_not_called()
+
+        # every claim spent the change output of the claim before it
+        utxos = FaucetUtxo.objects.filter(faucet=self.faucet)
+        self.assertEqual(utxos.filter(spent_txid__isnull=True).count(), 1)
+        for _, txid in results:
+            self.assertTrue(utxos.filter(txid=txid, vout=1).exists())
+
+    def claim(self, results):
+        try:
+            results.append(faucet_claim(self.faucet, "bchtest:recipient", "1234"))
+        finally:
+            connection.close()
+
+    def test_back_to_back_claims_spend_the_change(self):
+        results = []
+        for _ in range(3):
+            self.claim(results)
+        self.assertClaimsChained(results)
+        self.assertEqual(self.wt_api.broadcast.call_count, 3)
+
+    def test_reservation_is_committed_before_broadcasting(self):
+        def broadcast(tx_hex):
+            self.assertFalse(connection.in_atomic_block)
+            self.assertTrue(FaucetUtxo.objects.filter(reserved_at__isnull=False, spent_txid__isnull=True).exists())
+
+        self.wt_api.broadcast.side_effect = broadcast
+        self.assertTrue(faucet_claim(self.faucet, "bchtest:recipient", "1234")[0])
+
+    @requires_postgres
+    def test_concurrent_claims_wait_for_the_change(self):
+        results = []
+        threads = [threading.Thread(target=self.claim, args=(results,)) for _ in range(3)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertClaimsChained(results)
+
+    def test_concurrent_async_claims_wait_for_the_change(self):
+        async def broadcast(tx_hex):
+            await asyncio.sleep(0.2)
+
+        async_wt_api = mock.Mock()
+        async_wt_api.broadcast.side_effect = broadcast
+        async_wt_api.find_bch_utxo = self.wt_api.find_bch_utxo
+
+        async def claim():
+            return await async_faucet_claim(self.faucet, "bchtest:recipient", "1234", async_wt_api)
+
+        async def claims():
+            results = await asyncio.gather(*[claim() for _ in range(3)])
+            # idle chains are dropped
+            self.assertIsNone(get_claim_chain(self.faucet, create=False))
+            return results
+
+        self.assertClaimsChained(asyncio.run(claims()))
+
+
+@shared_cache_settings
+class FaucetUtxoPlanTestCase(TransactionTestCase):
+    def setUp(self):
+        # 1300 satoshis per claim
+        self.faucet = create_faucet()
+
+    def add_utxos(self, *satoshis_list):
+        return [
+            FaucetUtxo.objects.create(faucet=self.faucet, txid=f"{index:064x}", vout=0, satoshis=satoshis)
+            for index, satoshis in enumerate(satoshis_list)
+        ]
+
+    def test_split_into_claim_sized_utxos(self):
+        utxos = self.add_utxos(100000)
+        plan = plan_faucet_utxos(self.faucet, target_count=4)
+        self.assertEqual(plan["action"], "split")
+        self.assertEqual(plan["utxos"], utxos)
+        # (100000 - fee of 1 input & 4 outputs) // (4 * 1300) claims per utxo, the 4th output is the rest
+        self.assertEqual(plan["output_satoshis"], [19 * 1300] * 3)
+
+    def test_split_is_limited_by_the_balance(self):
+        self.add_utxos(5000)
+        plan = plan_faucet_utxos(self.faucet, target_count=10)
+        self.assertEqual(plan["target_count"], 3)
+        self.assertEqual(plan["output_satoshis"], [1300, 1300])
+
+        self.assertIsNone(plan_faucet_utxos(self.faucet, target_count=1))
+
+    def test_consolidate_dust_above_the_dust_floor(self):
+        utxos = self.add_utxos(500, 600, 700)
+        plan = plan_faucet_utxos(self.faucet, target_count=1)
+        self.assertEqual(plan["action"], "consolidate")
+        self.assertEqual(set(plan["utxos"]), set(utxos))
+
+    def test_dust_below_the_dust_floor_is_left_alone(self):
+        # 500 satoshis minus the fee of 2 inputs & 1 output is below the dust limit
+        self.add_utxos(250, 250)
+        self.assertIsNone(plan_faucet_utxos(self.faucet, target_count=1))
+
+    def test_target_count_follows_the_peak_claim_rate(self):
+        self.assertEqual(get_target_utxo_count(self.faucet), 1)
+
+        minute = timezone.now().replace(second=0, microsecond=0) - timezone.timedelta(minutes=10)
+        for index in range(40):
+            claim = FaucetClaim.objects.create(
+                faucet=self.faucet, network="chipnet", txid=f"{index:064x}", recipient="bchtest:recipient", satoshis=1000,
+            )
+            # 30 claims in the peak minute, 10 in the next
+            created_at = minute + timezone.timedelta(minutes=index // 30, seconds=index % 30)
+            FaucetClaim.objects.filter(pk=claim.pk).update(created_at=created_at)
+
+        # 30 claims a minute, each holding a utxo for FAUCET_FANOUT_UTXO_BUSY_SECONDS
+        with self.settings(FAUCET_FANOUT_UTXO_BUSY_SECONDS=5):
+            self.assertEqual(get_target_utxo_count(self.faucet), 3)
+        with self.settings(FAUCET_FANOUT_UTXO_BUSY_SECONDS=5, FAUCET_FANOUT_MAX_OUTPUTS=2):
+            self.assertEqual(get_target_utxo_count(self.faucet), 2)
+
+
+@shared_cache_settings
+class ClaimJobTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucet = create_faucet()
+        self.jobs = [enqueue_claim_job(self.faucet, f"bchtest:{index}", "1234") for index in range(20)]
+
+    def take_jobs(self, taken):
+        try:
+            while True:
+                job = get_next_claim_job()
+                if not job: break
+                taken.append(job.pk)
+        finally:
+            connection.close()
+
+    def test_jobs_are_taken_oldest_first(self):
+        job = get_next_claim_job()
+        self.assertEqual(job, self.jobs[0])
+        self.assertEqual(job.status, ClaimJob.Status.processing)
+        self.assertEqual(get_next_claim_job(), self.jobs[1])
+
+    @requires_postgres
+    def test_concurrent_workers_take_a_job_once(self):
+        taken = []
+        threads = [threading.Thread(target=self.take_jobs, args=(taken,)) for _ in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(sorted(taken), sorted(job.pk for job in self.jobs))
+
+    def test_stale_processing_jobs_are_failed(self):
+        stale_job, job = get_next_claim_job(), get_next_claim_job()
+        stale_time = timezone.now() - timezone.timedelta(seconds=settings.CLAIM_JOB_STALE_TIMEOUT + 1)
+        ClaimJob.objects.filter(pk=stale_job.pk).update(started_at=stale_time)
+
+        self.assertEqual(fail_stale_claim_jobs(), 1)
+        stale_job.refresh_from_db()
+        self.assertEqual(stale_job.status, ClaimJob.Status.failed)
+        self.assertEqual(ClaimJob.objects.get(pk=job.pk).status, ClaimJob.Status.processing)
+        self.assertEqual(ClaimJob.objects.filter(status=ClaimJob.Status.pending).count(), 18)
+
+    def test_status_endpoint(self):
+        job = self.jobs[0]
+        response = self.client.get(f"/claim/status/{job.uuid}/")
+        self.assertEqual(response.json()["status"], ClaimJob.Status.pending)
+        self.assertFalse(response.json()["done"])
+
+        ClaimJob.objects.filter(pk=job.pk).update(status=ClaimJob.Status.success, txid="ab" * 32)
+        response = self.client.get(f"/claim/status/{job.uuid}/")
+        self.assertTrue(response.json()["done"])
+        self.assertEqual(response.json()["txid"], "ab" * 32)
+
+        self.assertEqual(self.client.get(f"/claim/status/{uuid.uuid4()}/").status_code, 404)
+
+
+@shared_cache_settings
+class AsyncWatchtowerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucet = create_faucet()
+        self.utxo = FaucetUtxo.objects.create(faucet=self.faucet, txid="aa" * 32, vout=0, satoshis=100000)
+
+    def test_failed_broadcast_releases_the_utxo(self):
+        def refuse(request):
+            raise httpx.ConnectError("Connection refused", request=request)
+
+        async def claim():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(refuse)) as client:
+                wt_api = AsyncWatchtower(network="chipnet", client=client)
+                return await async_faucet_claim(self.faucet, "bchtest:recipient", "1234", wt_api)
+
+        with mock.patch("main.utils.async_claims.build_claim", side_effect=fake_build_claim), \
+                self.settings(WATCHTOWER_MAX_RETRIES=0):
+            success, error = asyncio.run(claim())
+
+        self.assertFalse(success)
+        self.assertIn("Connection refused", error)
+        self.utxo.refresh_from_db()
+        self.assertIsNone(self.utxo.reserved_at)
+
+    @override_settings(WATCHTOWER_MAX_RETRIES=1, WATCHTOWER_RETRY_BACKOFF=0, WATCHTOWER_CIRCUIT_BREAKER_THRESHOLD=2)
+    def test_circuit_breaker_fails_fast(self):
+        requests = []
+        def unavailable(request):
+            requests.append(request)
+            return httpx.Response(503)
+
+        async def get_balance():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(unavailable)) as client:
+                wt_api = AsyncWatchtower(network="chipnet", client=client)
+                # retried once, then the failed response is returned
+                with self.assertRaises(WatchtowerException) as context:
+                    await wt_api.get_balance("bchtest:address")
+                self.assertNotIsInstance(context.exception, WatchtowerUnavailable)
+
+                with self.assertRaises(WatchtowerUnavailable):
+                    await wt_api.get_balance("bchtest:address")
+                return wt_api
+
+        wt_api = asyncio.run(get_balance())
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(wt_api.stats.get_stats()["errors"], 2)
+        self.assertEqual(wt_api.stats.get_stats()["retries"], 1)
+        self.assertEqual(wt_api.stats.get_stats()["rejected"], 1)
+
+    def test_shared_client_per_network(self):
+        async def get_clients():
+            return get_async_watchtower("chipnet"), get_async_watchtower("chipnet"), get_async_watchtower("mainnet")
+
+        chipnet, shared_chipnet, mainnet = asyncio.run(get_clients())
+        self.assertIs(chipnet, shared_chipnet)
+        self.assertIsNot(chipnet, mainnet)
+        self.assertIs(chipnet.circuit_breaker, get_watchtower("chipnet").circuit_breaker)
+
+
+class UtxoStreamTestCase(SimpleTestCase):
+    UTXOS = [
+        dict(txid=f"{index:064x}", vout=index, value=satoshis, memo="₿ ünïcödé")
+        for index, satoshis in enumerate([500, 1200, 50000, 2000])
+    ]
+    RESPONSE = json.dumps(dict(address="bchtest:faucet", utxos=UTXOS), ensure_ascii=False).encode()
+
+    def split(self, data:bytes, size:int):
+        return [data[index:index + size] for index in range(0, len(data), size)]
+
+    def test_items_across_any_chunk_boundary(self):
+        # chunks of 1 & 2 bytes split the multibyte characters
+        for size in [1, 2, 3, 7, 64, len(self.RESPONSE)]:
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_json_array_items(self.split(self.RESPONSE, size), "utxos")), self.UTXOS)
+
+    def test_malformed_response_raises(self):
+        responses = [
+            b'{"address": "bchtest:faucet"}',
+            self.RESPONSE[:-20],
+            b'{"utxos": [{"txid": "aa", "vout": 0,, "value": 1}]}',
+        ]
+        for response in responses:
+            with self.subTest(response=response):
+                with self.assertRaises(UtxoStreamError):
+                    list(iter_json_array_items(self.split(response, 5), "utxos"))
+
+    def test_stops_reading_at_the_first_match(self):
+        read_chunks = []
+        def chunks():
+            for chunk in self.split(self.RESPONSE, 16):
+                read_chunks.append(chunk)
+                yield chunk
+
+        utxos = (Utxo.from_watchtower(data) for data in iter_json_array_items(chunks(), "utxos"))
+        utxo = first_matching(utxos, min_satoshis=1000, exclude={(self.UTXOS[1]["txid"], 1)})
+        self.assertEqual((utxo.txid, utxo.satoshis), (self.UTXOS[2]["txid"], 50000))
+
+        end_of_match = self.RESPONSE.index(b"}", self.RESPONSE.index(self.UTXOS[2]["txid"].encode())) + 1
+        self.assertLess(len(b"".join(read_chunks)), end_of_match + 16)
+        self.assertLess(len(b"".join(read_chunks)), len(self.RESPONSE))
+
+
+@shared_cache_settings
+class FaucetIndexTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucet = create_faucet(max_claim_count=10)
+
+    def get_form(self, passcode):
+        form = FaucetForm(dict(network="chipnet", address=OWNER_ADDRESSES["chipnet"], passcode=passcode))
+        del form.fields["captcha"]
+        return form
+
+    def test_bad_passcode_is_rejected_without_queries(self):
+        self.assertTrue(self.get_form("1234").is_valid())
+
+        with self.assertNumQueries(0):
+            form = self.get_form("4321")
+            self.assertFalse(form.is_valid())
+        self.assertIn("Invalid passcode for available faucets", form.non_field_errors())
+
+    def test_version_bump_rebuilds_the_index(self):
+        faucet_index = get_faucet_index()
+        self.assertEqual(faucet_index.lookup("chipnet", "1234"), [self.faucet.pk])
+
+        # queryset updates skip the signals, the index is stale until the version is bumped
+        FaucetContract.objects.filter(pk=self.faucet.pk).update(passcode="4321")
+        with self.assertNumQueries(0):
+            self.assertEqual(faucet_index.lookup("chipnet", "1234"), [self.faucet.pk])
+
+        bump_faucet_index_version()
+        self.assertEqual(faucet_index.lookup("chipnet", "1234"), [])
+        self.assertEqual(faucet_index.lookup("chipnet", "4321"), [self.faucet.pk])
+
+        # saves bump the version once committed
+        other = create_faucet(address="bchtest:other", passcode="5678", max_claim_count=1)
+        self.assertEqual(faucet_index.lookup("chipnet", "5678"), [other.pk])
+
+
+@shared_cache_settings
+class FaucetBalanceTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucets = [
+            create_faucet(address=f"bchtest:faucet{index}", balance_satoshis=5000) for index in range(3)
+        ]
+
+    def get_balance(self, faucet):
+        return FaucetContract.objects.get(pk=faucet.pk).balance_satoshis
+
+    def test_adjusted_balance_does_not_go_below_zero(self):
+        faucet = self.faucets[0]
+        adjust_faucet_balance(faucet, -1300)
+        self.assertEqual(self.get_balance(faucet), 3700)
+        adjust_faucet_balance(faucet, -10000)
+        self.assertEqual(self.get_balance(faucet), 0)
+        adjust_faucet_balance(faucet, 2000)
+        self.assertEqual(self.get_balance(faucet), 2000)
+
+        # an unknown balance is left for the next refresh
+        FaucetContract.objects.filter(pk=faucet.pk).update(balance_satoshis=None)
+        adjust_faucet_balance(faucet, 2000)
+        self.assertIsNone(self.get_balance(faucet))
+
+    def test_refresh_requests_are_coalesced(self):
+        def fetch_balance(obj):
+            if obj.address == "bchtest:faucet2": raise Exception("Watchtower is down")
+            return 7000
+
+        for faucet in self.faucets[:2] * 5 + self.faucets[2:]:
+            request_balance_refresh(faucet)
+
+        with mock.patch("main.utils.bulk_actions.fetch_faucet_balance", side_effect=fetch_balance) as fetch:
+            # requests are only due after FAUCET_BALANCE_REFRESH_DELAY
+            self.assertEqual(refresh_faucet_balances(), 0)
+            with self.settings(FAUCET_BALANCE_REFRESH_DELAY=0):
+                self.assertEqual(refresh_faucet_balances(), 3)
+                self.assertEqual(refresh_faucet_balances(), 1)
+
+        self.assertEqual(fetch.call_count, 4)
+        self.assertEqual([self.get_balance(faucet) for faucet in self.faucets], [7000, 7000, 5000])
+        # the failed refresh is requested again
+        self.assertEqual(
+            list(FaucetContract.objects.filter(balance_refresh_requested_at__isnull=False).values_list("pk", flat=True)),
+            [self.faucets[2].pk],
+        )
+
+
+@shared_cache_settings
+class WebhookEventTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucet = create_faucet(balance_satoshis=5000)
+
+    def post_webhook(self, data):
+        return self.client.post("/api/watchtower/webhook/", json.dumps(data), content_type="application/json")
+
+    def test_replayed_output_is_applied_once(self):
+        data = dict(address=self.faucet.address, txid="aa" * 32, index=0, value=2000)
+        self.post_webhook(data)
+        self.post_webhook(dict(data, senders=["bchtest:sender"]))
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(process_webhook_events(), 1)
+
+        # replayed after being processed
+        self.post_webhook(data)
+        self.assertEqual(process_webhook_events(), 0)
+
+        self.faucet.refresh_from_db()
+        self.assertEqual(self.faucet.balance_satoshis, 7000)
+        self.assertEqual(FaucetUtxo.objects.filter(faucet=self.faucet, txid="aa" * 32, vout=0).count(), 1)
+
+    def test_payloads_of_other_addresses_are_not_stored(self):
+        for index in range(3):
+            response = self.post_webhook(dict(address="bchtest:other", txid=f"{index:064x}", index=0, value=1000))
+            self.assertEqual(response.json(), dict(acknowledged=True))
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+@shared_cache_settings
+class BulkActionTestCase(TransactionTestCase):
+    def setUp(self):
+        self.faucets = [create_faucet(address=f"bchtest:faucet{index}") for index in range(6)]
+
+    def test_run_concurrently_keeps_the_order_and_bounds_the_threads(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def call(number):
+            with lock:
+                running.append(number)
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(number)
+            if number % 3 == 0: raise ValueError(f"{number} failed")
+            return number * 2
+
+        results = run_concurrently(list(range(1, 10)), call, max_workers=3)
+        self.assertEqual(results, [
+            (number, False, f"{number} failed") if number % 3 == 0 else (number, True, number * 2)
+            for number in range(1, 10)
+        ])
+        self.assertEqual(max(max_running), 3)
+
+    def test_results_are_saved_in_bulk(self):
+        def fetch_balance(obj):
+            if obj.address.endswith("3"): raise Exception("Watchtower is down")
+            return int(obj.address[-1]) * 1000
+
+        with mock.patch("main.utils.bulk_actions.fetch_faucet_balance", side_effect=fetch_balance):
+            with CaptureQueriesContext(connection) as context:
+                result = update_faucet_balances(self.faucets)
+
+        self.assertEqual(result.summary, "Update balance: 5/6 succeeded, 1 failed")
+        updates = [query for query in context.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        balances = dict(FaucetContract.objects.values_list("address", "balance_satoshis"))
+        self.assertEqual(balances, {
+            faucet.address: None if index == 3 else index * 1000 for index, faucet in enumerate(self.faucets)
+        })
+        self.assertEqual(FaucetContract.objects.filter(balance_updated_at__isnull=False).count(), 5)
+
+        def subscribe(obj):
+            return not obj.address.endswith("0"), "Rejected"
+
+        with mock.patch("main.utils.bulk_actions.subscribe_faucet_contract", side_effect=subscribe):
+            result = subscribe_faucets(self.faucets)
+        self.assertEqual(result.failed, [(self.faucets[0], "Rejected")])
+        self.assertEqual(FaucetContract.objects.filter(subscribed=True).count(), 5)
+
+
+@shared_cache_settings
+class FaucetContractAdminTestCase(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_superuser("admin", password="admin")
+        self.client.force_login(user)
+        self.faucet = create_faucet(max_claim_count=10)
+
+    def test_edit_keeps_claims_taken_while_the_page_was_open(self):
+        url = f"/admin/main/faucetcontract/{self.faucet.pk}/change/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(reserve_claim_slot(self.faucet))
+
+        # the stale values of the page, only the passcode is edited
+        response = self.client.post(url, {
+            "address": self.faucet.address, "network": "chipnet", "passcode": "5678",
+            "payout_satoshis": 1000, "owner_address": self.faucet.owner_address,
+            "claim_count": 0, "max_claim_count": 10, "max_claim_per_ip": "",
+            "balance_satoshis": 5000,
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.faucet.refresh_from_db()
+        self.assertEqual(self.faucet.passcode, "5678")
+        self.assertEqual(self.faucet.claim_count, 1)
+        self.assertIsNone(self.faucet.balance_satoshis)
+
+
+class FaucetProvisioningTestCase(SimpleTestCase):
+    ROW = dict(
+        network="chipnet", passcode="1234", payout_satoshis="1000",
+        owner_address=OWNER_ADDRESSES["chipnet"], max_claim_count="100", max_claim_per_ip="",
+    )
+
+    def test_valid_row(self):
+        obj = parse_faucet_row(self.ROW)
+        self.assertEqual((obj.payout_satoshis, obj.max_claim_count, obj.max_claim_per_ip), (1000, 100, None))
+
+    def test_invalid_rows(self):
+        invalid_rows = [
+            ("Missing passcode", dict(passcode="")),
+            ("Invalid network", dict(network="testnet")),
+            ("Owner address is not a chipnet address", dict(owner_address=OWNER_ADDRESSES["mainnet"])),
+            ("Owner address is not a mainnet address", dict(network="mainnet")),
+            ("Invalid owner address", dict(owner_address="bchtest:invalid")),
+            ("Passcode must be at most 10 characters", dict(passcode="12345678901")),
+            ("Invalid number", dict(payout_satoshis="1000.5")),
+            ("Invalid number", dict(max_claim_count="ten")),
+            ("Payout satoshis must be positive", dict(payout_satoshis="-1")),
+        ]
+        for error, fields in invalid_rows:
+            with self.subTest(fields=fields):
+                with self.assertRaisesMessage(FaucetRowError, error):
+                    parse_faucet_row(dict(self.ROW, **fields))
+
+
+@shared_cache_settings
+@override_settings(WATCHTOWER_SUBSCRIPTION_BACKOFF=10, WATCHTOWER_SUBSCRIPTION_MAX_BACKOFF=3600)
+class SubscriptionOutboxTestCase(TransactionTestCase):
+    def setUp(self):
+        # saving a faucet queues its subscription
+        self.faucets = [create_faucet(address=f"bchtest:faucet{index}") for index in range(4)]
+
+    def test_retry_delay_is_capped(self):
+        with mock.patch("main.utils.subscriptions.random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual([get_retry_delay(attempts) for attempts in [1, 2, 3, 20]], [10, 20, 40, 3600])
+
+        for attempts in [1, 5, 20]:
+            delay = min(10 * 2 ** (attempts - 1), 3600)
+            self.assertTrue(delay / 2 <= get_retry_delay(attempts) <= delay)
+
+    def test_leased_subscriptions_are_taken_once(self):
+        self.assertEqual(len(take_due_subscriptions(3)), 3)
+        subscriptions = take_due_subscriptions(10)
+        self.assertEqual(len(subscriptions), 1)
+        self.assertEqual(take_due_subscriptions(10), [])
+
+        # the lease of a dispatcher that died expires
+        WatchtowerSubscription.objects.filter(pk=subscriptions[0].pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(take_due_subscriptions(10), subscriptions)
+
+    def test_dispatch_records_delivered_and_failed_subscriptions(self):
+        def subscribe(obj):
+            if obj.address.endswith("0"): return False, "Rejected"
+            return True, None
+
+        with mock.patch("main.utils.bulk_actions.subscribe_faucet_contract", side_effect=subscribe):
+            result = dispatch_subscriptions()
+            self.assertEqual(result.summary, "Subscribe: 3/4 succeeded, 1 failed")
+            # the failed one is retried after the backoff
+            self.assertIsNone(dispatch_subscriptions())
+
+        delivered = WatchtowerSubscription.objects.filter(delivered_at__isnull=False)
+        self.assertEqual(delivered.count(), 3)
+        self.assertFalse(delivered.filter(last_error__isnull=False).exists())
+
+        failed = WatchtowerSubscription.objects.get(delivered_at__isnull=True)
+        self.assertEqual((failed.faucet_id, failed.attempts, failed.last_error), (self.faucets[0].pk, 1, "Rejected"))
+        self.assertGreater(failed.next_attempt_at, timezone.now() + timezone.timedelta(seconds=4))
+        self.assertEqual(FaucetContract.objects.filter(subscribed=True).count(), 3)
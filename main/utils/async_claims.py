@@ -0,0 +1,114 @@
+from asgiref.sync import sync_to_async
+
+from main.apps import LOGGER
+from main.models import ClaimJob, FaucetContract, FaucetUtxo
+
+from .claim_jobs import finish_claim_job, record_claim, release_claim_slot, reserve_claim_slot
+from .crypto import get_tx_hash
+from .faucet_balance import record_claim_balance, request_balance_refresh
+from .faucet_contract import build_claim
+from .faucet_utxos import (
+    apply_watchtower_utxos,
+    async_reserve_chained_faucet_utxo,
+    get_claim_chain,
+    known_claimable_outpoints,
+    record_claim_broadcast,
+    release_faucet_utxo,
+    reserve_faucet_utxo,
+    reserve_found_utxo,
+)
+from .watchtower_api_async import AsyncWatchtower, WatchtowerException, get_async_watchtower
+
+
+async def async_sync_faucet_utxos(obj:FaucetContract, wt_api:AsyncWatchtower):
+    utxos = await wt_api.get_bch_utxos(obj.address, parse="cashscript")
+    return await sync_to_async(apply_watchtower_utxos)(obj, utxos)
+
+
+async def async_faucet_claim(obj:FaucetContract, recipient:str, passcode:str, wt_api:AsyncWatchtower):
+    """
+        Same as faucet_claim, but watchtower calls and waiting for chained utxos don't hold a thread
+        Returns (success, error_or_txid)
+    """
+    LOGGER.debug(f"Claim | {obj} | {recipient}")
+    min_satoshis = obj.payout_satoshis + obj.claim_tx_fee
+    reserve = sync_to_async(reserve_faucet_utxo)
+
+    utxo = await reserve(obj, min_satoshis)
+    if not utxo:
+        utxo = await async_reserve_chained_faucet_utxo(obj, min_satoshis)
+
+    if not utxo:
+        exclude = await sync_to_async(known_claimable_outpoints)(obj, min_satoshis)
+        found_utxo = await wt_api.find_bch_utxo(obj.address, min_satoshis, exclude=exclude)
+        if found_utxo:
+            utxo = await sync_to_async(reserve_found_utxo)(obj, found_utxo)
+
+    if not utxo:
+        return False, "Not enough funds to claim"
+
+    chain = get_claim_chain(obj)
+    chain.start(obj, utxo)
+    try:
+        return await async_send_claim(obj, utxo, recipient, passcode, wt_api)
+    finally:
+        await chain.finish(utxo)
+
+
+async def async_send_claim(obj:FaucetContract, utxo:FaucetUtxo, recipient:str, passcode:str, wt_api:AsyncWatchtower):
+    """
+        Same as send_claim
+        Returns (success, error_or_txid)
+    """
+    release = sync_to_async(release_faucet_utxo)
+    try:
+        # may call node, run it off the thread used for database calls
+        success, error_or_transaction = await sync_to_async(build_claim, thread_sensitive=False)(
+            obj, utxo.cashscript_utxo, recipient, passcode,
+        )
+    except Exception:
+        await release(utxo)
+        raise
+
+    if not success:
+        await release(utxo)
+        return False, error_or_transaction
+
+    transaction = error_or_transaction
+    txid = get_tx_hash(transaction)
+    try:
+        LOGGER.debug(f"Broadcasting claim TX | {transaction}")
+        await wt_api.broadcast(transaction)
+    except WatchtowerException as exception:
+        await release(utxo)
+        try:
+            await async_sync_faucet_utxos(obj, wt_api)
+        except WatchtowerException as sync_exception:
+            LOGGER.exception(sync_exception)
+        return False, f"{exception}"
+
+    await sync_to_async(record_claim_broadcast)(obj, utxo, txid)
+    return True, txid
+
+
+async def async_process_claim_job(job:ClaimJob):
+    faucet = await sync_to_async(FaucetContract.objects.get)(pk=job.faucet_id)
+    if not await sync_to_async(reserve_claim_slot)(faucet):
+        return await sync_to_async(finish_claim_job)(job, error="Faucet is no longer claimable")
+
+    wt_api = get_async_watchtower(faucet.network)
+    try:
+        success, error_or_txid = await async_faucet_claim(faucet, job.recipient, job.passcode, wt_api)
+    except Exception as exception:
+        LOGGER.exception(exception)
+        await sync_to_async(release_claim_slot)(faucet)
+        return await sync_to_async(finish_claim_job)(job, error="Claim failed")
+
+    if not success:
+        await sync_to_async(release_claim_slot)(faucet)
+        return await sync_to_async(finish_claim_job)(job, error=f"Claim failed: {error_or_txid}")
+
+    await sync_to_async(record_claim)(faucet, job, error_or_txid)
+    await sync_to_async(record_claim_balance)(faucet)
+    await sync_to_async(request_balance_refresh)(faucet)
+    return job
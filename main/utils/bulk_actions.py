@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+from main.apps import LOGGER
+from main.models import FaucetContract
+
+from .faucet_contract import fetch_faucet_balance, subscribe_faucet_contract
+
+
+class BulkActionResult:
+    """
+        Outcome of a bulk action, `results` has (obj, success, message) in the order of the objs
+    """
+    def __init__(self, action:str, results:list):
+        self.action = action
+        self.results = results
+
+    @property
+    def succeeded(self):
+        return [obj for obj, success, _ in self.results if success]
+
+    @property
+    def failed(self):
+        return [(obj, message) for obj, success, message in self.results if not success]
+
+    @property
+    def summary(self):
+        return f"{self.action}: {len(self.succeeded)}/{len(self.results)} succeeded, {len(self.failed)} failed"
+
+
+def run_concurrently(objs:list, func, max_workers:int=None):
+    """
+        Calls `func(obj)` for each obj in a bounded thread pool
+        `func` must not use the database, threads don't share the request's connection
+        Returns a list of (obj, success, result_or_error) in the order of objs
+    """
+    if max_workers is None: max_workers = settings.BULK_ACTION_MAX_WORKERS
+
+    def call(obj):
+        try:
+            return obj, True, func(obj)
+        except Exception as exception:
+            LOGGER.exception(exception)
+            return obj, False, f"{exception}"
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(call, objs))
+
+
+def subscribe_faucets(objs:list, max_workers:int=None):
+    def subscribe(obj):
+        success, error = subscribe_faucet_contract(obj)
+        if not success: raise Exception(error or "Failed to subscribe")
+        return "Subscribed"
+
+    results = run_concurrently(objs, subscribe, max_workers=max_workers)
+    subscribed = [obj for obj, success, _ in results if success]
+    for obj in subscribed:
+        obj.subscribed = True
+    FaucetContract.objects.bulk_update(subscribed, ["subscribed"], batch_size=settings.BULK_ACTION_BATCH_SIZE)
+    return BulkActionResult("Subscribe", results)
+
+
+def update_faucet_balances(objs:list, max_workers:int=None):
+    results = run_concurrently(objs, fetch_faucet_balance, max_workers=max_workers)
+
+    updated = []
+    now = timezone.now()
+    for obj, success, balance_satoshis in results:
+        if not success: continue
+        obj.balance_satoshis = balance_satoshis
+        obj.balance_updated_at = now
+        updated.append(obj)
+
+    FaucetContract.objects.bulk_update(
+        updated, ["balance_satoshis", "balance_updated_at"], batch_size=settings.BULK_ACTION_BATCH_SIZE,
+    )
+    return BulkActionResult(
+        "Update balance",
+        [(obj, success, f"{result} sats" if success else result) for obj, success, result in results],
+    )
+
+
+BULK_ACTIONS = {
+    "subscribe": subscribe_faucets,
+    "update_balance": update_faucet_balances,
+}
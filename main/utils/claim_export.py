@@ -0,0 +1,61 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from main.models import FaucetClaim
+
+EXPORT_FIELDS = ["id", "faucet_id", "network", "txid", "recipient", "satoshis", "ip", "created_at"]
+
+
+class Echo:
+    """
+        File-like object for csv.writer that returns the line instead of buffering it
+    """
+    def write(self, value):
+        return value
+
+
+def get_export_claims(queryset=None, faucet_ids:list=None, network:str=None, since=None, until=None):
+    """
+        Claims to export as dicts of EXPORT_FIELDS, oldest first
+        `queryset` e.g. the admin's filtered claims, all claims if not set
+    """
+    claims = FaucetClaim.objects.all() if queryset is None else queryset
+    if faucet_ids: claims = claims.filter(faucet_id__in=faucet_ids)
+    if network: claims = claims.filter(network=network)
+    if since: claims = claims.filter(created_at__gte=since)
+    if until: claims = claims.filter(created_at__lt=until)
+
+    # ordered by the (created_at, id) index so rows are streamed without sorting the whole range
+    return claims.select_related(None).order_by("created_at", "id").values(*EXPORT_FIELDS)
+
+
+def iter_claim_rows(claims):
+    """
+        Reads the claims with a server side cursor, CLAIM_EXPORT_CHUNK_SIZE rows at a time
+    """
+    return claims.iterator(chunk_size=settings.CLAIM_EXPORT_CHUNK_SIZE)
+
+
+def iter_claims_csv(claims):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for claim in iter_claim_rows(claims):
+        yield writer.writerow([
+            claim["created_at"].isoformat() if field == "created_at" else claim[field]
+            for field in EXPORT_FIELDS
+        ])
+
+
+def iter_claims_jsonl(claims):
+    for claim in iter_claim_rows(claims):
+        yield json.dumps(claim, cls=DjangoJSONEncoder) + "\n"
+
+
+# format: (lines generator, content type)
+EXPORT_FORMATS = {
+    "csv": (iter_claims_csv, "text/csv"),
+    "jsonl": (iter_claims_jsonl, "application/x-ndjson"),
+}
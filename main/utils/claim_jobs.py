@@ -0,0 +1,161 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from main.apps import LOGGER
+from main.models import ClaimJob, FaucetClaim, FaucetContract
+
+from .faucet_balance import record_claim_balance, request_balance_refresh
+from .faucet_contract import faucet_claim
+from .faucet_index import bump_faucet_index_version
+from .rate_limit import release_claim_rate_limits
+
+
+def enqueue_claim_job(faucet:FaucetContract, recipient:str, passcode:str, ip:str=None, processing=False):
+    """
+        processing=True creates a job already taken, for callers that process it right away
+    """
+    job = ClaimJob(
+        faucet=faucet,
+        network=faucet.network,
+        recipient=recipient,
+        passcode=passcode,
+        ip=ip,
+    )
+    if processing:
+        job.status = ClaimJob.Status.processing
+        job.started_at = timezone.now()
+    job.save()
+    return job
+
+
+def get_next_claim_job():
+    """
+        Marks the oldest pending job as processing and returns it,
+        concurrent workers skip locked rows so a job is only taken once
+    """
+    with transaction.atomic():
+        job = ClaimJob.objects.select_for_update(skip_locked=True) \
+            .filter(status=ClaimJob.Status.pending) \
+            .order_by("created_at") \
+            .first()
+
+        if not job: return
+
+        job.status = ClaimJob.Status.processing
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+        return job
+
+
+def finish_claim_job(job:ClaimJob, txid:str=None, error:str=None):
+    job.status = ClaimJob.Status.success if txid else ClaimJob.Status.failed
+    job.txid = txid
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "txid", "error", "finished_at"])
+
+    if not txid:
+        release_claim_rate_limits(job)
+    return job
+
+
+def record_claim(faucet:FaucetContract, job:ClaimJob, txid:str):
+    """
+        The claim's slot is taken by reserve_claim_slot before it is sent
+    """
+    FaucetClaim.objects.create(
+        faucet=faucet,
+        network=faucet.network,
+        recipient=job.recipient, satoshis=faucet.payout_satoshis,
+        ip=job.ip,
+        txid=txid,
+    )
+    return finish_claim_job(job, txid=txid)
+
+
+def reserve_claim_slot(faucet:FaucetContract):
+    """
+        Counts the claim before it is sent, in a single conditional update so concurrent claims
+        can't go over max_claim_count. Returns False if the faucet has no claims left
+    """
+    reserved = FaucetContract.objects.filter(
+        pk=faucet.pk,
+        max_claim_count__isnull=False,
+        claim_count__lt=F("max_claim_count"),
+    ).update(claim_count=F("claim_count") + 1)
+    if not reserved: return False
+
+    faucet.refresh_from_db(fields=["claim_count", "max_claim_count"])
+    # queryset updates don't send post_save, the index only changes when the last claim is taken
+    if faucet.claim_count >= faucet.max_claim_count:
+        transaction.on_commit(bump_faucet_index_version)
+    return True
+
+
+def release_claim_slot(faucet:FaucetContract):
+    """
+        Gives back the slot of a claim that was not sent
+    """
+    FaucetContract.objects.filter(pk=faucet.pk, claim_count__gt=0) \
+        .update(claim_count=F("claim_count") - 1)
+
+    faucet.refresh_from_db(fields=["claim_count", "max_claim_count"])
+    if faucet.max_claim_count is not None and faucet.claim_count == faucet.max_claim_count - 1:
+        transaction.on_commit(bump_faucet_index_version)
+
+
+def process_claim_job(job:ClaimJob):
+    faucet = FaucetContract.objects.get(pk=job.faucet_id)
+    if not reserve_claim_slot(faucet):
+        return finish_claim_job(job, error="Faucet is no longer claimable")
+
+    try:
+        success, error_or_txid = faucet_claim(faucet, job.recipient, job.passcode, broadcast=True)
+    except Exception as exception:
+        LOGGER.exception(exception)
+        release_claim_slot(faucet)
+        return finish_claim_job(job, error="Claim failed")
+
+    if not success:
+        release_claim_slot(faucet)
+        return finish_claim_job(job, error=f"Claim failed: {error_or_txid}")
+
+    record_claim(faucet, job, error_or_txid)
+    record_claim_balance(faucet)
+    request_balance_refresh(faucet)
+    return job
+
+
+def fail_stale_claim_jobs():
+    """
+        Jobs left processing by a worker that died are failed instead of retried,
+        the claim may already have been broadcasted
+    """
+    stale_time = timezone.now() - timezone.timedelta(seconds=settings.CLAIM_JOB_STALE_TIMEOUT)
+    return ClaimJob.objects.filter(
+        status=ClaimJob.Status.processing,
+        started_at__lt=stale_time,
+    ).update(
+        status=ClaimJob.Status.failed,
+        error="Claim was interrupted",
+        finished_at=timezone.now(),
+    )
+
+
+def run_claim_jobs(limit:int=None):
+    """
+        Processes pending jobs until there are none left or `limit` is reached
+        Returns the number of jobs processed
+    """
+    count = 0
+    while limit is None or count < limit:
+        job = get_next_claim_job()
+        if not job: break
+
+        LOGGER.info(f"Processing {job}")
+        process_claim_job(job)
+        count += 1
+
+    return count
@@ -0,0 +1,240 @@
+import os
+import gzip
+from datetime import datetime, timezone as dt_timezone
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connections, transaction
+from psqlextra.partitioning import (
+    PostgresPartitioningManager,
+    PostgresTimePartition,
+    PostgresTimePartitionSize,
+    partition_by_current_time,
+)
+from psqlextra.partitioning.constants import AUTO_PARTITIONED_COMMENT
+
+from main.apps import LOGGER
+from main.models import FaucetClaim
+
+from .claim_export import get_export_claims, iter_claims_jsonl
+
+
+# also used by psqlextra's pgpartition command, see PSQLEXTRA_PARTITIONING_MANAGER
+# no max_age, old partitions are only dropped by archive_claim_partitions
+manager = PostgresPartitioningManager([
+    partition_by_current_time(FaucetClaim, months=1, count=settings.CLAIM_PARTITIONS_AHEAD + 1),
+])
+
+PARTITION_NAME_FORMAT = "%Y_%b" # same as psqlextra's monthly PostgresTimePartition
+DEFAULT_PARTITION_TABLE = f"{FaucetClaim._meta.db_table}_default"
+CLAIM_COLUMNS = ", ".join(field.column for field in FaucetClaim._meta.concrete_fields)
+
+
+class ClaimPartition:
+    """
+        A monthly partition of the FaucetClaim table, holds claims from `start` until `end`
+    """
+    def __init__(self, name:str, start:datetime):
+        self.name = name
+        self.start = start
+        self.end = start + relativedelta(months=1)
+
+    def __repr__(self):
+        return f"ClaimPartition({self.table})"
+
+    @property
+    def table(self):
+        return f"{FaucetClaim._meta.db_table}_{self.name}"
+
+    @classmethod
+    def from_name(cls, name:str):
+        try:
+            start = datetime.strptime(name, PARTITION_NAME_FORMAT)
+        except ValueError:
+            return
+        return cls(name, start.replace(tzinfo=dt_timezone.utc))
+
+
+def get_claim_partitions(using:str="default"):
+    """
+        Returns the monthly partitions in the database, oldest first, the default partition is left out
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        tables = connection.introspection.get_partitions(cursor, FaucetClaim._meta.db_table)
+
+    partitions = [ClaimPartition.from_name(table.name) for table in tables]
+    return sorted([partition for partition in partitions if partition], key=lambda p: p.start)
+
+
+def count_default_partition_claims(partition:PostgresTimePartition, using:str="default"):
+    """
+        Returns the number of claims in the default partition that belong to the partition's month
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {connection.ops.quote_name(DEFAULT_PARTITION_TABLE)} "
+            f"WHERE created_at >= %s AND created_at < %s",
+            [partition.from_values, partition.to_values],
+        )
+        return cursor.fetchone()[0]
+
+
+def create_claim_partition(partition:PostgresTimePartition, using:str="default"):
+    """
+        Creates the partition and moves the claims of its month out of the default partition,
+        postgres refuses to create a partition while the default partition has rows of its range
+        Returns the number of claims moved
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    table = quote_name(FaucetClaim._meta.db_table)
+    default_table = quote_name(DEFAULT_PARTITION_TABLE)
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            # creating the partition locks the table anyway, no claim can land in the default partition meanwhile
+            cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            cursor.execute(f"CREATE TEMPORARY TABLE claims_to_move (LIKE {table}) ON COMMIT DROP")
+            cursor.execute(
+                f"WITH moved AS ("
+                f"DELETE FROM {default_table} WHERE created_at >= %s AND created_at < %s RETURNING {CLAIM_COLUMNS}"
+                f") INSERT INTO claims_to_move ({CLAIM_COLUMNS}) SELECT {CLAIM_COLUMNS} FROM moved",
+                [partition.from_values, partition.to_values],
+            )
+            moved = cursor.rowcount
+
+            with connection.schema_editor() as schema_editor:
+                partition.create(FaucetClaim, schema_editor, comment=AUTO_PARTITIONED_COMMENT)
+
+            cursor.execute(f"INSERT INTO {table} ({CLAIM_COLUMNS}) SELECT {CLAIM_COLUMNS} FROM claims_to_move")
+            cursor.execute("DROP TABLE claims_to_move")
+
+    if moved:
+        LOGGER.warning(f"Moved {moved} claims from the default partition to {partition.name()}")
+    return moved
+
+
+def create_claim_partitions(using:str="default", dry=False):
+    """
+        Creates the partitions of the current month and the next CLAIM_PARTITIONS_AHEAD months
+        Returns a list of (name, claims moved out of the default partition) of the partitions created
+    """
+    plan = manager.plan(skip_delete=True, using=using)
+    results = []
+    for partition in plan.creations:
+        if dry:
+            moved = count_default_partition_claims(partition, using=using)
+        else:
+            moved = create_claim_partition(partition, using=using)
+        results.append((partition.name(), moved))
+    return results
+
+
+def add_claim_partitions(start:datetime, end:datetime, using:str="default"):
+    """
+        Creates the missing partitions of the months from `start` to `end`, e.g. to load older claims
+        Returns the names of the partitions created
+    """
+    size = PostgresTimePartitionSize(months=1)
+    existing = {partition.name for partition in get_claim_partitions(using=using)}
+    month = size.start(start)
+
+    names = []
+    while month <= size.start(end):
+        partition = PostgresTimePartition(size=size, start_datetime=month)
+        if partition.name() not in existing:
+            create_claim_partition(partition, using=using)
+            names.append(partition.name())
+        month += relativedelta(months=1)
+    return names
+
+
+def get_expired_claim_partitions(retention:int=None, using:str="default"):
+    """
+        Partitions that ended more than `retention` months before the current month
+    """
+    if retention is None: retention = settings.CLAIM_PARTITIONS_RETENTION
+    now = datetime.now(dt_timezone.utc)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    cutoff = month_start - relativedelta(months=retention)
+    return [partition for partition in get_claim_partitions(using=using) if partition.end <= cutoff]
+
+
+def write_claims_archive(partition:ClaimPartition, path:str, using:str="default"):
+    """
+        Writes the claims of the partition to a gzipped JSONL file at `path`
+        Returns the number of claims written
+    """
+    # the created_at range only scans the partition
+    claims = get_export_claims(
+        queryset=FaucetClaim.objects.using(using),
+        since=partition.start,
+        until=partition.end,
+    )
+
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8") as archive:
+        for line in iter_claims_jsonl(claims):
+            archive.write(line)
+            count += 1
+    return count
+
+
+def archive_claim_partition(partition:ClaimPartition, archive_dir:str=None, using:str="default"):
+    """
+        Writes the claims of the partition to `archive_dir`, then detaches and drops it
+        Returns (path, number of claims archived)
+    """
+    if archive_dir is None: archive_dir = settings.CLAIM_ARCHIVE_DIR
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition.table}.jsonl.gz")
+    tmp_path = f"{path}.tmp"
+
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            # no claim can be added to the partition between writing the archive & dropping it
+            cursor.execute(f"LOCK TABLE {quote_name(partition.table)} IN SHARE MODE")
+            count = write_claims_archive(partition, tmp_path, using=using)
+            os.replace(tmp_path, path)
+
+            cursor.execute(
+                f"ALTER TABLE {quote_name(FaucetClaim._meta.db_table)} "
+                f"DETACH PARTITION {quote_name(partition.table)}"
+            )
+            cursor.execute(f"DROP TABLE {quote_name(partition.table)}")
+
+    LOGGER.info(f"Archived {count} claims of {partition.table} to {path}")
+    return path, count
+
+
+def archive_claim_partitions(retention:int=None, archive_dir:str=None, using:str="default"):
+    """
+        Archives every expired partition, returns the list of (partition, path, number of claims)
+    """
+    results = []
+    for partition in get_expired_claim_partitions(retention=retention, using=using):
+        path, count = archive_claim_partition(partition, archive_dir=archive_dir, using=using)
+        results.append((partition, path, count))
+    return results
+
+
+def estimate_claim_count(using:str="default"):
+    """
+        Row count of every partition from the planner's statistics, updated by (auto)vacuum & analyze
+        The partitioned table itself has no rows
+    """
+    table = FaucetClaim._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+                SELECT COALESCE(SUM(GREATEST(pg_class.reltuples, 0)), 0)
+                FROM pg_inherits
+                JOIN pg_class ON pg_class.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [table],
+        )
+        return int(cursor.fetchone()[0])
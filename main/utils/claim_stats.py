@@ -0,0 +1,170 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from main.apps import LOGGER
+from main.models import ClaimStats, FaucetClaim
+
+
+def get_bucket(dt, period:str):
+    """
+        Start of the hour or day of `dt`, same as Trunc in the database for the current timezone
+    """
+    dt = timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+    if period == ClaimStats.Period.day:
+        dt = dt.replace(hour=0)
+    return dt
+
+
+def is_first_claim_since(claim:FaucetClaim, since, **filters):
+    """
+        Whether the claim is the first of the faucet since `since` with the same `filters`,
+        claims are ordered by id so concurrent claims agree on which one is first
+    """
+    return not FaucetClaim.objects.filter(
+        faucet_id=claim.faucet_id,
+        created_at__gte=since,
+        created_at__lte=claim.created_at,
+        id__lt=claim.id,
+        **filters,
+    ).exists()
+
+
+def add_claim_stats(claim:FaucetClaim, period:str, bucket, unique_ip:bool, unique_recipient:bool):
+    lookup = dict(faucet_id=claim.faucet_id, period=period, bucket=bucket)
+    increments = dict(
+        claim_count=F("claim_count") + 1,
+        satoshis=F("satoshis") + claim.satoshis,
+        unique_ips=F("unique_ips") + int(unique_ip),
+        unique_recipients=F("unique_recipients") + int(unique_recipient),
+    )
+    if ClaimStats.objects.filter(**lookup).update(**increments):
+        return
+
+    try:
+        with transaction.atomic():
+            ClaimStats.objects.create(
+                **lookup,
+                network=claim.network,
+                claim_count=1,
+                satoshis=claim.satoshis,
+                unique_ips=int(unique_ip),
+                unique_recipients=int(unique_recipient),
+            )
+    except IntegrityError:
+        # created by a concurrent claim
+        ClaimStats.objects.filter(**lookup).update(**increments)
+
+
+def record_claim_stats(claim:FaucetClaim):
+    """
+        Adds the claim to its hour and day stats, errors are logged since the claim is already sent
+        The unique counts read the claims of the bucket by ip & recipient index, a claim
+        committed after a later one may be counted twice, backfill_claim_stats recounts exactly
+    """
+    if not claim.faucet_id: return
+    try:
+        add_claim_to_stats(claim)
+    except Exception as exception:
+        LOGGER.exception(exception)
+
+
+def add_claim_to_stats(claim:FaucetClaim):
+    hour = get_bucket(claim.created_at, ClaimStats.Period.hour)
+    day = get_bucket(claim.created_at, ClaimStats.Period.day)
+
+    # a claim that is not the first of the hour is not the first of the day either
+    unique_ip_hour = bool(claim.ip) and is_first_claim_since(claim, hour, ip=claim.ip)
+    unique_ip_day = unique_ip_hour and is_first_claim_since(claim, day, ip=claim.ip)
+    unique_recipient_hour = is_first_claim_since(claim, hour, recipient=claim.recipient)
+    unique_recipient_day = unique_recipient_hour and is_first_claim_since(claim, day, recipient=claim.recipient)
+
+    add_claim_stats(claim, ClaimStats.Period.hour, hour, unique_ip_hour, unique_recipient_hour)
+    add_claim_stats(claim, ClaimStats.Period.day, day, unique_ip_day, unique_recipient_day)
+
+
+def backfill_claim_stats(period:str, since=None, until=None, faucet_ids:list=None):
+    """
+        Recounts the stats of the buckets with claims from FaucetClaim,
+        stats of claims archived from the database are kept
+        Returns the number of (created, updated) stats
+    """
+    claims = FaucetClaim.objects.filter(faucet__isnull=False)
+    if since: claims = claims.filter(created_at__gte=get_bucket(since, period))
+    if until: claims = claims.filter(created_at__lt=until)
+    if faucet_ids: claims = claims.filter(faucet_id__in=faucet_ids)
+
+    rows = claims \
+        .annotate(bucket=Trunc("created_at", period)) \
+        .values("faucet_id", "network", "bucket") \
+        .annotate(
+            claim_count=Count("id"),
+            satoshis=Sum("satoshis"),
+            unique_ips=Count("ip", distinct=True),
+            unique_recipients=Count("recipient", distinct=True),
+        ) \
+        .order_by()
+
+    created = updated = 0
+    with transaction.atomic():
+        stats = []
+        for row in rows.iterator():
+            stats.append(ClaimStats(period=period, **row))
+            if len(stats) < settings.BULK_ACTION_BATCH_SIZE: continue
+
+            batch_created, batch_updated = save_claim_stats(stats)
+            created, updated, stats = created + batch_created, updated + batch_updated, []
+
+        if stats:
+            batch_created, batch_updated = save_claim_stats(stats)
+            created, updated = created + batch_created, updated + batch_updated
+
+    return created, updated
+
+
+def save_claim_stats(stats:list):
+    """
+        Overwrites the counts of the existing stats of the same buckets, creates the others
+    """
+    period = stats[0].period
+    existing = ClaimStats.objects.filter(
+        period=period,
+        faucet_id__in={obj.faucet_id for obj in stats},
+        bucket__in={obj.bucket for obj in stats},
+    ).only("id", "faucet_id", "bucket")
+    existing_ids = {(obj.faucet_id, obj.bucket): obj.id for obj in existing}
+
+    to_update = []
+    to_create = []
+    for obj in stats:
+        obj.id = existing_ids.get((obj.faucet_id, obj.bucket))
+        if obj.id: to_update.append(obj)
+        else: to_create.append(obj)
+
+    ClaimStats.objects.bulk_update(to_update, ["claim_count", "satoshis", "unique_ips", "unique_recipients"])
+    ClaimStats.objects.bulk_create(to_create)
+    return len(to_create), len(to_update)
+
+
+def get_claim_stats(period:str, since=None, network:str=None, faucet_id:int=None):
+    """
+        Stats per bucket, summed over the faucets unless `faucet_id` is given
+        Unique counts are summed per faucet, the same ip claiming from 2 faucets counts twice
+    """
+    stats = ClaimStats.objects.filter(period=period)
+    if since: stats = stats.filter(bucket__gte=get_bucket(since, period))
+    if network: stats = stats.filter(network=network)
+    if faucet_id: stats = stats.filter(faucet_id=faucet_id)
+
+    return list(
+        stats.values("bucket")
+            .annotate(
+                claim_count=Sum("claim_count"),
+                satoshis=Sum("satoshis"),
+                unique_ips=Sum("unique_ips"),
+                unique_recipients=Sum("unique_recipients"),
+            )
+            .order_by("bucket")
+    )
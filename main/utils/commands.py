@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+
+def parse_datetime(value:str):
+    """
+        Argument type of the --since & --until options of the management commands
+    """
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date: {value}, expected YYYY-MM-DD or YYYY-MM-DDTHH:MM")
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+def percentile(values:list, pct:float):
+    if not values: return 0
+    values = sorted(values)
+    index = min(len(values) - 1, round(pct / 100 * (len(values) - 1)))
+    return values[index]
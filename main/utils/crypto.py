@@ -1,4 +1,29 @@
 from hashlib import sha256
+from cashaddress.crypto import b32decode, b32encode, calculate_checksum, convertbits, verify_checksum
+
+# Cashaddress version bytes, (type << 3) | size
+# https://github.com/bitcoincashorg/bitcoincash.org/blob/master/spec/cashaddr.md
+CASHADDRESS_P2PKH = 0x00
+CASHADDRESS_P2SH = 0x08
+CASHADDRESS_P2SH32 = 0x0b
+CASHADDRESS_TOKEN_P2PKH = 0x10
+CASHADDRESS_TOKEN_P2SH = 0x18
+CASHADDRESS_TOKEN_P2SH32 = 0x1b
+
+CASHADDRESS_PREFIXES = {
+    "mainnet": "bitcoincash",
+    "chipnet": "bchtest",
+    "testnet4": "bchtest",
+    "regtest": "bchreg",
+}
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1NEGATE = 0x4f
+OP_RESERVED = 0x50
+
 
 def get_tx_hash(tx_hex):
     tx_hex_bytes = bytes.fromhex(tx_hex)
@@ -7,3 +32,78 @@ def get_tx_hash(tx_hex):
     d = bytearray(hash2)
     d.reverse()
     return d.hex()
+
+
+def hash256(data:bytes):
+    return sha256(sha256(data).digest()).digest()
+
+
+def encode_script_number(value:int):
+    """
+        Minimally encoded script number, same as libauth's bigIntToVmNumber
+    """
+    if value == 0: return b""
+
+    negative = value < 0
+    value = abs(value)
+    result = bytearray()
+    while value:
+        result.append(value & 0xff)
+        value >>= 8
+
+    if result[-1] & 0x80:
+        result.append(0x80 if negative else 0x00)
+    elif negative:
+        result[-1] |= 0x80
+
+    return bytes(result)
+
+
+def encode_data_push(data:bytes):
+    """
+        Minimal push of data in a script, same as libauth's encodeDataPush
+    """
+    length = len(data)
+    if length == 0:
+        return bytes([OP_0])
+    if length == 1 and 1 <= data[0] <= 16:
+        return bytes([OP_RESERVED + data[0]])
+    if length == 1 and data[0] == 0x81:
+        return bytes([OP_1NEGATE])
+    if length <= 75:
+        return bytes([length]) + data
+    if length <= 0xff:
+        return bytes([OP_PUSHDATA1, length]) + data
+    if length <= 0xffff:
+        return bytes([OP_PUSHDATA2]) + length.to_bytes(2, "little") + data
+    return bytes([OP_PUSHDATA4]) + length.to_bytes(4, "little") + data
+
+
+def encode_cashaddress(prefix:str, version:int, payload:bytes):
+    data = convertbits([version] + list(payload), 8, 5)
+    checksum = calculate_checksum(prefix, data)
+    return prefix + ":" + b32encode(data + checksum)
+
+
+def decode_cashaddress(address:str):
+    """
+        Returns (prefix, version, payload)
+        Unlike cashaddress.convert, this accepts any version byte including token aware addresses
+    """
+    if address.upper() != address and address.lower() != address:
+        raise ValueError(f"Mixed case cashaddress: {address}")
+
+    address = address.lower()
+    if ":" not in address:
+        address = CASHADDRESS_PREFIXES["mainnet"] + ":" + address
+    prefix, encoded = address.split(":", 1)
+
+    decoded = b32decode(encoded)
+    if -1 in decoded or len(decoded) < 8 or not verify_checksum(prefix, decoded):
+        raise ValueError(f"Invalid cashaddress: {address}")
+
+    data = convertbits(decoded[:-8], 5, 8, pad=False)
+    if not data:
+        raise ValueError(f"Invalid cashaddress: {address}")
+
+    return prefix, data[0], bytes(data[1:])
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from main.apps import LOGGER
+from main.models import FaucetContract, FaucetUtxo
+
+from .bulk_actions import update_faucet_balances
+from .faucet_utxos import add_faucet_utxo_from_webhook
+
+
+def adjust_faucet_balance(obj:FaucetContract, delta_satoshis:int):
+    """
+        Applies a locally known change to the balance until the next watchtower refresh
+    """
+    FaucetContract.objects.filter(pk=obj.pk, balance_satoshis__isnull=False).update(
+        balance_satoshis=Greatest(F("balance_satoshis") + delta_satoshis, Value(0)),
+    )
+
+
+def record_claim_balance(obj:FaucetContract):
+    # a claim sends the payout and its fee out of the contract, the rest comes back as change
+    adjust_faucet_balance(obj, -(obj.payout_satoshis + obj.claim_tx_fee))
+
+
+def record_webhook_balance(obj:FaucetContract, data:dict):
+    """
+        Adds the webhook's output to the local utxo set, and to the balance if it is a deposit
+        instead of the change of the faucet's own transactions
+    """
+    utxo, created = add_faucet_utxo_from_webhook(obj, data)
+    if not created: return utxo
+
+    own_transaction = FaucetUtxo.objects.filter(faucet=obj, spent_txid=utxo.txid).exists()
+    if not own_transaction:
+        adjust_faucet_balance(obj, utxo.satoshis)
+    return utxo
+
+
+def request_balance_refresh(obj:FaucetContract):
+    """
+        Schedules a refresh from watchtower, requests within FAUCET_BALANCE_REFRESH_DELAY
+        of the first one are done in a single refresh by refresh_faucet_balances
+    """
+    FaucetContract.objects.filter(pk=obj.pk, balance_refresh_requested_at__isnull=True) \
+        .update(balance_refresh_requested_at=timezone.now())
+
+
+def take_due_balance_refreshes(limit:int=None):
+    """
+        Clears the refresh requests older than FAUCET_BALANCE_REFRESH_DELAY and returns their faucets,
+        requests made after this are scheduled for another refresh
+    """
+    due_time = timezone.now() - timezone.timedelta(seconds=settings.FAUCET_BALANCE_REFRESH_DELAY)
+    with transaction.atomic():
+        queryset = FaucetContract.objects.select_for_update(skip_locked=True) \
+            .filter(balance_refresh_requested_at__lte=due_time) \
+            .order_by("balance_refresh_requested_at")
+        if limit: queryset = queryset[:limit]
+
+        faucets = list(queryset)
+        FaucetContract.objects.filter(pk__in=[faucet.pk for faucet in faucets]) \
+            .update(balance_refresh_requested_at=None)
+    return faucets
+
+
+def refresh_faucet_balances(limit:int=None):
+    """
+        Returns the number of faucets refreshed
+    """
+    faucets = take_due_balance_refreshes(limit=limit)
+    if not faucets: return 0
+
+    result = update_faucet_balances(faucets)
+    LOGGER.info(f"UPDATING BALANCE | {result.summary}")
+    for faucet, _ in result.failed:
+        request_balance_refresh(faucet)
+
+    return len(faucets)
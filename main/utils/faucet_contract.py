@@ -1,13 +1,34 @@
+import time
+
 from django.conf import settings
 
 from main.apps import LOGGER
 from main.js.runner import ScriptFunctions
-from main.models import FaucetContract
+from main.models import FaucetContract, FaucetUtxo
 
 from .crypto import get_tx_hash
-from .watchtower_api import Watchtower
+from .faucet_script import build_claim_transaction, derive_contract_addresses
+from .faucet_utxos import (
+    add_faucet_utxo,
+    plan_faucet_utxos,
+    record_claim_broadcast,
+    release_faucet_utxo,
+    reserve_faucet_utxo,
+    reserve_faucet_utxos,
+    listen_claim_chain,
+    reserve_watchtower_utxo,
+    spend_faucet_utxos,
+    sync_faucet_utxos,
+    wait_for_claim_chain,
+)
+from .watchtower_api import Watchtower, get_watchtower
 
 def compile_contract(passcode:str, payout_satoshis:int, owner_address:str, network:str):
+    try:
+        return derive_contract_addresses(passcode, payout_satoshis, owner_address, network)
+    except Exception as exception:
+        LOGGER.warning(f"Failed to derive contract address, compiling in node instead | {exception}")
+
     return ScriptFunctions.compileFaucetContract(dict(
         params=dict(
             passcode=passcode,
@@ -18,21 +39,51 @@ def compile_contract(passcode:str, payout_satoshis:int, owner_address:str, netwo
     ))
 
 def compile_obj(obj:FaucetContract):
-    return ScriptFunctions.compileFaucetContract(obj.contract_opts)
+    return compile_contract(obj.passcode, obj.payout_satoshis, obj.owner_address, obj.network)
 
-def faucet_claim(obj:FaucetContract, recipient:str, passcode:str, broadcast=True):
-    LOGGER.debug(f"Claim | {obj} | {recipient}")
-    wt_api = Watchtower(network = obj.network)
-    utxos = wt_api.get_bch_utxos(obj.address, parse="cashscript")
+def compile_objs(objs:list):
+    """
+        Compiles multiple faucet contracts in a single call to node,
+        useful for checking addresses derived in python against cashscript
+        Returns a list of (success, compile_data_or_error) in the same order as objs
+    """
+    return ScriptFunctions.batch([
+        ("compileFaucetContract", [obj.contract_opts]) for obj in objs
+    ])
 
-    utxo = None
-    for _utxo in utxos:
-        if _utxo["satoshis"] >= obj.payout_satoshis + obj.claim_tx_fee:
-            utxo = _utxo
-            break
+def derive_objs(objs:list):
+    """
+        Derives the addresses of multiple faucet contracts, the ones that can't be
+        derived in python are compiled together in a single call to node
+        Returns a list of (success, compile_data_or_error) in the same order as objs
+    """
+    results = [None] * len(objs)
+    node_indices = []
+    for index, obj in enumerate(objs):
+        try:
+            results[index] = (True, derive_contract_addresses(
+                obj.passcode, obj.payout_satoshis, obj.owner_address, obj.network,
+            ))
+        except Exception as exception:
+            LOGGER.warning(f"Failed to derive contract address, compiling in node instead | {exception}")
+            node_indices.append(index)
 
-    if not utxo:
-        return False, "Not enough funds to claim"
+    if node_indices:
+        node_results = compile_objs([objs[index] for index in node_indices])
+        for index, result in zip(node_indices, node_results):
+            results[index] = result
+
+    return results
+
+def build_claim(obj:FaucetContract, utxo:dict, recipient:str, passcode:str):
+    """
+        Returns (success, error_or_transaction)
+    """
+    if settings.FAUCET_NATIVE_CLAIM_BUILDER:
+        try:
+            return True, build_claim_transaction(obj, utxo, recipient, passcode)
+        except Exception as exception:
+            LOGGER.warning(f"Failed to build claim TX, building in node instead | {obj} | {exception}")
 
     result = ScriptFunctions.faucetClaim(dict(
         contractOpts=obj.contract_opts,
@@ -44,51 +95,178 @@ def faucet_claim(obj:FaucetContract, recipient:str, passcode:str, broadcast=True
     if not result["success"]:
         return False, result.get("error", "Failed to create transaction")
 
-    transaction = result["transaction"]
-    txid = get_tx_hash(transaction)
+    return True, result["transaction"]
+
+
+def faucet_claim(obj:FaucetContract, recipient:str, passcode:str, broadcast=True):
+    LOGGER.debug(f"Claim | {obj} | {recipient}")
+    min_satoshis = obj.payout_satoshis + obj.claim_tx_fee
+
+    deadline = time.monotonic() + settings.FAUCET_CLAIM_CHAIN_TIMEOUT
+    # reservations are committed right away, no lock or transaction is held while building & broadcasting,
+    # claims waiting for an in-flight claim's change are notified once it is recorded
+    with listen_claim_chain(obj) as listening:
+        utxo = reserve_faucet_utxo(obj, min_satoshis)
+        while not utxo and listening and wait_for_claim_chain(obj, min_satoshis, deadline - time.monotonic()):
+            utxo = reserve_faucet_utxo(obj, min_satoshis)
+
+    if not utxo:
+        # local utxo set is empty or used up, look for one in watchtower
+        utxo = reserve_watchtower_utxo(obj, min_satoshis)
+
+    if not utxo:
+        return False, "Not enough funds to claim"
+
+    return send_claim(obj, utxo, recipient, passcode)
+
+
+def send_claim(obj:FaucetContract, utxo:FaucetUtxo, recipient:str, passcode:str):
+    """
+        Builds and broadcasts the claim spending the reserved `utxo`
+        Returns (success, error_or_txid)
+    """
     try:
-        LOGGER.debug(f"Broadcasting claim TX | {transaction}")
-        wt_api.broadcast(transaction)
+        success, error_or_transaction = build_claim(obj, utxo.cashscript_utxo, recipient, passcode)
+    except Exception:
+        release_faucet_utxo(utxo)
+        raise
+
+    if not success:
+        release_faucet_utxo(utxo)
+        return False, error_or_transaction
+
+    tx_hex = error_or_transaction
+    txid = get_tx_hash(tx_hex)
+    try:
+        LOGGER.debug(f"Broadcasting claim TX | {tx_hex}")
+        get_watchtower(obj.network).broadcast(tx_hex)
     except Watchtower.WatchtowerException as exception:
+        release_faucet_utxo(utxo)
+        # the utxo may have been spent outside of the faucet
+        resync_faucet_utxos(obj)
         return False, f"{exception}"
 
+    record_claim_broadcast(obj, utxo, txid)
     return True, txid
 
 
+def resync_faucet_utxos(obj:FaucetContract):
+    try:
+        sync_faucet_utxos(obj)
+    except Watchtower.WatchtowerException as exception:
+        LOGGER.exception(exception)
+
+
 def sweep_faucet(obj:FaucetContract, wif:str, recipient:str=None):
-    wt_api = Watchtower(network = obj.network)
-    utxos = wt_api.get_bch_utxos(obj.address, parse="cashscript")
+    return sweep_faucets([obj], wif, recipient=recipient)[0]
 
-    result = ScriptFunctions.faucetSweep(dict(
-        contractOpts=obj.contract_opts,
-        utxos=utxos,
-        recipient=recipient,
-        wif=wif,
-    ))
+
+def sweep_faucets(objs:list, wif:str, recipient:str=None):
+    """
+        Builds the sweep transactions of multiple faucets in a single call to node
+        Returns a list of (success, error_or_txid) in the same order as objs
+    """
+    results = [None] * len(objs)
+    calls = []
+    call_indices = []
+    call_utxos = []
+    for index, obj in enumerate(objs):
+        wt_api = get_watchtower(obj.network)
+        try:
+            utxos = [utxo.as_cashscript() for utxo in wt_api.iter_bch_utxos(obj.address)]
+        except Watchtower.WatchtowerException as exception:
+            results[index] = (False, f"{exception}")
+            continue
+
+        calls.append(("faucetSweep", [dict(
+            contractOpts=obj.contract_opts,
+            utxos=utxos,
+            recipient=recipient,
+            wif=wif,
+        )]))
+        call_indices.append(index)
+        call_utxos.append(utxos)
+
+    batch_results = ScriptFunctions.batch(calls)
+    for index, utxos, (success, result) in zip(call_indices, call_utxos, batch_results):
+        obj = objs[index]
+        if not success:
+            results[index] = (False, result)
+            continue
+
+        if not result["success"]:
+            results[index] = (False, result.get("error", "Failed to create sweep transaction"))
+            continue
+
+        transaction = result["transaction"]
+        txid = get_tx_hash(transaction)
+        try:
+            get_watchtower(obj.network).broadcast(transaction)
+        except Watchtower.WatchtowerException as exception:
+            results[index] = (False, f"{exception}")
+            continue
+
+        spend_faucet_utxos(obj, [(utxo["txid"], utxo["vout"]) for utxo in utxos], txid)
+        results[index] = (True, txid)
+
+    return results
+
+def redistribute_faucet(obj:FaucetContract, wif:str, target_count:int=None):
+    """
+        Splits the faucet's balance into utxos for parallel claims,
+        or consolidates its dust utxos, see plan_faucet_utxos
+        Returns (success, error_or_txid)
+    """
+    sync_faucet_utxos(obj)
+    plan = plan_faucet_utxos(obj, target_count=target_count)
+    if not plan:
+        return False, "Nothing to split or consolidate"
+
+    LOGGER.info(f"Redistributing utxos | {obj} | {plan['action']} | {len(plan['utxos'])} -> {plan['target_count']}")
+    utxos = reserve_faucet_utxos(obj, [utxo.pk for utxo in plan["utxos"]])
+    if len(utxos) != len(plan["utxos"]):
+        for utxo in utxos: release_faucet_utxo(utxo)
+        return False, "Some utxos are being used by claims, try again"
+
+    try:
+        result = ScriptFunctions.faucetRedistribute(dict(
+            contractOpts=obj.contract_opts,
+            utxos=[utxo.cashscript_utxo for utxo in utxos],
+            outputSats=plan["output_satoshis"],
+            wif=wif,
+        ))
+    except Exception:
+        for utxo in utxos: release_faucet_utxo(utxo)
+        raise
 
     if not result["success"]:
-        return False, result.get("error", "Failed to create sweep transaction")
+        for utxo in utxos: release_faucet_utxo(utxo)
+        return False, result.get("error", "Failed to create transaction")
 
     transaction = result["transaction"]
     txid = get_tx_hash(transaction)
     try:
-        wt_api.broadcast(transaction)
+        get_watchtower(obj.network).broadcast(transaction)
     except Watchtower.WatchtowerException as exception:
+        for utxo in utxos: release_faucet_utxo(utxo)
         return False, f"{exception}"
 
+    spend_faucet_utxos(obj, [(utxo.txid, utxo.vout) for utxo in utxos], txid)
+    for vout, satoshis in enumerate(result["outputs"]):
+        add_faucet_utxo(obj, txid, vout, satoshis)
+
     return True, txid
 
-def update_faucet_balance(obj:FaucetContract):
-    wt_api = Watchtower(network=obj.network)
+
+def fetch_faucet_balance(obj:FaucetContract):
+    wt_api = get_watchtower(obj.network)
     balance_data = wt_api.get_balance(obj.address)
     balance_bch = balance_data["balance"]
-    obj.balance_satoshis = round(balance_bch * 10 ** 8)
-    obj.save()
-    return obj.balance_satoshis
+    return round(balance_bch * 10 ** 8)
 
 
 def subscribe_faucet_contract(obj:FaucetContract):
-    wt_api = Watchtower(network=obj.network)
+    wt_api = get_watchtower(obj.network)
     LOGGER.info(f"Subscribing faucet contract | {obj} | {settings.WATCHTOWER_WEBHOOK_RECEIVER_URL}")
     success, error = wt_api.subscribe_address(
         obj.address, webhook_url=settings.WATCHTOWER_WEBHOOK_RECEIVER_URL,
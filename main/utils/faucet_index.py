@@ -0,0 +1,81 @@
+import uuid
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from main.apps import LOGGER
+from main.models import FaucetContract
+
+VERSION_CACHE_KEY = "claimable-faucet-index:version"
+
+
+class ClaimableFaucetIndex:
+    """
+        Per process index of claimable faucet ids by (network, passcode), so form validation
+        rejects bad passcodes without querying the database
+        Rebuilt lazily when the version stamp in the shared cache changes, see bump_faucet_index_version
+    """
+    def __init__(self):
+        self.version = None
+        self.index = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.FAUCET_INDEX_CACHE]
+
+    def get_current_version(self):
+        version = self.cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            # cache was cleared, other processes will rebuild as well
+            version = uuid.uuid4().hex
+            if not self.cache.add(VERSION_CACHE_KEY, version, timeout=None):
+                version = self.cache.get(VERSION_CACHE_KEY)
+        return version
+
+    def build(self, version:str):
+        index = {}
+        faucets = FaucetContract.objects.filter(
+            max_claim_count__isnull=False,
+            claim_count__lt=F("max_claim_count"),
+        ).order_by("pk").values_list("pk", "network", "passcode")
+
+        for pk, network, passcode in faucets:
+            index.setdefault(network, {}).setdefault(passcode, []).append(pk)
+
+        LOGGER.debug(f"Built claimable faucet index | {version} | {len(faucets)} faucets")
+        self.index = index
+        self.version = version
+
+    def get_index(self):
+        # the version is read before building, a change during the build triggers another one
+        version = self.get_current_version()
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self.build(version)
+        return self.index
+
+    def has_claimable(self, network:str):
+        return bool(self.get_index().get(network))
+
+    def lookup(self, network:str, passcode:str):
+        """
+            Returns the ids of the claimable faucets of `network` with `passcode`
+        """
+        return self.get_index().get(network, {}).get(passcode, [])
+
+
+_faucet_index = ClaimableFaucetIndex()
+
+def get_faucet_index():
+    return _faucet_index
+
+
+def bump_faucet_index_version():
+    """
+        Makes every process rebuild its index on its next lookup
+    """
+    caches[settings.FAUCET_INDEX_CACHE].set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
@@ -0,0 +1,119 @@
+import csv
+import json
+
+from cashaddress import convert
+from django.conf import settings
+from django.db import transaction
+
+from main.models import FaucetContract, Network
+
+from .faucet_contract import derive_objs
+from .faucet_index import bump_faucet_index_version
+from .subscriptions import queue_subscriptions
+
+FAUCET_ROW_FIELDS = [
+    "network",
+    "passcode",
+    "payout_satoshis",
+    "owner_address",
+    "max_claim_count",
+    "max_claim_per_ip",
+]
+
+
+class FaucetRowError(Exception):
+    pass
+
+
+def read_faucet_rows(path:str):
+    """
+        Yields dicts from a csv with a header row, or a jsonl file with an object per line
+    """
+    with open(path, newline="") as file:
+        if path.endswith(".jsonl"):
+            for line in file:
+                if line.strip(): yield json.loads(line)
+        else:
+            yield from csv.DictReader(file)
+
+
+def parse_optional_int(value):
+    if value is None or value == "": return None
+    return int(value)
+
+
+def parse_faucet_row(row:dict):
+    """
+        Returns an unsaved FaucetContract without its address, raises FaucetRowError if invalid
+    """
+    missing = [field for field in FAUCET_ROW_FIELDS[:4] if not row.get(field)]
+    if missing:
+        raise FaucetRowError(f"Missing {', '.join(missing)}")
+
+    network = str(row["network"]).strip()
+    passcode = str(row["passcode"]).strip()
+    owner_address = str(row["owner_address"]).strip()
+    if network not in Network.values:
+        raise FaucetRowError(f"Invalid network: {network}")
+    if len(passcode) > 10:
+        raise FaucetRowError("Passcode must be at most 10 characters")
+    if not convert.is_valid(owner_address):
+        raise FaucetRowError(f"Invalid owner address: {owner_address}")
+    if (network == "chipnet") != owner_address.startswith("bchtest:"):
+        raise FaucetRowError(f"Owner address is not a {network} address")
+
+    try:
+        payout_satoshis = int(row["payout_satoshis"])
+        max_claim_count = parse_optional_int(row.get("max_claim_count"))
+        max_claim_per_ip = parse_optional_int(row.get("max_claim_per_ip"))
+    except (TypeError, ValueError) as exception:
+        raise FaucetRowError(f"Invalid number: {exception}")
+
+    if payout_satoshis <= 0:
+        raise FaucetRowError("Payout satoshis must be positive")
+
+    return FaucetContract(
+        network=network,
+        passcode=passcode,
+        payout_satoshis=payout_satoshis,
+        owner_address=owner_address,
+        max_claim_count=max_claim_count,
+        max_claim_per_ip=max_claim_per_ip,
+    )
+
+
+def create_faucets(objs:list):
+    """
+        Derives the addresses and inserts the faucets, faucets with an existing address are skipped
+        Returns (created faucets, list of (obj, error) that failed)
+    """
+    errors = []
+    derived = []
+    for obj, (success, compile_data_or_error) in zip(objs, derive_objs(objs)):
+        if not success:
+            errors.append((obj, compile_data_or_error))
+            continue
+        obj.address = compile_data_or_error["address"]
+        derived.append(obj)
+
+    # duplicate rows in the same file
+    unique_objs = list({obj.address: obj for obj in derived}.values())
+    existing = set(
+        FaucetContract.objects.filter(address__in=[obj.address for obj in unique_objs])
+            .values_list("address", flat=True)
+    )
+    new_objs = [obj for obj in unique_objs if obj.address not in existing]
+
+    # bulk_create skips the post_save signals, the subscriptions are queued here instead
+    with transaction.atomic():
+        # an address added since the check above, e.g. by the admin or another run, is skipped
+        # instead of failing the batch, ids aren't returned with ignore_conflicts so the rows are fetched
+        FaucetContract.objects.bulk_create(
+            new_objs, batch_size=settings.BULK_ACTION_BATCH_SIZE, ignore_conflicts=True,
+        )
+        new_objs = list(FaucetContract.objects.filter(address__in=[obj.address for obj in new_objs]))
+
+        queue_subscriptions(new_objs)
+        transaction.on_commit(bump_faucet_index_version)
+
+    return new_objs, errors
@@ -0,0 +1,143 @@
+import threading
+
+from main.js.runner import ScriptFunctions
+
+from .crypto import (
+    CASHADDRESS_PREFIXES,
+    CASHADDRESS_P2SH32,
+    CASHADDRESS_TOKEN_P2SH32,
+    decode_cashaddress,
+    encode_cashaddress,
+    encode_data_push,
+    encode_script_number,
+    hash256,
+)
+from .transaction import (
+    DUST_SATOSHIS,
+    OP_EQUAL,
+    OP_HASH256,
+    address_to_locking_bytecode,
+    serialize_transaction,
+)
+
+# index of the function in the contract, pushed as the function selector
+CLAIM_FUNCTION_SELECTOR = 0
+
+
+class FaucetScript:
+    """
+        Python counterpart of the cashscript `Contract` for `faucet.cash`
+        The compiled bytecode never changes, the contract's redeem script is
+        the constructor parameters pushed in reverse order followed by the bytecode
+    """
+    def __init__(self, bytecode:bytes):
+        self.bytecode = bytes(bytecode)
+
+    @classmethod
+    def encode_params(cls, passcode:str, payout_satoshis:int, owner_address:str):
+        _, _, owner_pkhash = decode_cashaddress(owner_address)
+        if len(owner_pkhash) != 20:
+            raise ValueError(f"Owner address must be a P2PKH address: {owner_address}")
+
+        # same order as the contract's constructor: (int payout, bytes20 ownerPkhash, bytes passcode)
+        return [
+            encode_script_number(int(payout_satoshis)),
+            owner_pkhash,
+            passcode.encode("utf-8"),
+        ]
+
+    def redeem_script(self, passcode:str, payout_satoshis:int, owner_address:str):
+        params = self.encode_params(passcode, payout_satoshis, owner_address)
+        return b"".join(encode_data_push(param) for param in reversed(params)) + self.bytecode
+
+    @classmethod
+    def locking_bytecode(cls, redeem_script:bytes):
+        # p2sh32
+        return bytes([OP_HASH256, 32]) + hash256(redeem_script) + bytes([OP_EQUAL])
+
+    def derive_addresses(self, passcode:str, payout_satoshis:int, owner_address:str, network:str):
+        """
+            Returns the same data as `compileFaucetContract` in node
+        """
+        prefix = CASHADDRESS_PREFIXES[network]
+        script_hash = hash256(self.redeem_script(passcode, payout_satoshis, owner_address))
+        return dict(
+            address=encode_cashaddress(prefix, CASHADDRESS_P2SH32, script_hash),
+            tokenAddress=encode_cashaddress(prefix, CASHADDRESS_TOKEN_P2SH32, script_hash),
+        )
+
+    @classmethod
+    def claim_unlocking_bytecode(cls, redeem_script:bytes, unlock_passcode:str):
+        # function args in reverse order, the function selector, then the redeem script
+        return (
+            encode_data_push(unlock_passcode.encode("utf-8")) +
+            encode_data_push(encode_script_number(CLAIM_FUNCTION_SELECTOR)) +
+            encode_data_push(redeem_script)
+        )
+
+    def build_claim_transaction(
+        self, passcode:str, payout_satoshis:int, owner_address:str,
+        utxo:dict, recipient:str, unlock_passcode:str, tx_fee:int, locktime:int=0,
+    ):
+        """
+            Same transaction as `Faucet.claim` in node given the same locktime
+            utxo is in cashscript format, see Watchtower.parse_as_cashscript_utxo
+            Returns the transaction hex
+        """
+        if utxo.get("token"):
+            raise ValueError("Claiming from token utxos is not supported")
+
+        redeem_script = self.redeem_script(passcode, payout_satoshis, owner_address)
+        remaining_satoshis = int(utxo["satoshis"]) - tx_fee - int(payout_satoshis)
+        if remaining_satoshis < 0:
+            raise ValueError("Not enough satoshis")
+
+        outputs = [
+            dict(satoshis=int(payout_satoshis), locking_bytecode=address_to_locking_bytecode(recipient)),
+        ]
+        if remaining_satoshis >= DUST_SATOSHIS:
+            outputs.append(dict(satoshis=remaining_satoshis, locking_bytecode=self.locking_bytecode(redeem_script)))
+
+        inputs = [
+            dict(
+                txid=utxo["txid"],
+                vout=utxo["vout"],
+                unlocking_bytecode=self.claim_unlocking_bytecode(redeem_script, unlock_passcode),
+            ),
+        ]
+        return serialize_transaction(inputs, outputs, locktime=locktime)
+
+
+_faucet_script = None
+_faucet_script_lock = threading.Lock()
+
+def get_faucet_script():
+    """
+        The bytecode is compiled by cashc in node only once,
+        `faucetContractBytecode` is memoized in ScriptFunctions' shared cache
+    """
+    global _faucet_script
+    if _faucet_script is not None:
+        return _faucet_script
+
+    with _faucet_script_lock:
+        if _faucet_script is None:
+            data = ScriptFunctions.faucetContractBytecode()
+            _faucet_script = FaucetScript(bytes.fromhex(data["bytecode"]))
+
+    return _faucet_script
+
+
+def derive_contract_addresses(passcode:str, payout_satoshis:int, owner_address:str, network:str):
+    return get_faucet_script().derive_addresses(passcode, payout_satoshis, owner_address, network)
+
+
+def build_claim_transaction(obj, utxo:dict, recipient:str, passcode:str, locktime:int=0):
+    return get_faucet_script().build_claim_transaction(
+        obj.passcode, obj.payout_satoshis, obj.owner_address,
+        utxo=utxo,
+        recipient=recipient,
+        unlock_passcode=passcode,
+        tx_fee=obj.claim_tx_fee,
+        locktime=locktime,
+    )
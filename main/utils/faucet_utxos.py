@@ -0,0 +1,447 @@
+import math
+import time
+import select
+import asyncio
+import weakref
+from contextlib import contextmanager
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from main.apps import LOGGER
+from main.models import FaucetClaim, FaucetContract, FaucetUtxo
+
+from .transaction import DUST_SATOSHIS
+from .utxo_stream import Utxo
+from .watchtower_api import get_watchtower
+
+
+def reservation_expiry():
+    return timezone.now() - timezone.timedelta(seconds=settings.FAUCET_UTXO_RESERVATION_TIMEOUT)
+
+
+def sync_grace_period_start():
+    return timezone.now() - timezone.timedelta(seconds=settings.FAUCET_UTXO_SYNC_GRACE_PERIOD)
+
+
+def available_utxos(obj:FaucetContract):
+    return FaucetUtxo.objects.filter(
+        faucet=obj,
+        spent_txid__isnull=True,
+    ).filter(
+        Q(reserved_at__isnull=True) | Q(reserved_at__lt=reservation_expiry()),
+    )
+
+
+def reserve_faucet_utxo(obj:FaucetContract, min_satoshis:int):
+    """
+        Locks the smallest unreserved bch-only utxo with at least `min_satoshis`,
+        concurrent callers skip locked rows so each gets a different utxo
+    """
+    with transaction.atomic():
+        utxo = available_utxos(obj).select_for_update(skip_locked=True).filter(
+            token__isnull=True,
+            satoshis__gte=min_satoshis,
+        ).order_by("satoshis").first()
+
+        if not utxo: return
+
+        utxo.reserved_at = timezone.now()
+        utxo.save(update_fields=["reserved_at"])
+        return utxo
+
+
+def change_funded_utxos(obj:FaucetContract, min_satoshis:int):
+    """
+        Utxos whose change after a claim is enough for another claim
+    """
+    return FaucetUtxo.objects.filter(
+        faucet=obj,
+        spent_txid__isnull=True,
+        token__isnull=True,
+        satoshis__gte=min_satoshis + obj.payout_satoshis + obj.claim_tx_fee,
+    )
+
+
+def in_flight_chained_utxos(obj:FaucetContract, min_satoshis:int):
+    """
+        Utxos reserved by in-flight claims whose change can fund another claim
+    """
+    return change_funded_utxos(obj, min_satoshis).filter(reserved_at__gte=reservation_expiry())
+
+
+def claim_chain_channel(faucet_id:int):
+    return f"faucet_utxos_{faucet_id}"
+
+
+def notify_claim_chain(faucet_id:int):
+    """
+        Wakes the claims in wait_for_claim_chain once the current transaction commits
+    """
+    if connection.vendor != "postgresql": return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, '')", [claim_chain_channel(faucet_id)])
+
+
+@contextmanager
+def listen_claim_chain(obj:FaucetContract):
+    """
+        Listens to notify_claim_chain of the faucet, yields False if notifications can't be received,
+        i.e. not on postgres or inside a transaction, where LISTEN only starts on commit
+    """
+    if connection.vendor != "postgresql" or connection.in_atomic_block:
+        yield False
+        return
+
+    channel = claim_chain_channel(obj.pk)
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {channel}")
+    try:
+        yield True
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f"UNLISTEN {channel}")
+        connection.connection.notifies.clear()
+
+
+def wait_for_claim_chain(obj:FaucetContract, min_satoshis:int, timeout:float):
+    """
+        Waits until an in-flight claim whose change can fund another claim is recorded or released,
+        runs inside listen_claim_chain entered before the failed reservation so no notification is missed
+        Returns False if there is no in-flight claim to wait for or the wait timed out
+    """
+    if timeout <= 0: return False
+    if not in_flight_chained_utxos(obj, min_satoshis).exists(): return False
+
+    raw_connection = connection.connection
+    deadline = time.monotonic() + timeout
+    while not raw_connection.notifies:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0: return False
+        if select.select([raw_connection], [], [], remaining)[0]:
+            raw_connection.poll()
+
+    raw_connection.notifies.clear()
+    return True
+
+
+class ClaimChain:
+    """
+        In-flight async claims of a faucet whose change can fund another claim, async claims
+        in the same process wait on a condition instead of listening to notify_claim_chain,
+        claims in other processes aren't waited for
+    """
+    def __init__(self, faucet_id:int):
+        self.faucet_id = faucet_id
+        self.in_flight = set()
+        self.waiting = 0
+        self.condition = asyncio.Condition()
+
+    def start(self, obj:FaucetContract, utxo:FaucetUtxo):
+        if utxo.satoshis >= 2 * (obj.payout_satoshis + obj.claim_tx_fee):
+            self.in_flight.add(utxo.pk)
+
+    async def finish(self, utxo:FaucetUtxo):
+        async with self.condition:
+            self.in_flight.discard(utxo.pk)
+            self.condition.notify_all()
+        self.drop_if_idle()
+
+    def drop_if_idle(self):
+        """
+            Removes the chain once it has no in-flight or waiting claims, so chains don't pile up
+        """
+        if self.in_flight or self.waiting: return
+
+        chains = _claim_chains.get(asyncio.get_event_loop(), {})
+        if chains.get(self.faucet_id) is self:
+            del chains[self.faucet_id]
+
+
+# event loop => {faucet id: ClaimChain}, the conditions are bound to their loop
+_claim_chains = weakref.WeakKeyDictionary()
+
+def get_claim_chain(obj:FaucetContract, create=True):
+    chains = _claim_chains.setdefault(asyncio.get_event_loop(), {})
+    if create and obj.pk not in chains:
+        chains[obj.pk] = ClaimChain(obj.pk)
+    return chains.get(obj.pk)
+
+
+async def async_reserve_chained_faucet_utxo(obj:FaucetContract, min_satoshis:int, timeout:float=None):
+    """
+        Waits for an in-flight async claim on the same faucet to record its change and reserves it,
+        this chains claims one after another on faucets with a single large utxo
+        Returns None right away if there is no in-flight claim to wait for
+    """
+    if timeout is None:
+        timeout = settings.FAUCET_CLAIM_CHAIN_TIMEOUT
+
+    reserve = sync_to_async(reserve_faucet_utxo)
+    chain = get_claim_chain(obj, create=False)
+    deadline = time.monotonic() + timeout
+    if chain:
+        chain.waiting += 1
+        try:
+            async with chain.condition:
+                while chain.in_flight:
+                    try:
+                        await asyncio.wait_for(chain.condition.wait(), deadline - time.monotonic())
+                    except asyncio.TimeoutError:
+                        return
+
+                    utxo = await reserve(obj, min_satoshis)
+                    if utxo: return utxo
+        finally:
+            chain.waiting -= 1
+            chain.drop_if_idle()
+
+    # the in-flight claim may have just finished
+    return await reserve(obj, min_satoshis)
+
+
+def known_claimable_outpoints(obj:FaucetContract, min_satoshis:int):
+    """
+        Outpoints of the local bch-only utxos with at least `min_satoshis`,
+        when no utxo could be reserved these are all reserved or spent
+    """
+    return set(
+        FaucetUtxo.objects.filter(
+            faucet=obj, token__isnull=True, satoshis__gte=min_satoshis,
+        ).values_list("txid", "vout")
+    )
+
+
+def reserve_found_utxo(obj:FaucetContract, utxo:Utxo):
+    """
+        Adds a utxo found in watchtower to the local set and reserves it
+    """
+    faucet_utxo = add_faucet_utxo(obj, utxo.txid, utxo.vout, utxo.satoshis, token=utxo.token)
+    utxos = reserve_faucet_utxos(obj, [faucet_utxo.pk])
+    if utxos: return utxos[0]
+
+
+def reserve_watchtower_utxo(obj:FaucetContract, min_satoshis:int):
+    """
+        Looks for a claimable utxo missing in the local set, e.g. a deposit the webhook missed,
+        reading watchtower's utxos only until one is found instead of syncing all of them
+    """
+    wt_api = get_watchtower(obj.network)
+    utxo = wt_api.find_bch_utxo(
+        obj.address, min_satoshis, exclude=known_claimable_outpoints(obj, min_satoshis),
+    )
+    if not utxo: return
+    return reserve_found_utxo(obj, utxo)
+
+
+def reserve_faucet_utxos(obj:FaucetContract, utxo_ids:list):
+    """
+        Reserves multiple utxos at once, utxos locked or reserved by claims are skipped
+    """
+    with transaction.atomic():
+        utxos = list(
+            available_utxos(obj).select_for_update(skip_locked=True).filter(pk__in=utxo_ids)
+        )
+        FaucetUtxo.objects.filter(pk__in=[utxo.pk for utxo in utxos]).update(reserved_at=timezone.now())
+        return utxos
+
+
+def release_faucet_utxo(utxo:FaucetUtxo):
+    with transaction.atomic():
+        FaucetUtxo.objects.filter(pk=utxo.pk, spent_txid__isnull=True).update(reserved_at=None)
+        notify_claim_chain(utxo.faucet_id)
+
+
+def spend_faucet_utxos(obj:FaucetContract, outpoints:list, spending_txid:str):
+    """
+        Marks utxos as spent instead of deleting them, so a lagging watchtower
+        can't add them back on the next sync
+    """
+    query = Q()
+    for txid, vout in outpoints:
+        query |= Q(txid=txid, vout=vout)
+    if not query: return 0
+
+    with transaction.atomic():
+        notify_claim_chain(obj.pk)
+        return FaucetUtxo.objects.filter(query, faucet=obj).update(
+            spent_txid=spending_txid,
+            spent_at=timezone.now(),
+            reserved_at=None,
+        )
+
+
+def get_or_add_faucet_utxo(obj:FaucetContract, txid:str, vout:int, satoshis:int, token:dict=None):
+    """
+        Returns (utxo, created)
+    """
+    return FaucetUtxo.objects.get_or_create(
+        txid=txid, vout=vout,
+        defaults=dict(faucet=obj, satoshis=satoshis, token=token or None),
+    )
+
+
+def add_faucet_utxo(obj:FaucetContract, txid:str, vout:int, satoshis:int, token:dict=None):
+    return get_or_add_faucet_utxo(obj, txid, vout, satoshis, token=token)[0]
+
+
+def record_claim_broadcast(obj:FaucetContract, utxo:FaucetUtxo, txid:str):
+    """
+        Applies a broadcasted claim to the local utxo set: the input is spent and
+        the change output (vout 1), if any, is added back to the faucet,
+        claims waiting for the change are notified on commit
+        Returns the change utxo
+    """
+    change_satoshis = utxo.satoshis - obj.claim_tx_fee - obj.payout_satoshis
+
+    with transaction.atomic():
+        spend_faucet_utxos(obj, [(utxo.txid, utxo.vout)], txid)
+        if change_satoshis < DUST_SATOSHIS: return
+        return add_faucet_utxo(obj, txid, 1, change_satoshis)
+
+
+def add_faucet_utxo_from_webhook(obj:FaucetContract, data:dict):
+    """
+        Adds the output notified by the watchtower webhook, ignores payloads without an outpoint
+        Returns (utxo, created)
+    """
+    txid = data.get("txid")
+    vout = data.get("index")
+    if not txid or vout is None: return None, False
+
+    if data.get("value") is not None:
+        satoshis = int(data["value"])
+    elif data.get("amount") is not None:
+        satoshis = round(float(data["amount"]) * 10 ** 8)
+    else:
+        return None, False
+
+    token = None
+    token_id = data.get("tokenid") or data.get("token")
+    if token_id and str(token_id).lower() != "bch":
+        # only tracked to not be used for claims, the full token data comes from the next sync
+        token = dict(category=token_id)
+
+    return get_or_add_faucet_utxo(obj, txid, int(vout), satoshis, token=token)
+
+
+def sync_faucet_utxos(obj:FaucetContract):
+    """
+        Reconciles the local utxo set with watchtower
+        Returns the number of unspent utxos
+    """
+    wt_api = get_watchtower(obj.network)
+    utxos = wt_api.get_bch_utxos(obj.address, parse="cashscript")
+    return apply_watchtower_utxos(obj, utxos)
+
+
+def apply_watchtower_utxos(obj:FaucetContract, utxos:list):
+    """
+        Reconciles the local utxo set with utxos from watchtower in cashscript format
+        Recently created or spent utxos are kept as is since watchtower may not have indexed them yet
+        Returns the number of unspent utxos
+    """
+    grace_period_start = sync_grace_period_start()
+
+    with transaction.atomic():
+        FaucetUtxo.objects.bulk_create([
+            FaucetUtxo(
+                faucet=obj,
+                txid=utxo["txid"],
+                vout=utxo["vout"],
+                satoshis=utxo["satoshis"],
+                token=utxo.get("token"),
+            )
+            for utxo in utxos
+        ], ignore_conflicts=True)
+
+        outpoints = set((utxo["txid"], utxo["vout"]) for utxo in utxos)
+        stale_ids = [
+            pk
+            for pk, txid, vout in FaucetUtxo.objects.filter(
+                faucet=obj, spent_txid__isnull=True, created_at__lt=grace_period_start,
+            ).values_list("pk", "txid", "vout")
+            if (txid, vout) not in outpoints
+        ]
+        FaucetUtxo.objects.filter(pk__in=stale_ids).delete()
+        FaucetUtxo.objects.filter(faucet=obj, spent_at__lt=grace_period_start).delete()
+
+    LOGGER.debug(f"Synced utxos | {obj} | {len(utxos)} from watchtower | {len(stale_ids)} stale")
+    return FaucetUtxo.objects.filter(faucet=obj, spent_txid__isnull=True).count()
+
+
+# Rough p2sh32 ownerUnlock input and p2sh32 output sizes, only for planning
+# the exact fee is computed when building the transaction
+OWNER_UNLOCK_INPUT_SIZE = 260
+P2SH32_OUTPUT_SIZE = 44
+
+
+def estimate_redistribute_fee(input_count:int, output_count:int):
+    return 10 + input_count * OWNER_UNLOCK_INPUT_SIZE + output_count * P2SH32_OUTPUT_SIZE
+
+
+def get_peak_claims_per_minute(obj:FaucetContract, window_seconds:int=3600):
+    since = timezone.now() - timezone.timedelta(seconds=window_seconds)
+    return FaucetClaim.objects.filter(faucet=obj, created_at__gte=since) \
+        .annotate(minute=TruncMinute("created_at")) \
+        .values("minute") \
+        .annotate(count=Count("id")) \
+        .order_by("-count") \
+        .values_list("count", flat=True) \
+        .first() or 0
+
+
+def get_target_utxo_count(obj:FaucetContract):
+    """
+        Number of claimable utxos needed to keep up with the faucet's peak claim rate,
+        each utxo serves one claim at a time for about FAUCET_FANOUT_UTXO_BUSY_SECONDS
+    """
+    peak_per_minute = get_peak_claims_per_minute(obj)
+    target = math.ceil(peak_per_minute * settings.FAUCET_FANOUT_UTXO_BUSY_SECONDS / 60)
+    return min(max(target, 1), settings.FAUCET_FANOUT_MAX_OUTPUTS)
+
+
+def plan_faucet_utxos(obj:FaucetContract, target_count:int=None):
+    """
+        Plans a split of the faucet's balance into `target_count` utxos sized as multiples of
+        `payout_satoshis + claim_tx_fee`, or a consolidation of the utxos too small to claim from
+        Returns dict(action, utxos, output_satoshis, target_count) or None if there is nothing to do
+    """
+    if target_count is None:
+        target_count = get_target_utxo_count(obj)
+    target_count = min(max(int(target_count), 1), settings.FAUCET_FANOUT_MAX_OUTPUTS)
+
+    claim_satoshis = obj.payout_satoshis + obj.claim_tx_fee
+    utxos = list(
+        available_utxos(obj).filter(token__isnull=True).order_by("-satoshis")[:settings.FAUCET_REDISTRIBUTE_MAX_INPUTS]
+    )
+    claimable_utxos = [utxo for utxo in utxos if utxo.satoshis >= claim_satoshis]
+    dust_utxos = [utxo for utxo in utxos if utxo.satoshis < claim_satoshis]
+
+    if len(claimable_utxos) < target_count:
+        total_satoshis = sum(utxo.satoshis for utxo in utxos)
+        fee = estimate_redistribute_fee(len(utxos), target_count)
+        target_count = min(target_count, (total_satoshis - fee) // claim_satoshis)
+        if target_count > len(claimable_utxos) and target_count >= 2:
+            claims_per_utxo = (total_satoshis - fee) // (target_count * claim_satoshis)
+            return dict(
+                action="split",
+                utxos=utxos,
+                # the last output is the remaining balance, added when building the transaction
+                output_satoshis=[claims_per_utxo * claim_satoshis] * (target_count - 1),
+                target_count=target_count,
+            )
+
+    if len(dust_utxos) >= 2:
+        total_satoshis = sum(utxo.satoshis for utxo in dust_utxos)
+        if total_satoshis - estimate_redistribute_fee(len(dust_utxos), 1) >= DUST_SATOSHIS:
+            return dict(
+                action="consolidate",
+                utxos=dust_utxos,
+                output_satoshis=[],
+                target_count=target_count,
+            )
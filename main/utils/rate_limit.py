@@ -0,0 +1,240 @@
+import time
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from main.models import ClaimJob, FaucetClaim, FaucetContract
+
+
+class ClaimRateLimit:
+    """
+        A limit of `limit` claims per `window` seconds a claim is checked against,
+        `scope` is one of "ip", "recipient" or "faucet"
+    """
+    MESSAGES = {
+        "ip": "Already claimed {limit} times in the last {period}, come back again later",
+        "recipient": "Address already claimed {limit} times in the last {period}, come back again later",
+        "faucet": "Faucet reached its limit of {limit} claims in the last {period}, come back again later",
+    }
+
+    def __init__(self, scope:str, faucet:FaucetContract, value:str, limit:int, window:int):
+        self.scope = scope
+        self.faucet = faucet
+        self.value = value
+        self.limit = limit
+        self.window = window
+
+    @property
+    def key(self):
+        return f"claim-rate-limit:{self.scope}:{self.faucet.pk}:{self.value}"
+
+    @property
+    def message(self):
+        hours = self.window / 3600
+        period = f"{hours:g} hours" if hours >= 1 else f"{self.window} seconds"
+        if hours == 1: period = "hour"
+        return self.MESSAGES[self.scope].format(limit=self.limit, period=period)
+
+
+def sliding_window_count(current:float, previous:float, now:float, window:int):
+    """
+        Estimates the count in the last `window` seconds from the counts of the current and
+        previous fixed windows, weighting the previous by how much of it is still in range
+    """
+    elapsed = now % window
+    return previous * (window - elapsed) / window + current
+
+
+class RateLimitBackend:
+    """
+        Counts hits in fixed windows of `window` seconds, subclasses implement `incr` and `get`
+    """
+    records_hits = True
+
+    def incr(self, key:str, delta:int, timeout:int):
+        """
+            Adds `delta` to the counter at `key` and returns the new value
+        """
+        raise NotImplementedError
+
+    def get(self, key:str):
+        raise NotImplementedError
+
+    def hit(self, rate_limit:ClaimRateLimit, now:float=None):
+        """
+            Records a claim and returns the sliding window count including it
+        """
+        if now is None: now = time.time()
+        bucket = int(now // rate_limit.window)
+        # counters are kept for 2 windows, the current and when it becomes the previous
+        current = self.incr(f"{rate_limit.key}:{bucket}", 1, rate_limit.window * 2)
+        previous = self.get(f"{rate_limit.key}:{bucket - 1}")
+        return sliding_window_count(current, previous, now, rate_limit.window)
+
+    def release(self, rate_limit:ClaimRateLimit, at:float):
+        """
+            Removes a hit recorded at `at`, for claims that were not sent
+        """
+        bucket = int(at // rate_limit.window)
+        if bucket < int(time.time() // rate_limit.window) - 1: return
+        self.incr(f"{rate_limit.key}:{bucket}", -1, rate_limit.window * 2)
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+        Counters of the current process only, for tests and single process deployments
+    """
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key, delta, timeout):
+        now = time.monotonic()
+        with self._lock:
+            value, expires_at = self._counters.get(key, (0, now + timeout))
+            if expires_at < now: value, expires_at = 0, now + timeout
+            value = max(value + delta, 0)
+            self._counters[key] = (value, expires_at)
+
+            # drop expired counters every now and then to keep memory bounded
+            if len(self._counters) > 10000:
+                self._counters = {k: v for k, v in self._counters.items() if v[1] >= now}
+            return value
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._counters.get(key, (0, 0))
+            return value if expires_at >= time.monotonic() else 0
+
+
+class CacheRateLimitBackend(RateLimitBackend):
+    """
+        Counters in a django cache, the cache must be shared by every web process
+        and support atomic increments e.g. redis or memcached
+    """
+    def __init__(self, cache_name:str="default"):
+        self.cache = caches[cache_name]
+
+    def incr(self, key, delta, timeout):
+        if self.cache.add(key, max(delta, 0), timeout=timeout):
+            return max(delta, 0)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # expired between add & incr
+            self.cache.set(key, max(delta, 0), timeout=timeout)
+            return max(delta, 0)
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+    """
+        Counts the claims and queued claim jobs in the window, works without a shared cache
+        Counting stops at `limit + 1` rows, so each check reads a bounded number of index entries
+    """
+    records_hits = False
+
+    SCOPE_FIELDS = {
+        "ip": "ip",
+        "recipient": "recipient",
+        "faucet": None,
+    }
+
+    def count(self, rate_limit:ClaimRateLimit):
+        since = timezone.now() - timezone.timedelta(seconds=rate_limit.window)
+        filters = dict(faucet=rate_limit.faucet)
+        field = self.SCOPE_FIELDS[rate_limit.scope]
+        if field: filters[field] = rate_limit.value
+
+        max_rows = rate_limit.limit + 1
+        claims = FaucetClaim.objects.filter(created_at__gte=since, **filters)
+        count = claims.values("pk")[:max_rows].count()
+        if count >= max_rows: return count
+
+        # queued claims count against the limit as well
+        jobs = ClaimJob.objects.filter(
+            status__in=[ClaimJob.Status.pending, ClaimJob.Status.processing], **filters,
+        )
+        return count + jobs.values("pk")[:max_rows - count].count()
+
+    def hit(self, rate_limit, now=None):
+        # the claim job created after the check is the hit
+        return self.count(rate_limit) + 1
+
+    def release(self, rate_limit, at):
+        pass
+
+
+RATE_LIMIT_BACKENDS = {
+    "memory": MemoryRateLimitBackend,
+    "cache": CacheRateLimitBackend,
+    "database": DatabaseRateLimitBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_rate_limit_backend():
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    with _backend_lock:
+        if _backend is None:
+            backend_class = RATE_LIMIT_BACKENDS[settings.CLAIM_RATE_LIMIT_BACKEND]
+            if backend_class is CacheRateLimitBackend:
+                _backend = backend_class(settings.CLAIM_RATE_LIMIT_CACHE)
+            else:
+                _backend = backend_class()
+    return _backend
+
+
+def get_claim_rate_limits(faucet:FaucetContract, ip:str, recipient:str):
+    rate_limits = []
+    if faucet.max_claim_per_ip and ip:
+        rate_limits.append(ClaimRateLimit("ip", faucet, ip, faucet.max_claim_per_ip, 24 * 60 * 60))
+
+    # (limit, window seconds) or None to disable
+    if settings.CLAIM_RATE_LIMIT_PER_RECIPIENT:
+        limit, window = settings.CLAIM_RATE_LIMIT_PER_RECIPIENT
+        rate_limits.append(ClaimRateLimit("recipient", faucet, recipient, limit, window))
+
+    if settings.CLAIM_RATE_LIMIT_PER_FAUCET:
+        limit, window = settings.CLAIM_RATE_LIMIT_PER_FAUCET
+        rate_limits.append(ClaimRateLimit("faucet", faucet, "", limit, window))
+
+    return rate_limits
+
+
+def check_claim_rate_limits(faucet:FaucetContract, ip:str, recipient:str, backend:RateLimitBackend=None):
+    """
+        Records the claim against each limit, the hits are undone if any limit is exceeded
+        Returns the error message of the exceeded limit or None
+    """
+    if backend is None: backend = get_rate_limit_backend()
+    now = time.time()
+
+    hits = []
+    for rate_limit in get_claim_rate_limits(faucet, ip, recipient):
+        count = backend.hit(rate_limit, now=now)
+        hits.append(rate_limit)
+        if count > rate_limit.limit:
+            for hit in hits:
+                backend.release(hit, now)
+            return rate_limit.message
+
+
+def release_claim_rate_limits(job:ClaimJob, backend:RateLimitBackend=None):
+    """
+        Undoes the hits of a claim job that failed, so it doesn't count against the limits
+    """
+    if backend is None: backend = get_rate_limit_backend()
+    if not backend.records_hits: return
+
+    at = job.created_at.timestamp()
+    for rate_limit in get_claim_rate_limits(job.faucet, job.ip, job.recipient):
+        backend.release(rate_limit, at)
@@ -0,0 +1,84 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from main.apps import LOGGER
+from main.models import FaucetClaim
+
+
+def get_recent_claims_key(network:str=None):
+    return f"recent-claims:{network or 'all'}"
+
+
+def serialize_recent_claim(claim:FaucetClaim):
+    return dict(
+        id=claim.id,
+        network=claim.network,
+        recipient=claim.recipient,
+        txid=claim.txid,
+        tx_link=claim.tx_link,
+        created_at=claim.created_at,
+    )
+
+
+def query_recent_claims(network:str=None):
+    queryset = FaucetClaim.objects.order_by("-created_at", "-id")
+    if network:
+        queryset = queryset.filter(network=network)
+
+    return [serialize_recent_claim(claim) for claim in queryset[:settings.RECENT_CLAIMS_COUNT]]
+
+
+def get_recent_claims(network:str=None):
+    """
+        Latest claims from the cache, only queried when the cache is empty
+        Pass `network` for a single network's claims
+    """
+    cache = caches[settings.RECENT_CLAIMS_CACHE]
+    key = get_recent_claims_key(network)
+    recent_claims = cache.get(key)
+    if recent_claims is None:
+        recent_claims = query_recent_claims(network)
+        # add instead of set to not overwrite a newer feed from add_recent_claim
+        cache.add(key, recent_claims, timeout=settings.RECENT_CLAIMS_CACHE_TIMEOUT)
+    return recent_claims
+
+
+def add_recent_claim(claim:FaucetClaim, network:str=None):
+    """
+        Writes a new claim through to the cached feed, called after the claim is committed
+        Concurrent writers take turns on a lock key so none overwrites another's claim
+    """
+    cache = caches[settings.RECENT_CLAIMS_CACHE]
+    key = get_recent_claims_key(network)
+    lock_key = f"{key}:lock"
+
+    deadline = time.monotonic() + settings.RECENT_CLAIMS_LOCK_TIMEOUT
+    while not cache.add(lock_key, True, timeout=settings.RECENT_CLAIMS_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            LOGGER.warning(f"Recent claims cache is locked, clearing it | {key}")
+            cache.delete(key)
+            return
+        time.sleep(0.01)
+
+    try:
+        recent_claims = cache.get(key)
+        if recent_claims is None:
+            recent_claims = query_recent_claims(network)
+        else:
+            recent_claims = [item for item in recent_claims if item["id"] != claim.id]
+            recent_claims.append(serialize_recent_claim(claim))
+            recent_claims.sort(key=lambda item: (item["created_at"], item["id"]), reverse=True)
+            recent_claims = recent_claims[:settings.RECENT_CLAIMS_COUNT]
+        cache.set(key, recent_claims, timeout=settings.RECENT_CLAIMS_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def add_recent_claim_to_feeds(claim:FaucetClaim):
+    for feed_network in [None, claim.network]:
+        try:
+            add_recent_claim(claim, feed_network)
+        except Exception as exception:
+            LOGGER.exception(exception)
@@ -0,0 +1,79 @@
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from main.apps import LOGGER
+from main.models import FaucetContract, WatchtowerSubscription
+
+from .bulk_actions import subscribe_faucets
+
+
+def queue_subscriptions(faucets:list):
+    """
+        Call in the same transaction that creates the faucets
+    """
+    return WatchtowerSubscription.objects.bulk_create([
+        WatchtowerSubscription(faucet=faucet) for faucet in faucets
+    ])
+
+
+def get_retry_delay(attempts:int):
+    """
+        Exponential backoff with jitter, capped at WATCHTOWER_SUBSCRIPTION_MAX_BACKOFF
+    """
+    delay = min(
+        settings.WATCHTOWER_SUBSCRIPTION_BACKOFF * 2 ** max(attempts - 1, 0),
+        settings.WATCHTOWER_SUBSCRIPTION_MAX_BACKOFF,
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def take_due_subscriptions(limit:int, faucet_ids:list=None):
+    """
+        Leases the subscriptions due for an attempt so concurrent dispatchers skip them,
+        a lease left by a dispatcher that died expires after WATCHTOWER_SUBSCRIPTION_LEASE
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = WatchtowerSubscription.objects.select_for_update(skip_locked=True) \
+            .filter(delivered_at__isnull=True, next_attempt_at__lte=now)
+        if faucet_ids is not None:
+            queryset = queryset.filter(faucet_id__in=faucet_ids)
+
+        subscriptions = list(queryset.order_by("next_attempt_at")[:limit])
+        WatchtowerSubscription.objects.filter(pk__in=[subscription.pk for subscription in subscriptions]) \
+            .update(next_attempt_at=now + timezone.timedelta(seconds=settings.WATCHTOWER_SUBSCRIPTION_LEASE))
+    return subscriptions
+
+
+def dispatch_subscriptions(limit:int=None, faucet_ids:list=None, max_workers:int=None):
+    """
+        Subscribes a batch of due faucets concurrently, failed ones are retried with backoff
+        Returns a BulkActionResult or None if there was nothing to dispatch
+    """
+    if limit is None: limit = settings.WATCHTOWER_SUBSCRIPTION_BATCH_SIZE
+    subscriptions = take_due_subscriptions(limit, faucet_ids=faucet_ids)
+    if not subscriptions: return
+
+    faucets = FaucetContract.objects.in_bulk([subscription.faucet_id for subscription in subscriptions])
+    result = subscribe_faucets(list(faucets.values()), max_workers=max_workers)
+    errors = { faucet.pk: error for faucet, error in result.failed }
+
+    now = timezone.now()
+    for subscription in subscriptions:
+        error = errors.get(subscription.faucet_id)
+        subscription.attempts += 1
+        if error is None:
+            subscription.delivered_at = now
+            subscription.last_error = None
+        else:
+            subscription.last_error = error
+            subscription.next_attempt_at = now + timezone.timedelta(seconds=get_retry_delay(subscription.attempts))
+
+    WatchtowerSubscription.objects.bulk_update(
+        subscriptions, ["attempts", "delivered_at", "last_error", "next_attempt_at"],
+    )
+    LOGGER.info(f"Dispatched watchtower subscriptions | {result.summary}")
+    return result
@@ -0,0 +1,67 @@
+from .crypto import decode_cashaddress
+
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xa9
+OP_HASH256 = 0xaa
+OP_CHECKSIG = 0xac
+
+DEFAULT_SEQUENCE = 0xfffffffe
+DUST_SATOSHIS = 546
+
+
+def encode_varint(value:int):
+    if value < 0xfd:
+        return value.to_bytes(1, "little")
+    if value <= 0xffff:
+        return b"\xfd" + value.to_bytes(2, "little")
+    if value <= 0xffffffff:
+        return b"\xfe" + value.to_bytes(4, "little")
+    return b"\xff" + value.to_bytes(8, "little")
+
+
+def address_to_locking_bytecode(address:str):
+    """
+        Same as cashscript's addressToLockScript, token aware addresses have the same locking bytecode
+    """
+    _, version, payload = decode_cashaddress(address)
+    address_type = (version >> 3) & 0x0f
+
+    # p2pkh & p2pkh with tokens
+    if address_type in (0, 2) and len(payload) == 20:
+        return bytes([OP_DUP, OP_HASH160, 20]) + payload + bytes([OP_EQUALVERIFY, OP_CHECKSIG])
+
+    # p2sh & p2sh with tokens
+    if address_type in (1, 3) and len(payload) == 20:
+        return bytes([OP_HASH160, 20]) + payload + bytes([OP_EQUAL])
+    if address_type in (1, 3) and len(payload) == 32:
+        return bytes([OP_HASH256, 32]) + payload + bytes([OP_EQUAL])
+
+    raise ValueError(f"Unsupported address type: {address}")
+
+
+def serialize_transaction(inputs:list, outputs:list, version:int=2, locktime:int=0):
+    """
+        inputs: list of dict(txid:str, vout:int, unlocking_bytecode:bytes, sequence:int)
+        outputs: list of dict(satoshis:int, locking_bytecode:bytes), outputs with tokens are not supported
+        Returns the transaction hex
+    """
+    data = bytearray(version.to_bytes(4, "little"))
+
+    data += encode_varint(len(inputs))
+    for tx_input in inputs:
+        data += bytes.fromhex(tx_input["txid"])[::-1]
+        data += int(tx_input["vout"]).to_bytes(4, "little")
+        data += encode_varint(len(tx_input["unlocking_bytecode"]))
+        data += tx_input["unlocking_bytecode"]
+        data += tx_input.get("sequence", DEFAULT_SEQUENCE).to_bytes(4, "little")
+
+    data += encode_varint(len(outputs))
+    for tx_output in outputs:
+        data += int(tx_output["satoshis"]).to_bytes(8, "little")
+        data += encode_varint(len(tx_output["locking_bytecode"]))
+        data += tx_output["locking_bytecode"]
+
+    data += int(locktime).to_bytes(4, "little")
+    return data.hex()
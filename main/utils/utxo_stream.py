@@ -0,0 +1,134 @@
+import json
+import codecs
+
+from bitcash.network.meta import Unspent
+
+
+class UtxoStreamError(Exception):
+    pass
+
+
+class Utxo:
+    """
+        Compact utxo from a watchtower response, only keeps what claims and sweeps need
+    """
+    __slots__ = ("txid", "vout", "satoshis", "token")
+
+    def __init__(self, txid:str, vout:int, satoshis:int, token:dict=None):
+        self.txid = txid
+        self.vout = vout
+        self.satoshis = satoshis
+        self.token = token
+
+    def __repr__(self):
+        return f"Utxo({self.txid}:{self.vout}, {self.satoshis})"
+
+    @classmethod
+    def from_watchtower(cls, data:dict):
+        token = None
+        if data.get("is_cashtoken"):
+            token = dict(category=data["tokenid"], amount=data["amount"])
+            if data.get("capability"):
+                token["nft"] = dict(capability=data["capability"], commitment=data["commitment"])
+
+        return cls(data["txid"], data["vout"], data["value"], token=token)
+
+    def as_cashscript(self):
+        """
+            Same format as Watchtower.parse_as_cashscript_utxo
+        """
+        data = dict(txid=self.txid, vout=self.vout, satoshis=self.satoshis)
+        if self.token:
+            data["token"] = self.token
+        return data
+
+    def as_bitcash(self):
+        token = self.token or {}
+        nft = token.get("nft") or {}
+        return Unspent(
+            self.satoshis, 0, "", self.txid, self.vout,
+            category_id = token.get("category"),
+            nft_capability = nft.get("capability"),
+            nft_commitment = nft.get("commitment"),
+            token_amount = token.get("amount"),
+        )
+
+
+class JsonArrayParser:
+    """
+        Incremental parser for the items of the array at `key` of a json object,
+        `feed()` the response as it is received and it returns the items completed so far
+        The key is searched as is, so it must come before any string containing it
+    """
+    def __init__(self, key:str):
+        self.key = key
+        self.done = False
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._in_array = False
+
+    def feed(self, chunk:bytes):
+        if self.done: return []
+        self._buffer += self._text_decoder.decode(chunk)
+
+        if not self._in_array:
+            key_index = self._buffer.find(f'"{self.key}"')
+            array_index = self._buffer.find("[", key_index) if key_index >= 0 else -1
+            if array_index < 0: return []
+            self._buffer = self._buffer[array_index + 1:]
+            self._in_array = True
+
+        items = []
+        position = 0
+        buffer = self._buffer
+        while True:
+            # skip separators between items
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+
+            if position >= len(buffer): break
+            if buffer[position] == "]":
+                self.done = True
+                break
+
+            try:
+                item, position = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the item may be split across chunks
+                break
+            items.append(item)
+
+        # only keep the incomplete item for the next chunk
+        self._buffer = buffer[position:]
+        return items
+
+    def close(self):
+        if not self._in_array:
+            raise UtxoStreamError(f"Missing '{self.key}' in response")
+        if not self.done:
+            raise UtxoStreamError(f"Response ended before the end of the array: {self._buffer[:100]}")
+
+
+def iter_json_array_items(chunks, key:str):
+    """
+        Yields the items of the array at `key` as they are received,
+        `chunks` is an iterable of bytes e.g. response.iter_content()
+    """
+    parser = JsonArrayParser(key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done: return
+    parser.close()
+
+
+def first_matching(utxos, min_satoshis:int=0, allow_token:bool=False, exclude:set=None):
+    """
+        Returns the first utxo with at least `min_satoshis`, stops consuming `utxos` once found
+        `exclude` is a set of (txid, vout) to skip
+    """
+    for utxo in utxos:
+        if utxo.satoshis < min_satoshis: continue
+        if utxo.token and not allow_token: continue
+        if exclude and (utxo.txid, utxo.vout) in exclude: continue
+        return utxo
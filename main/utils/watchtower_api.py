@@ -1,21 +1,163 @@
+import os
 import json
+import time
+import random
 import requests
+import threading
 from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
 from bitcash.network.meta import Unspent
 
 from django.conf import settings
 
+from .utxo_stream import Utxo, UtxoStreamError, first_matching, iter_json_array_items
+
 
 class WatchtowerException(Exception):
     pass
 
+class WatchtowerUnavailable(WatchtowerException):
+    pass
+
+
+class CircuitBreaker:
+    """
+        Opens after `failure_threshold` consecutive failures so calls fail fast
+        instead of waiting on a degraded watchtower, after `reset_timeout` seconds
+        a single trial call is let through and closes it again on success
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class WatchtowerStats:
+    """
+        Counters of a client's calls, latencies are per endpoint in seconds
+        `in_flight` against the pool size shows how much of the connection pool is used
+    """
+    def __init__(self, pool_size:int):
+        self.pool_size = pool_size
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latency = {}
+        self._lock = threading.Lock()
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self, endpoint:str, duration:float, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            if error: self.errors += 1
+
+            latency = self.latency.setdefault(endpoint, dict(count=0, total=0.0, max=0.0))
+            latency["count"] += 1
+            latency["total"] += duration
+            latency["max"] = max(latency["max"], duration)
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def request_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                requests=self.requests,
+                errors=self.errors,
+                retries=self.retries,
+                rejected=self.rejected,
+                in_flight=self.in_flight,
+                max_in_flight=self.max_in_flight,
+                pool_size=self.pool_size,
+                latency={
+                    endpoint: dict(
+                        count=latency["count"],
+                        avg=latency["total"] / latency["count"],
+                        max=latency["max"],
+                    )
+                    for endpoint, latency in self.latency.items()
+                },
+            )
+
+
 class Watchtower:
     WatchtowerException = WatchtowerException
 
+    # only these are retried, a failed broadcast or subscription is left to the caller
+    RETRY_METHODS = {"GET", "HEAD", "OPTIONS"}
+
     def __init__(self, network="mainnet"):
+        """
+            Use get_watchtower() instead to reuse connections across calls
+        """
         self._network = network
-        self._session = requests.Session()
-        self._session.headers["Accept"] = "application/json"
+        self._session = self.create_session()
+
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=settings.WATCHTOWER_CIRCUIT_BREAKER_THRESHOLD,
+            reset_timeout=settings.WATCHTOWER_CIRCUIT_BREAKER_RESET_TIMEOUT,
+        )
+        self.stats = WatchtowerStats(settings.WATCHTOWER_POOL_SIZE)
+
+    def create_session(self):
+        pool_size = settings.WATCHTOWER_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        session = requests.Session()
+        session.headers["Accept"] = "application/json"
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
     @property
     def base_url(self):
@@ -35,10 +177,58 @@ class Watchtower:
 
         return urljoin(base_url, path)
 
+    @classmethod
+    def get_endpoint(cls, path:str):
+        """
+            First segment of the api path, e.g. "utxo" for "utxo/bch/<address>/"
+        """
+        return path.strip("/").split("/")[0]
+
+    @classmethod
+    def get_timeout(cls, endpoint:str):
+        timeouts = settings.WATCHTOWER_TIMEOUTS
+        return timeouts.get(endpoint, timeouts["default"])
+
     def _request(self, method, url, *args, **kwargs):
         full_url = self.generate_url(url)
-        if not full_url: BCMRException("Unable to construct api url")
-        return self._session.request(method.upper(), full_url, *args, **kwargs)
+        if not full_url: raise WatchtowerException("Unable to construct api url")
+
+        method = method.upper()
+        endpoint = self.get_endpoint(url)
+        kwargs.setdefault("timeout", self.get_timeout(endpoint))
+        retries = settings.WATCHTOWER_MAX_RETRIES if method in self.RETRY_METHODS else 0
+
+        for attempt in range(retries + 1):
+            if attempt:
+                # full jitter so clients that failed together don't retry together
+                time.sleep(random.uniform(0, settings.WATCHTOWER_RETRY_BACKOFF * 2 ** (attempt - 1)))
+
+            if not self.circuit_breaker.allow_request():
+                self.stats.request_rejected()
+                raise WatchtowerUnavailable(f"Watchtower ({self._network}) is unavailable, try again later")
+
+            if attempt: self.stats.retried()
+
+            response = None
+            error = None
+            start = time.monotonic()
+            self.stats.request_started()
+            try:
+                response = self._session.request(method, full_url, *args, **kwargs)
+            except requests.RequestException as exception:
+                error = exception
+
+            failed = response is None or response.status_code >= 500
+            self.stats.request_finished(endpoint, time.monotonic() - start, error=failed)
+            if not failed:
+                self.circuit_breaker.record_success()
+                return response
+
+            self.circuit_breaker.record_failure()
+
+        if response is not None:
+            return response
+        raise WatchtowerException(f"Watchtower request failed: {error}") from error
 
     @classmethod
     def parse_as_bitcash_utxo(cls, data:dict):
@@ -87,7 +277,7 @@ class Watchtower:
         # raise Exception(f"response | {response.content}")
         try:
             response_data = response.json()
-        except json.JsonDecodeError:
+        except json.JSONDecodeError:
             raise WatchtowerException(f"Invalid utxos response: {response.content} ")
 
         if parse == "bitcash":
@@ -97,6 +287,24 @@ class Watchtower:
 
         return response_data
 
+    def iter_utxos_response(self, response):
+        """
+            Yields Utxo objects while the response is being read, closes the response
+            when the generator is exhausted or closed
+        """
+        try:
+            if not response.ok:
+                raise WatchtowerException(f"Failed to fetch utxos. Status: {response.status_code}")
+
+            chunks = response.iter_content(chunk_size=settings.WATCHTOWER_STREAM_CHUNK_SIZE)
+            try:
+                for data in iter_json_array_items(chunks, "utxos"):
+                    yield Utxo.from_watchtower(data)
+            except UtxoStreamError as exception:
+                raise WatchtowerException(f"Invalid utxos response: {exception}")
+        finally:
+            response.close()
+
     def get_balance(self, address):
         response = self._request("get", f"balance/bch/{address}/")
         if not response.ok:
@@ -104,12 +312,36 @@ class Watchtower:
         response_data = response.json()
         return response_data
 
+    def iter_bch_utxos(self, address, confirmed=None):
+        params = {}
+        if isinstance(confirmed, bool):
+            params["confirmed"] = str(confirmed).lower()
+
+        response = self._request("get", f"utxo/bch/{address}/", params=params, stream=True)
+        return self.iter_utxos_response(response)
+
+    def find_bch_utxo(self, address, min_satoshis:int, exclude:set=None, confirmed=None):
+        """
+            Returns the first bch-only utxo with at least `min_satoshis`,
+            the rest of the response is not downloaded
+        """
+        utxos = self.iter_bch_utxos(address, confirmed=confirmed)
+        try:
+            return first_matching(utxos, min_satoshis=min_satoshis, exclude=exclude)
+        finally:
+            utxos.close()
+
     def get_bch_utxos(self, address, confirmed=None, parse=None):
+        if parse == "bitcash":
+            return [utxo.as_bitcash() for utxo in self.iter_bch_utxos(address, confirmed=confirmed)]
+        elif parse == "cashscript":
+            return [utxo.as_cashscript() for utxo in self.iter_bch_utxos(address, confirmed=confirmed)]
+
         params = {}
         if isinstance(confirmed, bool):
-            params["confirmed"] = str(params).lower()
+            params["confirmed"] = str(confirmed).lower()
 
-        response = self._request("get", f"utxo/bch/{address}/")
+        response = self._request("get", f"utxo/bch/{address}/", params=params)
         return self.parse_utxos_response(response, parse=parse)
 
     def get_cashtoken_utxos(self, tokenaddress, category_id=None, confirmed=None, parse=False):
@@ -120,9 +352,9 @@ class Watchtower:
 
         params = {}
         if isinstance(confirmed, bool):
-            params["confirmed"] = str(params).lower()
+            params["confirmed"] = str(confirmed).lower()
 
-        response = self._request("get", url_path)
+        response = self._request("get", url_path, params=params)
         return self.parse_utxos_response(response, parse=parse)
 
     def transaction_outputs(self, **kwargs):
@@ -171,3 +403,37 @@ class Watchtower:
         success = response.ok and response.json().get("success")
         error = response.ok and response.json().get("error")
         return success, error
+
+
+_watchtowers = {}
+_watchtowers_lock = threading.Lock()
+
+def get_watchtower(network="mainnet"):
+    """
+        Process-wide client per network, the connection pool, circuit breaker and
+        stats are shared by every caller in the process
+    """
+    key = (os.getpid(), network)
+    wt_api = _watchtowers.get(key)
+    if wt_api is not None:
+        return wt_api
+
+    with _watchtowers_lock:
+        # clients of a parent process must not be used after a fork, e.g. gunicorn workers
+        for stale_key in [k for k in _watchtowers if k[0] != os.getpid()]:
+            del _watchtowers[stale_key]
+
+        if key not in _watchtowers:
+            _watchtowers[key] = Watchtower(network=network)
+        return _watchtowers[key]
+
+
+def get_watchtower_stats():
+    return {
+        network: dict(
+            **wt_api.stats.get_stats(),
+            circuit_breaker=wt_api.circuit_breaker.state,
+        )
+        for (pid, network), wt_api in list(_watchtowers.items())
+        if pid == os.getpid()
+    }
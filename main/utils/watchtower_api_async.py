@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import httpx
+import random
+import asyncio
+
+from django.conf import settings
+
+from .utxo_stream import JsonArrayParser, Utxo, UtxoStreamError, first_matching
+from .watchtower_api import Watchtower, WatchtowerException, WatchtowerUnavailable, get_watchtower
+
+
+class AsyncWatchtower(Watchtower):
+    """
+        asyncio version of Watchtower with the same methods, for the ASGI views
+        Use get_async_watchtower() to share the client's connections, a client created directly
+        is used as `async with AsyncWatchtower(network=...) as wt_api:` or closed with `aclose()`
+    """
+    def __init__(self, network="mainnet", client:httpx.AsyncClient=None):
+        super().__init__(network=network)
+        self._owns_client = client is None
+        self._client = client or self.create_client()
+
+    def create_session(self):
+        # requests are sent with the httpx client
+        return None
+
+    def create_client(self):
+        pool_size = settings.WATCHTOWER_POOL_SIZE
+        return httpx.AsyncClient(
+            headers={ "Accept": "application/json" },
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._owns_client:
+            await self._client.aclose()
+
+    @classmethod
+    def get_timeout(cls, endpoint:str):
+        connect_timeout, read_timeout = super().get_timeout(endpoint)
+        return httpx.Timeout(read_timeout, connect=connect_timeout, pool=settings.WATCHTOWER_ASYNC_POOL_TIMEOUT)
+
+    async def _request(self, method, url, *args, stream=False, **kwargs):
+        """
+            Same as Watchtower._request, a streamed response must be closed with `aclose()`
+        """
+        full_url = self.generate_url(url)
+        if not full_url: raise WatchtowerException("Unable to construct api url")
+
+        method = method.upper()
+        endpoint = self.get_endpoint(url)
+        kwargs.setdefault("timeout", self.get_timeout(endpoint))
+        retries = settings.WATCHTOWER_MAX_RETRIES if method in self.RETRY_METHODS else 0
+
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, settings.WATCHTOWER_RETRY_BACKOFF * 2 ** (attempt - 1)))
+
+            if not self.circuit_breaker.allow_request():
+                self.stats.request_rejected()
+                raise WatchtowerUnavailable(f"Watchtower ({self._network}) is unavailable, try again later")
+
+            if attempt: self.stats.retried()
+
+            response = None
+            error = None
+            start = time.monotonic()
+            self.stats.request_started()
+            try:
+                request = self._client.build_request(method, full_url, *args, **kwargs)
+                response = await self._client.send(request, stream=stream)
+            except httpx.HTTPError as exception:
+                error = exception
+
+            failed = response is None or response.status_code >= 500
+            self.stats.request_finished(endpoint, time.monotonic() - start, error=failed)
+            if not failed:
+                self.circuit_breaker.record_success()
+                return response
+
+            self.circuit_breaker.record_failure()
+            if response is not None and attempt < retries:
+                await response.aclose()
+
+        if response is not None:
+            return response
+        raise WatchtowerException(f"Watchtower request failed: {error}") from error
+
+    def parse_utxos_response(self, response, parse=None):
+        if not response.is_success:
+            raise WatchtowerException(f"Failed to fetch utxos. Status: {response.status_code}")
+        try:
+            response_data = response.json()
+        except json.JSONDecodeError:
+            raise WatchtowerException(f"Invalid utxos response: {response.content} ")
+
+        if parse == "bitcash":
+            return [self.parse_as_bitcash_utxo(utxo) for utxo in response_data["utxos"]]
+        elif parse == "cashscript":
+            return [self.parse_as_cashscript_utxo(utxo) for utxo in response_data["utxos"]]
+
+        return response_data
+
+    async def get_balance(self, address):
+        response = await self._request("get", f"balance/bch/{address}/")
+        if not response.is_success:
+            raise WatchtowerException(response.content)
+        return response.json()
+
+    async def get_bch_utxos(self, address, confirmed=None, parse=None):
+        params = {}
+        if isinstance(confirmed, bool):
+            params["confirmed"] = str(confirmed).lower()
+
+        response = await self._request("get", f"utxo/bch/{address}/", params=params)
+        return self.parse_utxos_response(response, parse=parse)
+
+    async def find_bch_utxo(self, address, min_satoshis:int, exclude:set=None, confirmed=None):
+        """
+            Same as Watchtower.find_bch_utxo, stops reading the response once a utxo is found
+        """
+        params = {}
+        if isinstance(confirmed, bool):
+            params["confirmed"] = str(confirmed).lower()
+
+        response = await self._request("get", f"utxo/bch/{address}/", params=params, stream=True)
+        try:
+            if not response.is_success:
+                raise WatchtowerException(f"Failed to fetch utxos. Status: {response.status_code}")
+
+            parser = JsonArrayParser("utxos")
+            async for chunk in response.aiter_bytes():
+                utxos = (Utxo.from_watchtower(data) for data in parser.feed(chunk))
+                utxo = first_matching(utxos, min_satoshis=min_satoshis, exclude=exclude)
+                if utxo or parser.done: return utxo
+            parser.close()
+        except UtxoStreamError as exception:
+            raise WatchtowerException(f"Invalid utxos response: {exception}")
+        except httpx.HTTPError as exception:
+            raise WatchtowerException(f"Watchtower request failed: {exception}") from exception
+        finally:
+            await response.aclose()
+
+    async def get_cashtoken_utxos(self, tokenaddress, category_id=None, confirmed=None, parse=False):
+        url_path = f"utxo/ct/{tokenaddress}/"
+        if category_id: url_path += f"{category_id}/"
+
+        params = {}
+        if isinstance(confirmed, bool):
+            params["confirmed"] = str(confirmed).lower()
+
+        response = await self._request("get", url_path, params=params)
+        return self.parse_utxos_response(response, parse=parse)
+
+    async def transaction_outputs(self, **kwargs):
+        response = await self._request("get", "transactions/outputs/", params=kwargs)
+        return response.json()
+
+    async def get_spending_txid(self, txid:str, vout:int):
+        params = { "txid": txid, "index": str(int(vout)), "limit": 1 }
+        response = await self._request("get", "transactions/outputs/", params=params)
+        response_data = response.json()
+
+        results = response_data.get("results")
+        if not isinstance(results, list) or not len(results):
+            return
+
+        return results[0]["spending_txid"]
+
+    async def broadcast(self, tx_hex):
+        data = { "transaction": tx_hex }
+        response = await self._request("post", "broadcast/", data=data)
+        response_data = response.json()
+
+        if not response_data.get("success"):
+            raise WatchtowerException(response_data.get("error") or response_data)
+
+        return response_data
+
+    async def verify_transaction(self, tx_hex):
+        data = { "transaction": tx_hex }
+        response = await self._request("post", "stablehedge/test-utils/test_mempool_accept/", data=data)
+        response_data = response.json()
+
+        if not response_data.get("success"):
+            raise WatchtowerException(response_data.get("error") or response_data)
+
+        return response_data
+
+    async def subscribe_address(self, address, webhook_url:str=None):
+        project_id = settings.WATCHTOWER_PROJECT_ID
+        if self._network == "chipnet":
+            project_id = settings.WATCHTOWER_CHIPNET_PROJECT_ID
+        data = dict(address=address, project_id=project_id)
+        if webhook_url:
+            data["webhook_url"] = webhook_url
+
+        response = await self._request("post", "subscription/", data=data)
+        success = response.is_success and response.json().get("success")
+        error = response.is_success and response.json().get("error")
+        return success, error
+
+
+_async_watchtowers = {}
+
+def get_async_watchtower(network="mainnet"):
+    """
+        Client per network shared by the claims of the process, httpx connections are bound
+        to the event loop that opened them so a new client is made for a new loop
+        The circuit breaker is the sync client's, both stop calling a degraded watchtower together
+    """
+    loop = asyncio.get_event_loop()
+    key = (os.getpid(), network)
+    shared_loop, wt_api = _async_watchtowers.get(key, (None, None))
+    if wt_api is not None and shared_loop is loop:
+        return wt_api
+
+    # clients of a parent process must not be used after a fork
+    for stale_key in [k for k in _async_watchtowers if k[0] != os.getpid()]:
+        del _async_watchtowers[stale_key]
+
+    wt_api = AsyncWatchtower(network=network)
+    wt_api.circuit_breaker = get_watchtower(network).circuit_breaker
+    _async_watchtowers[key] = (loop, wt_api)
+    return wt_api
+
+
+def get_async_watchtower_stats():
+    return {
+        network: dict(
+            **wt_api.stats.get_stats(),
+            circuit_breaker=wt_api.circuit_breaker.state,
+        )
+        for (pid, network), (loop, wt_api) in list(_async_watchtowers.items())
+        if pid == os.getpid()
+    }
@@ -0,0 +1,95 @@
+import json
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from main.apps import LOGGER
+from main.models import FaucetContract, WebhookEvent
+
+from .faucet_balance import record_webhook_balance, request_balance_refresh
+
+
+def get_webhook_dedupe_key(data:dict):
+    address = data.get("address")
+    txid = data.get("txid")
+    index = data.get("index")
+    if txid and index is not None:
+        return f"{address}:{txid}:{index}"
+
+    # payloads without an outpoint are deduped by their content
+    payload_hash = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{address}:{payload_hash}"
+
+
+def store_webhook_event(data:dict):
+    """
+        Saves the payload for process_webhook_events, a payload already received is ignored
+        The endpoint is public, only payloads of a faucet's address are stored
+        Returns False if the address is not a faucet's
+    """
+    address = str(data.get("address") or "")[:75]
+    if not address or not FaucetContract.objects.filter(address=address).exists():
+        return False
+
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            dedupe_key=get_webhook_dedupe_key(data)[:200],
+            address=address,
+            data=data,
+        ),
+    ], ignore_conflicts=True)
+    return True
+
+
+def process_webhook_events(limit:int=None):
+    """
+        Applies unprocessed webhook events in the order received, each faucet's balance
+        refresh is requested once per batch
+        Returns the number of events processed
+    """
+    if limit is None: limit = settings.WEBHOOK_EVENTS_BATCH_SIZE
+
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True)
+                .order_by("id")[:limit]
+        )
+        if not events: return 0
+
+        faucets = FaucetContract.objects.in_bulk(
+            set(event.address for event in events if event.address),
+            field_name="address",
+        )
+
+        updated_faucets = {}
+        for event in events:
+            event.processed_at = timezone.now()
+            faucet = faucets.get(event.address)
+            if not faucet: continue
+
+            try:
+                with transaction.atomic():
+                    record_webhook_balance(faucet, event.data)
+                updated_faucets[faucet.pk] = faucet
+            except Exception as exception:
+                LOGGER.exception(exception)
+                event.error = str(exception)
+
+        WebhookEvent.objects.bulk_update(events, ["processed_at", "error"])
+
+    for faucet in updated_faucets.values():
+        request_balance_refresh(faucet)
+
+    LOGGER.debug(f"Processed webhook events | {len(events)} events | {len(updated_faucets)} faucets")
+    return len(events)
+
+
+def delete_processed_webhook_events():
+    """
+        Processed events are only kept long enough to dedupe replays
+    """
+    cutoff = timezone.now() - timezone.timedelta(seconds=settings.WEBHOOK_EVENTS_RETENTION)
+    return WebhookEvent.objects.filter(processed_at__lt=cutoff).delete()[0]
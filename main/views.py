@@ -1,13 +1,27 @@
+import os
 import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.utils import timezone
-from django.shortcuts import render
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_page
+from django.shortcuts import render, get_object_or_404
 from django.views import View
-from django.http import JsonResponse
+from django.http import HttpResponseNotAllowed, JsonResponse
 
 from main.apps import LOGGER
-from main.models import FaucetClaim, FaucetContract
+from main.models import ClaimJob, ClaimStats, Network
 from main.forms import FaucetForm
-from main.utils.faucet_contract import faucet_claim, update_faucet_balance
+from main.utils.async_claims import async_process_claim_job
+from main.utils.claim_jobs import enqueue_claim_job
+from main.utils.claim_stats import get_claim_stats
+from main.utils.rate_limit import check_claim_rate_limits
+from main.utils.recent_claims import get_recent_claims
+from main.utils.watchtower_api import get_watchtower_stats
+from main.utils.watchtower_api_async import get_async_watchtower_stats
+from main.utils.webhook_events import store_webhook_event
 
 # Create your views here.
 def get_client_ip(request):
@@ -20,7 +34,7 @@ def get_client_ip(request):
 
 class FaucetClaimView(View):
     def get_recent_claims(self):
-        return FaucetClaim.objects.order_by("-created_at")[:10]
+        return get_recent_claims()
 
     def get(self, request, *args, **kwargs):
         form = FaucetForm()
@@ -42,58 +56,175 @@ class FaucetClaimView(View):
         passcode = form.cleaned_data['passcode']
         faucet = form.cleaned_data['faucet']
 
-        if faucet.max_claim_per_ip:
-            one_day_ago = timezone.now() - timezone.timedelta(days=1)
-            recent_claims = faucet.claims.filter(ip=ip, created_at__gte=one_day_ago)
-            recent_claims_count = recent_claims.count()
-            if recent_claims_count > faucet.max_claim_per_ip:
-                form.add_error(None, f"Already claimed {max_claim_per_ip} times in the last 24 hours, come back again later")
-                return render(request, "main/claim.html", ctx)
-
-        success, error_or_txid = faucet_claim(faucet, address, passcode, broadcast=True)
-
-        if not success:
-            form.add_error(None, f"Claim failed: {error_or_txid}")
+        rate_limit_error = check_claim_rate_limits(faucet, ip, address)
+        if rate_limit_error:
+            form.add_error(None, rate_limit_error)
             return render(request, "main/claim.html", ctx)
 
-        faucet_request = FaucetClaim.objects.create(
-            faucet=faucet,
-            network=faucet.network,
-            recipient=address, satoshis=faucet.payout_satoshis,
-            ip=ip,
-            txid=error_or_txid,
-        )
-        faucet.claim_count += 1
-        faucet.save()
-
-        try:
-            LOGGER.info(f"UPDATING BALANCE | {faucet}")
-            update_faucet_balance(faucet)
-        except Exception as exception:
-            LOGGER.exception(exception)
+        job = enqueue_claim_job(faucet, address, passcode, ip=ip)
 
         ctx["form"] = FaucetForm()
-        ctx["success"] = f"Sent {faucet_request.satoshis / 10e8:.8f} BCH to {faucet_request.recipient}"
+        ctx["job"] = job
+        ctx["job_status"] = get_claim_job_status(job)
 
         return render(request, "main/claim.html", ctx)
 
 
+def get_claim_job_status(job:ClaimJob):
+    if job.status == ClaimJob.Status.success:
+        message = f"Sent {job.faucet.payout_satoshis / 10 ** 8:.8f} BCH to {job.recipient}"
+    elif job.status == ClaimJob.Status.failed:
+        message = job.error
+    else:
+        message = f"Claim for {job.recipient} is being processed"
+
+    return dict(
+        id=str(job.uuid),
+        status=job.status,
+        done=job.is_done,
+        txid=job.txid,
+        tx_link=job.tx_link,
+        message=message,
+    )
+
+
+class ClaimJobStatusView(View):
+    def get(self, request, job_id, *args, **kwargs):
+        job = get_object_or_404(ClaimJob.objects.select_related("faucet"), uuid=job_id)
+        return JsonResponse(get_claim_job_status(job))
+
+
+def parse_webhook_data(request):
+    try:
+        json_data = json.loads(request.body)
+    except json.JSONDecodeError as exception:
+        LOGGER.debug(f"Invalid JSON from webhook, attempting POST data instead | {request.body}")
+        json_data = request.POST.dict()
+
+    LOGGER.debug(f"RECEIVED WEBHOOK | {json.dumps(json_data)}")
+    return json_data
+
+
 class WatchtowerWebhookView(View):
+    """
+        Only saves the event, process_webhook_events applies it
+    """
     def post(self, request, *args, **kwargs):
-        try:
-            json_data = json.loads(request.body)
-        except json.JSONDecodeError as exception:
-            LOGGER.debug(f"Invalid JSON from webhook, attempting POST data instead | {request.body}")
-            json_data = request.POST.dict()
-
-        LOGGER.info(f"RECEIVED WEBHOOK | {json.dumps(json_data, indent=2)}")
-
-        address = json_data.get("address")
-        if address:
-            LOGGER.info(f"GOT ADDRESS FROM WEBHOOK | {address}")
-            faucet = FaucetContract.objects.filter(address=address).first()
-            if faucet:
-                LOGGER.info(f"UPDATING BALANCE | {faucet}")
-                update_faucet_balance(faucet)
+        json_data = parse_webhook_data(request)
+        if json_data.get("address"):
+            store_webhook_event(json_data)
 
         return JsonResponse(dict(acknowledged=True))
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class WatchtowerStatsView(View):
+    """
+        Counters of the shared watchtower clients of the process that handled the request,
+        `async_networks` are the clients of the ASGI claims
+    """
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(dict(
+            pid=os.getpid(),
+            networks=get_watchtower_stats(),
+            async_networks=get_async_watchtower_stats(),
+        ))
+
+
+@method_decorator(cache_page(settings.CLAIM_STATS_CACHE_TIMEOUT), name="dispatch")
+class ClaimStatsView(View):
+    """
+        Claims per hour or day from the ClaimStats rollups, never reads FaucetClaim
+        Query params: period (hour or day), since (iso datetime), network, faucet (id)
+    """
+    DEFAULT_RANGES = {
+        ClaimStats.Period.hour: timezone.timedelta(hours=48),
+        ClaimStats.Period.day: timezone.timedelta(days=30),
+    }
+
+    def get(self, request, *args, **kwargs):
+        period = request.GET.get("period", ClaimStats.Period.hour)
+        network = request.GET.get("network") or None
+        faucet_id = request.GET.get("faucet") or None
+        since = request.GET.get("since")
+
+        if period not in ClaimStats.Period.values:
+            return JsonResponse(dict(error=f"period must be one of {ClaimStats.Period.values}"), status=400)
+        if network and network not in Network.values:
+            return JsonResponse(dict(error=f"network must be one of {Network.values}"), status=400)
+        if faucet_id and not faucet_id.isdigit():
+            return JsonResponse(dict(error="faucet must be a faucet id"), status=400)
+
+        if since:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if not since:
+                return JsonResponse(dict(error="since must be an iso datetime"), status=400)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        else:
+            since = timezone.now() - self.DEFAULT_RANGES[period]
+
+        stats = get_claim_stats(period, since=since, network=network, faucet_id=faucet_id)
+        return JsonResponse(dict(
+            period=period,
+            since=since,
+            network=network,
+            faucet=faucet_id and int(faucet_id),
+            claim_count=sum(row["claim_count"] for row in stats),
+            satoshis=sum(row["satoshis"] for row in stats),
+            buckets=stats,
+        ))
+
+
+# ASGI versions of the views above, see config/urls_asgi.py
+# django 3.2 only supports async function based views
+async def async_faucet_claim_view(request, *args, **kwargs):
+    """
+        Unlike FaucetClaimView, the claim is processed within the request
+        since waiting on watchtower doesn't hold a worker
+    """
+    view = FaucetClaimView()
+    if request.method != "POST":
+        return await sync_to_async(view.get)(request)
+
+    ip = get_client_ip(request)
+    form = FaucetForm(request.POST)
+    ctx = dict(form=form, recent=await sync_to_async(view.get_recent_claims)())
+
+    if not await sync_to_async(form.is_valid)():
+        return await sync_to_async(render)(request, "main/claim.html", ctx)
+
+    address = form.cleaned_data['address']
+    passcode = form.cleaned_data['passcode']
+    faucet = form.cleaned_data['faucet']
+
+    rate_limit_error = await sync_to_async(check_claim_rate_limits)(faucet, ip, address)
+    if rate_limit_error:
+        form.add_error(None, rate_limit_error)
+        return await sync_to_async(render)(request, "main/claim.html", ctx)
+
+    job = await sync_to_async(enqueue_claim_job)(faucet, address, passcode, ip=ip, processing=True)
+    job = await async_process_claim_job(job)
+
+    ctx["form"] = FaucetForm()
+    ctx["job"] = job
+    ctx["job_status"] = await sync_to_async(get_claim_job_status)(job)
+
+    return await sync_to_async(render)(request, "main/claim.html", ctx)
+
+
+async def async_watchtower_webhook_view(request, *args, **kwargs):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    json_data = parse_webhook_data(request)
+    if json_data.get("address"):
+        await sync_to_async(store_webhook_event)(json_data)
+
+    return JsonResponse(dict(acknowledged=True))
+
+# csrf_exempt in django 3.2 wraps async views in a sync function
+async_watchtower_webhook_view.csrf_exempt = True